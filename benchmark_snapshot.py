@@ -0,0 +1,109 @@
+"""
+Сравнение времени холодного старта для форматов базы токенов.
+
+Генерирует синтетическую базу на 10k и 100k токенов и замеряет загрузку:
+- JSON с indent=4 (как сейчас пишет solana_contract_tracker)
+- компактный JSON (снапшот журнала token_storage)
+- бинарный снапшот token_snapshot (полная загрузка и ленивое открытие)
+
+Запуск: python benchmark_snapshot.py [количество токенов ...]
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+import token_snapshot
+from token_record import TokenRecord, to_json
+
+DEFAULT_SIZES = (10_000, 100_000)
+
+def make_token(index: int) -> dict:
+    """Создает запись токена, похожую на реальные данные бота."""
+    address = f"{index:08d}" + "".join(random.choices("abcdefghijkmnopqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ123456789", k=36))
+    initial_mcap = random.uniform(5_000, 500_000)
+    current_mcap = initial_mcap * random.uniform(0.2, 20)
+    return {
+        'last_update_time': time.time(),
+        'message_id': random.randint(1, 10**6),
+        'chat_id': -1001234567890,
+        'initial_data': {'time': '12:00:00', 'market_cap': f"${initial_mcap / 1000:.2f}K", 'raw_market_cap': initial_mcap},
+        'token_info': {
+            'ticker': f"TKN{index}",
+            'ticker_address': address,
+            'pair_address': address[::-1],
+            'chain_id': 'solana',
+            'market_cap': f"${current_mcap / 1000:.2f}K",
+            'raw_market_cap': current_mcap,
+            'volume_5m': '$1.20K',
+            'volume_1h': '$15.00K',
+            'token_age': '1 час 5 минут',
+            'dexscreener_link': f"https://dexscreener.com/solana/{address[::-1]}",
+            'axiom_link': f"https://axiom.trade/meme/{address[::-1]}",
+            'websites': [{'label': 'Website', 'url': 'https://example.com'}],
+            'socials': [{'type': 'twitter', 'url': 'https://x.com/example'}],
+        },
+        'last_alert_multiplier': 1,
+        'added_time': time.time() - random.uniform(0, 86400 * 30),
+        'ath_market_cap': current_mcap * 1.1,
+        'ath_time': time.time(),
+        'raw_api_ref': f"{index:064x}",
+    }
+
+def measure(label: str, func, repeat: int = 3) -> float:
+    """Возвращает лучшее время выполнения функции в секундах."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run(size: int, directory: str) -> None:
+    data = {f"query_{index}": make_token(index) for index in range(size)}
+
+    pretty_path = os.path.join(directory, f"pretty_{size}.json")
+    compact_path = os.path.join(directory, f"compact_{size}.json")
+    binary_path = os.path.join(directory, f"binary_{size}.snap")
+
+    with open(pretty_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    with open(compact_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    token_snapshot.dump(binary_path, data, default=to_json)
+
+    def load_json(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    results = [
+        ("JSON indent=4", pretty_path, lambda: load_json(pretty_path)),
+        ("JSON компактный", compact_path, lambda: load_json(compact_path)),
+        ("JSON компактный + TokenRecord", compact_path,
+         lambda: {q: TokenRecord(d) for q, d in load_json(compact_path).items()}),
+        ("Снапшот (полная загрузка)", binary_path, lambda: token_snapshot.read(binary_path)),
+        ("Снапшот + TokenRecord", binary_path,
+         lambda: {q: TokenRecord(d) for q, d in token_snapshot.read(binary_path).items()}),
+        ("Снапшот (ленивое открытие)", binary_path, lambda: token_snapshot.open_lazy(binary_path)),
+        ("Снапшот (только заголовок)", binary_path, lambda: token_snapshot.read_header(binary_path)),
+    ]
+
+    print(f"\n{size} токенов (orjson: {'да' if token_snapshot.orjson else 'нет'}, "
+          f"zstd: {'да' if token_snapshot.zstandard else 'нет'})")
+    print(f"{'Формат':<32}{'Размер, МБ':>12}{'Загрузка, мс':>15}")
+    for label, path, func in results:
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"{label:<32}{size_mb:>12.1f}{measure(label, func) * 1000:>15.1f}")
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    random.seed(42)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            run(size, directory)
+
+if __name__ == '__main__':
+    main()
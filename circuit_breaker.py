@@ -0,0 +1,97 @@
+import time
+import logging
+from typing import Dict, Any
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Состояния предохранителя
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# Сколько ошибок подряд размыкают предохранитель
+FAILURE_THRESHOLD = 5
+
+# Через сколько секунд после размыкания пропускается пробный запрос;
+# после каждой неудачной пробы пауза удваивается до MAX_RESET_TIMEOUT
+RESET_TIMEOUT = 15.0
+MAX_RESET_TIMEOUT = 120.0
+
+class CircuitOpenError(Exception):
+    """Запрос не выполнен: предохранитель разомкнут."""
+
+class CircuitBreaker:
+    """
+    Предохранитель для запросов к API.
+
+    После FAILURE_THRESHOLD ошибок подряд (сеть, таймаут, ответ 5xx) запросы перестают
+    отправляться и сразу завершаются CircuitOpenError. Ответ 429 серию не прерывает
+    и не считается ни ошибкой, ни успехом. Через reset_timeout секунд
+    пропускается один пробный запрос (half-open): успех замыкает предохранитель,
+    ошибка снова размыкает его с удвоенной паузой.
+    """
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+        self.stats: Dict[str, Any] = {'opened': 0, 'rejected': 0}
+
+    @property
+    def closed(self) -> bool:
+        return self.state == STATE_CLOSED
+
+    def allow(self) -> bool:
+        """Проверяет, можно ли отправить запрос. В half-open пропускает один пробный запрос."""
+        if self.state == STATE_CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == STATE_OPEN and now - self._opened_at >= self.reset_timeout:
+            self.state = STATE_HALF_OPEN
+            self._probe_started = 0.0
+            logger.info("Предохранитель API: пробный запрос")
+        # Пробный запрос, который не завершился за reset_timeout (например, был отменен), заменяется новым
+        if self.state == STATE_HALF_OPEN and now - self._probe_started >= self.reset_timeout:
+            self._probe_started = now
+            return True
+        self.stats['rejected'] += 1
+        return False
+
+    def record_success(self) -> None:
+        """Учитывает успешный запрос."""
+        if self.state != STATE_CLOSED:
+            logger.info("Предохранитель API замкнут: запросы возобновлены")
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.reset_timeout = self.base_reset_timeout
+
+    def record_response(self, status_code: int) -> None:
+        """
+        Учитывает ответ API по коду: 5xx - ошибка, 429 не меняет счетчик
+        (API отклоняет запросы из-за лимита, а не из-за сбоя), остальные - успех.
+        """
+        if status_code >= 500:
+            self.record_failure()
+        elif status_code != 429:
+            self.record_success()
+
+    def record_failure(self) -> None:
+        """Учитывает ошибку запроса и размыкает предохранитель при необходимости."""
+        self.failures += 1
+        if self.state == STATE_HALF_OPEN:
+            self.reset_timeout = min(MAX_RESET_TIMEOUT, self.reset_timeout * 2)
+            self._open()
+        elif self.state == STATE_CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self.stats['opened'] += 1
+        logger.warning(f"Предохранитель API разомкнут после {self.failures} ошибок подряд, "
+                       f"пауза {self.reset_timeout:g} сек.")
@@ -1,3 +1,4 @@
+import os
 import logging
 from typing import Final
 
@@ -13,7 +14,14 @@ logger = logging.getLogger(__name__)
 TELEGRAM_TOKEN: Final = "8147051772:AAE5LijuMcdPNazVmkvQmtGPf0OOdi4xZW0"
 
 # API URLs
-DEXSCREENER_API_URL: Final = "https://api.dexscreener.com/latest/dex/search"
+# Адрес API DexScreener можно заменить переменной окружения DEXSCREENER_BASE_URL,
+# например на локальный fake_dexscreener.py для нагрузочного тестирования
+DEXSCREENER_BASE_URL: Final = os.environ.get('DEXSCREENER_BASE_URL', "https://api.dexscreener.com").rstrip('/')
+DEXSCREENER_API_URL: Final = f"{DEXSCREENER_BASE_URL}/latest/dex/search"
+
+# Ограничение запросов к DexScreener (общее для всех запросов процесса)
+API_REQUEST_LIMIT: Final = 60  # Максимальное число запросов в минуту
+API_COOLDOWN_TIME: Final = 70  # Пауза после ответа 429 без Retry-After (в секундах)
 
 # Данные для Telegram API
 API_ID: Final = 25308063
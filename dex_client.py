@@ -0,0 +1,355 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, Optional, List, Iterable
+
+import httpx
+
+# HTTP/2 включается, только если установлен пакет h2 (pip install httpx[http2])
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+from config import DEXSCREENER_BASE_URL, DEXSCREENER_API_URL, API_REQUEST_LIMIT, API_COOLDOWN_TIME
+from rate_limiter import RateLimiter, LANE_INTERACTIVE, LANE_BACKGROUND
+from response_cache import ResponseCache, cache_key
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Эндпоинт пар токенов (адрес API задается в config.DEXSCREENER_BASE_URL)
+DEXSCREENER_TOKENS_URL = f"{DEXSCREENER_BASE_URL}/latest/dex/tokens"
+DEXSCREENER_PAIRS_URL = f"{DEXSCREENER_BASE_URL}/latest/dex/pairs"
+
+# Таймауты по умолчанию (в секундах): отдельно на установку соединения и на весь запрос
+DEFAULT_TIMEOUT = 10.0
+CONNECT_TIMEOUT = 5.0
+
+# Пул соединений: keep-alive соединения переиспользуются между запросами всех обработчиков
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 30.0
+
+# Максимум адресов в одном запросе /latest/dex/tokens/{a,b,...} и /latest/dex/pairs/{сеть}/{a,b,...}
+MAX_ADDRESSES_PER_REQUEST = 30
+
+# Сколько пакетных запросов выполняется одновременно
+BATCH_CONCURRENCY = 4
+
+# Ошибки сети, после которых запрос имеет смысл повторить
+RETRYABLE_ERRORS = (httpx.TimeoutException, httpx.NetworkError)
+
+# Хеджирование интерактивных запросов: если ответа нет дольше p95 задержки последних
+# LATENCY_SAMPLES запросов, отправляется дубликат и используется первый ответ.
+# Пока замеров меньше HEDGE_MIN_SAMPLES, ждем DEFAULT_HEDGE_DELAY
+LATENCY_SAMPLES = 200
+HEDGE_MIN_SAMPLES = 20
+DEFAULT_HEDGE_DELAY = 1.5
+MIN_HEDGE_DELAY = 0.2
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Возвращает паузу из заголовка Retry-After (в секундах), если он есть."""
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return None
+
+def base_pairs(pairs: List[Dict[str, Any]], address: str) -> List[Dict[str, Any]]:
+    """Оставляет пары, в которых токен с указанным адресом - базовый."""
+    normalized = cache_key('tokens', address)
+    return [pair for pair in pairs
+            if cache_key('tokens', (pair.get('baseToken') or {}).get('address') or '') == normalized]
+
+class DexClient:
+    """
+    Общий асинхронный клиент DexScreener.
+
+    Все обращения к API идут через один httpx.AsyncClient с пулом keep-alive
+    соединений (и HTTP/2, если доступен), поэтому запросы не блокируют цикл
+    событий бота и не открывают новое соединение на каждый вызов.
+    Клиент создается при первом запросе и закрывается через aclose() при остановке.
+    Каждый запрос сначала получает токен у общего ограничителя в своей очереди
+    (LANE_INTERACTIVE или LANE_BACKGROUND). Ответы по токенам кэшируются на короткое
+    время, а одновременные запросы одного токена объединяются в один (ResponseCache).
+    При серии ошибок запросы блокирует предохранитель (CircuitBreaker), а медленные
+    интерактивные запросы хеджируются дубликатом.
+    """
+
+    def __init__(self, limiter: RateLimiter, cache: ResponseCache, breaker: CircuitBreaker,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.limiter = limiter
+        self.cache = cache
+        self.breaker = breaker
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.stats = {'hedged': 0, 'hedge_won': 0}
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=h2 is not None,
+                timeout=httpx.Timeout(self.timeout, connect=CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+                headers={'Accept': 'application/json'},
+            )
+            logger.info(f"Создан HTTP клиент DexScreener (HTTP/2: {'да' if h2 is not None else 'нет'})")
+        return self._client
+
+    async def _send(self, url: str, params: Optional[Dict[str, Any]],
+                    timeout: Optional[float]) -> httpx.Response:
+        """Отправляет запрос и запоминает его задержку."""
+        request_timeout = httpx.Timeout(timeout, connect=min(timeout, CONNECT_TIMEOUT)) if timeout else httpx.USE_CLIENT_DEFAULT
+        started = time.monotonic()
+        response = await self._get_client().get(url, params=params, timeout=request_timeout)
+        self._latencies.append(time.monotonic() - started)
+        return response
+
+    def hedge_delay(self) -> float:
+        """Задержка перед отправкой дубликата: p95 задержки последних запросов."""
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        latencies = sorted(self._latencies)
+        return max(MIN_HEDGE_DELAY, latencies[int(len(latencies) * 0.95) - 1])
+
+    async def _hedged_send(self, url: str, params: Optional[Dict[str, Any]],
+                           timeout: Optional[float]) -> httpx.Response:
+        """
+        Отправляет запрос и, если ответа нет дольше hedge_delay(), его дубликат.
+        Дубликат отправляется, только если предохранитель замкнут и у ограничителя
+        есть свободный токен, поэтому во время сбоев и при нехватке лимита хеджирования нет.
+        """
+        tasks = {asyncio.ensure_future(self._send(url, params, timeout))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if not done and self.breaker.closed and self.limiter.try_acquire(LANE_INTERACTIVE):
+                self.stats['hedged'] += 1
+                hedge = asyncio.ensure_future(self._send(url, params, timeout))
+                tasks.add(hedge)
+            else:
+                hedge = None
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.stats['hedge_won'] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+                  timeout: Optional[float] = None, lane: str = LANE_INTERACTIVE) -> httpx.Response:
+        """
+        Выполняет GET запрос. Возвращает ответ (status_code, json() - как у requests).
+        Ошибки сети пробрасываются (см. RETRYABLE_ERRORS); при разомкнутом
+        предохранителе запрос не отправляется и возникает CircuitOpenError.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Запросы к API приостановлены после серии ошибок: {url}")
+        await self.limiter.acquire(lane)
+        try:
+            if lane == LANE_INTERACTIVE:
+                response = await self._hedged_send(url, params, timeout)
+            else:
+                response = await self._send(url, params, timeout)
+        except RETRYABLE_ERRORS:
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_response(response.status_code)
+        if response.status_code == 429:
+            self.limiter.on_rate_limited(_retry_after(response))
+        else:
+            self.limiter.on_success()
+        return response
+
+    async def search(self, query: str, timeout: Optional[float] = None,
+                     lane: str = LANE_INTERACTIVE) -> httpx.Response:
+        """Поиск пар по запросу (адрес или тикер): /latest/dex/search?q=..."""
+        return await self.cache.fetch(
+            cache_key('search', query),
+            lambda: self.get(DEXSCREENER_API_URL, params={'q': query}, timeout=timeout, lane=lane)
+        )
+
+    async def token_pairs(self, address: str, timeout: Optional[float] = None,
+                          lane: str = LANE_INTERACTIVE) -> httpx.Response:
+        """Все пары токена по адресу контракта: /latest/dex/tokens/{address}"""
+        return await self.cache.fetch(
+            cache_key('tokens', address),
+            lambda: self.get(f"{DEXSCREENER_TOKENS_URL}/{address}", timeout=timeout, lane=lane)
+        )
+
+    async def _fetch_batch(self, addresses: List[str], reserved: Dict[str, asyncio.Future],
+                           semaphore: asyncio.Semaphore, timeout: Optional[float],
+                           lane: str) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Запрашивает пары одного пакета адресов. При ошибке возвращает пустой словарь.
+        Зарезервированные в кэше ключи адресов завершаются в любом случае.
+        """
+        result = {}
+        try:
+            async with semaphore:
+                try:
+                    response = await self.get(f"{DEXSCREENER_TOKENS_URL}/{','.join(addresses)}", timeout=timeout, lane=lane)
+                except RETRYABLE_ERRORS as e:
+                    logger.warning(f"Таймаут при пакетном запросе {len(addresses)} токенов к API: {e}")
+                    return result
+                except CircuitOpenError:
+                    return result
+            if response.status_code != 200:
+                logger.warning(f"API вернуло ошибку {response.status_code} для пакета из {len(addresses)} токенов")
+                return result
+
+            # Раскладываем пары по базовому токену; адреса без пар получают пустой список
+            pairs = response.json().get('pairs') or []
+            for address in addresses:
+                result[address] = base_pairs(pairs, address)
+            return result
+        finally:
+            # Ответ по каждому адресу кэшируется как ответ /tokens/{address}
+            for address, future in reserved.items():
+                if address in result:
+                    self.cache.resolve(future, httpx.Response(200, json={'pairs': result[address]}))
+                else:
+                    self.cache.resolve(future, None)
+
+    async def tokens_pairs_batch(self, addresses: Iterable[str], timeout: Optional[float] = None,
+                                 lane: str = LANE_BACKGROUND) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Получает пары нескольких токенов запросами по MAX_ADDRESSES_PER_REQUEST адресов.
+        Адреса, ответ по которым есть в кэше или уже запрашивается, в пакеты не попадают.
+        Пакеты запрашиваются параллельно, не больше BATCH_CONCURRENCY одновременно.
+        Возвращает словарь {адрес: пары, в которых токен базовый}; адресов из
+        неудавшихся пакетов в словаре нет.
+        """
+        unique = list(dict.fromkeys(addresses))
+        if not unique:
+            return {}
+
+        pairs_by_address = {}
+        pending = {}
+        missing = []
+        for address in unique:
+            key = cache_key('tokens', address)
+            cached = self.cache.get(key)
+            if cached is not None:
+                pairs_by_address[address] = base_pairs(cached.json().get('pairs') or [], address)
+            elif self.cache.pending(key) is not None:
+                pending[address] = self.cache.pending(key)
+            else:
+                missing.append(address)
+
+        # Резервируем ключи до первого ожидания, чтобы одновременные запросы присоединялись к пакетам
+        reserved = self.cache.reserve(cache_key('tokens', address) for address in missing)
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        batches = [missing[i:i + MAX_ADDRESSES_PER_REQUEST] for i in range(0, len(missing), MAX_ADDRESSES_PER_REQUEST)]
+        try:
+            results = await asyncio.gather(*(
+                self._fetch_batch(batch, {address: reserved[cache_key('tokens', address)] for address in batch},
+                                  semaphore, timeout, lane)
+                for batch in batches
+            ))
+        finally:
+            # Пакет, отмененный до начала выполнения (например, по сроку обхода), не завершает
+            # свои ключи сам - завершаем их здесь, чтобы ожидающие запросы не зависли
+            for future in reserved.values():
+                self.cache.resolve(future, None)
+        for result in results:
+            pairs_by_address.update(result)
+
+        # Дожидаемся запросов, которые уже выполнялись до пакета
+        responses = await asyncio.gather(*(asyncio.shield(future) for future in pending.values()), return_exceptions=True)
+        for address, response in zip(pending, responses):
+            if isinstance(response, httpx.Response) and response.status_code == 200:
+                pairs_by_address[address] = base_pairs(response.json().get('pairs') or [], address)
+
+        logger.info(f"Пакетный запрос к API: {len(unique)} токенов, {len(batches)} запросов, "
+                    f"получены данные для {len(pairs_by_address)}")
+        return pairs_by_address
+
+    async def _fetch_pairs_chunk(self, chain_id: str, pair_addresses: List[str], semaphore: asyncio.Semaphore,
+                                 timeout: Optional[float], lane: str) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Запрашивает один пакет пар. При ошибке возвращает пустой словарь."""
+        async with semaphore:
+            try:
+                response = await self.get(f"{DEXSCREENER_PAIRS_URL}/{chain_id}/{','.join(pair_addresses)}",
+                                          timeout=timeout, lane=lane)
+            except RETRYABLE_ERRORS as e:
+                logger.warning(f"Таймаут при пакетном запросе {len(pair_addresses)} пар к API: {e}")
+                return {}
+            except CircuitOpenError:
+                return {}
+        if response.status_code != 200:
+            logger.warning(f"API вернуло ошибку {response.status_code} для пакета из {len(pair_addresses)} пар")
+            return {}
+
+        # Пары, которых нет в ответе, получают None
+        result = dict.fromkeys(pair_addresses)
+        for pair in response.json().get('pairs') or []:
+            if pair.get('pairAddress') in result:
+                result[pair['pairAddress']] = pair
+        return result
+
+    async def pairs_batch(self, chain_id: str, pair_addresses: Iterable[str], timeout: Optional[float] = None,
+                          lane: str = LANE_BACKGROUND) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Получает данные пар одной сети запросами /latest/dex/pairs/{сеть}/{a,b,...}
+        по MAX_ADDRESSES_PER_REQUEST пар. Ответ по паре намного меньше ответа поиска.
+        Возвращает словарь {адрес пары: пара или None, если API ее не вернуло};
+        пар из неудавшихся пакетов в словаре нет.
+        """
+        unique = list(dict.fromkeys(pair_addresses))
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        chunks = [unique[i:i + MAX_ADDRESSES_PER_REQUEST] for i in range(0, len(unique), MAX_ADDRESSES_PER_REQUEST)]
+        results = await asyncio.gather(*(
+            self._fetch_pairs_chunk(chain_id, chunk, semaphore, timeout, lane) for chunk in chunks
+        ))
+        pairs = {}
+        for result in results:
+            pairs.update(result)
+        return pairs
+
+    async def aclose(self) -> None:
+        """Закрывает пул соединений."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("HTTP клиент DexScreener закрыт")
+        self._client = None
+
+def pair_txns_24h(pair: Dict[str, Any]) -> int:
+    """Количество транзакций пары (покупки + продажи) за 24 часа."""
+    h24 = (pair.get('txns') or {}).get('h24')
+    if not isinstance(h24, dict):
+        return 0
+    return (h24.get('buys') or 0) + (h24.get('sells') or 0)
+
+def primary_pair(pairs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Выбирает основную пару токена так же, как find_dexes_info в test_bot4:
+    пару с наибольшим числом транзакций за 24 часа, а если транзакций нет - первую.
+    """
+    best = max(pairs, key=pair_txns_24h)
+    return best if pair_txns_24h(best) > 0 else pairs[0]
+
+# Общие ограничитель, кэш, предохранитель и клиент процесса
+limiter = RateLimiter(API_REQUEST_LIMIT, API_COOLDOWN_TIME)
+cache = ResponseCache()
+breaker = CircuitBreaker()
+client = DexClient(limiter, cache, breaker)
+
+async def aclose() -> None:
+    """Закрывает общий клиент (вызывается при остановке бота)."""
+    await client.aclose()
@@ -0,0 +1,354 @@
+"""
+Локальная замена API DexScreener для нагрузочного и регрессионного тестирования.
+
+Отдает пары токенов на эндпоинтах /latest/dex/search?q=..., /latest/dex/tokens/{a,b,...}
+и /latest/dex/pairs/{сеть}/{a,b,...}.
+Маркет кап (fdv) каждого токена меняется по сценарию - кусочно-линейной траектории
+множителей от начального fdv во времени с момента запуска сервера. Можно добавить
+задержку ответа, ответы 429 сверх лимита запросов, ошибки 5xx и зависшие запросы.
+В сценарии "migrate" токен сначала торгуется только на pump.fun, а с середины сценария
+ликвидность и торговля переезжают в новую пару Raydium.
+
+Служебные эндпоинты:
+- /__tokens - адреса токенов с начальным и текущим fdv и сценарием
+- /__stats  - счетчики запросов и внесенных сбоев
+
+Запуск:
+    python fake_dexscreener.py --tokens 300 --latency 150 --rate-limit 300
+    DEXSCREENER_BASE_URL=http://127.0.0.1:8765 python test_bot4.py
+
+Файл сценариев (--script) - JSON {адрес: {"fdv": начальный fdv, "symbol": тикер,
+"trajectory": [[секунды, множитель], ...]}}; файл фикстур (--fixtures) - JSON с парами
+в формате ответа API ({"pairs": [...]}), fdv которых затем меняется по сценарию "flat".
+"""
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Tuple, Optional
+from urllib.parse import urlparse, parse_qs, unquote
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Максимум адресов в запросе /latest/dex/tokens и /latest/dex/pairs (как у настоящего API)
+MAX_ADDRESSES_PER_REQUEST = 30
+
+# Сколько длится "зависший" запрос (больше таймаутов клиента бота)
+HANG_SECONDS = 30.0
+
+# Сценарии синтетических токенов: траектории множителей fdv [(секунды, множитель), ...]
+# Длительность сценария задается параметром --duration
+TRAJECTORIES = {
+    'flat': lambda duration: [(0, 1.0)],
+    'pump': lambda duration: [(0, 1.0), (duration, random.choice((2.5, 3.5, 5.5, 10.5)))],
+    'dump': lambda duration: [(0, 1.0), (duration, 0.2)],
+    'spike': lambda duration: [(0, 1.0), (duration / 2, 3.5), (duration, 1.2)],
+    'steps': lambda duration: [(0, 1.0), (duration / 3, 1.0), (duration / 3 + 1, 2.2),
+                               (2 * duration / 3, 2.2), (2 * duration / 3 + 1, 4.2)],
+    'migrate': lambda duration: [(0, 1.0), (duration / 2, 2.5), (duration, 3.5)],
+}
+
+BASE58 = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+def interpolate(trajectory: List[Tuple[float, float]], elapsed: float) -> float:
+    """Множитель fdv в момент elapsed по кусочно-линейной траектории."""
+    if elapsed <= trajectory[0][0]:
+        return trajectory[0][1]
+    for (t0, m0), (t1, m1) in zip(trajectory, trajectory[1:]):
+        if elapsed <= t1:
+            return m0 + (m1 - m0) * (elapsed - t0) / (t1 - t0) if t1 > t0 else m1
+    return trajectory[-1][1]
+
+def make_pairs(address: str, symbol: str, fdv: float, index: int) -> List[Dict[str, Any]]:
+    """Создает 1-3 пары токена в формате ответа API (основная пара - с наибольшей ликвидностью)."""
+    created = int((time.time() - random.uniform(60, 30 * 86400)) * 1000)
+    dexes = [('raydium', 1.0), ('pumpfun', 0.3), ('orca', 0.1)][:1 + index % 3]
+    pairs = []
+    for dex_id, share in dexes:
+        pair_address = "".join(random.choices(BASE58, k=44))
+        buys, sells = int(2000 * share) + random.randint(0, 50), int(1500 * share) + random.randint(0, 50)
+        pairs.append({
+            'chainId': 'solana',
+            'dexId': dex_id,
+            'url': f"https://dexscreener.com/solana/{pair_address}",
+            'pairAddress': pair_address,
+            'baseToken': {'address': address, 'name': symbol.title(), 'symbol': symbol},
+            'quoteToken': {'address': 'So11111111111111111111111111111111111111112', 'name': 'Wrapped SOL', 'symbol': 'SOL'},
+            'txns': {period: {'buys': buys // k, 'sells': sells // k} for period, k in (('m5', 288), ('h1', 24), ('h24', 1))},
+            'volume': {'m5': 0.0, 'h1': 0.0, 'h24': 0.0},
+            'liquidity': {'usd': fdv * 0.1 * share},
+            'fdv': fdv,
+            'marketCap': fdv,
+            'pairCreatedAt': created,
+            'info': {'websites': [], 'socials': []},
+            'boosts': {'active': 0},
+        })
+    return pairs
+
+class FakeMarket:
+    """Набор токенов с траекториями fdv и внесение сбоев."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_limit: int = 0,
+                 error_rate: float = 0.0, hang_rate: float = 0.0, noise: float = 0.0):
+        self.started = time.time()
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.noise = noise
+        self.tokens: Dict[str, Dict[str, Any]] = {}
+        self._requests = deque()
+        self._lock = threading.Lock()
+        self.pair_index: Dict[str, str] = {}
+        self.stats = {'requests': 0, 'search': 0, 'tokens': 0, 'addresses': 0, 'pairs': 0,
+                      'rate_limited': 0, 'errors': 0, 'hangs': 0}
+
+    def add_token(self, address: str, symbol: str, fdv: float, trajectory: List[Tuple[float, float]],
+                  pairs: Optional[List[Dict[str, Any]]] = None) -> None:
+        self.tokens[address] = {
+            'symbol': symbol,
+            'fdv': fdv,
+            'trajectory': [tuple(point) for point in trajectory],
+            'pairs': pairs or make_pairs(address, symbol, fdv, len(self.tokens)),
+        }
+        for pair in self.tokens[address]['pairs']:
+            self.pair_index[pair['pairAddress']] = address
+
+    def generate(self, count: int, duration: float) -> None:
+        """Создает синтетические токены со случайными сценариями."""
+        kinds = list(TRAJECTORIES)
+        for index in range(count):
+            address = "".join(random.choices(BASE58, k=40)) + "pump"
+            kind = kinds[index % len(kinds)]
+            pairs = None
+            if kind == 'migrate':
+                # Пара pump.fun и пара Raydium, которая появится в середине сценария
+                pairs = make_pairs(address, f"TKN{index}", 0, 1)
+                pairs.reverse()
+            self.add_token(address, f"TKN{index}", random.uniform(5_000, 500_000), TRAJECTORIES[kind](duration), pairs)
+            self.tokens[address]['scenario'] = kind
+            if kind == 'migrate':
+                self.tokens[address]['migrate_at'] = duration / 2
+
+    def current_fdv(self, address: str) -> float:
+        token = self.tokens[address]
+        fdv = token['fdv'] * interpolate(token['trajectory'], time.time() - self.started)
+        if self.noise:
+            fdv *= 1 + random.uniform(-self.noise, self.noise)
+        return round(fdv, 2)
+
+    def pairs(self, address: str) -> List[Dict[str, Any]]:
+        """Пары токена с текущим fdv."""
+        token = self.tokens[address]
+        fdv = self.current_fdv(address)
+        migrate_at = token.get('migrate_at')
+        migrated = migrate_at is not None and time.time() - self.started >= migrate_at
+        result = []
+        for pair in token['pairs']:
+            pair = dict(pair, fdv=fdv, marketCap=fdv, priceUsd=f"{fdv / 1e9:.10f}")
+            pair['volume'] = {'m5': round(fdv * 0.01, 2), 'h1': round(fdv * 0.1, 2), 'h24': round(fdv, 2)}
+            if migrate_at is not None:
+                if pair['dexId'] != 'pumpfun':
+                    if not migrated:
+                        # Пара Raydium еще не создана
+                        continue
+                    pair['liquidity'] = {'usd': round(fdv * 0.1, 2)}
+                elif migrated:
+                    # После переезда в пару pump.fun нет ни ликвидности, ни торговли
+                    pair['liquidity'] = {'usd': 0.0}
+                    pair['txns'] = {period: {'buys': 0, 'sells': 0} for period in ('m5', 'h1', 'h24')}
+                    pair['volume'] = {'m5': 0.0, 'h1': 0.0, 'h24': 0.0}
+                else:
+                    pair['liquidity'] = {'usd': round(fdv * 0.03, 2)}
+            result.append(pair)
+        return result
+
+    def pairs_by_address(self, pair_addresses: List[str]) -> List[Dict[str, Any]]:
+        """Текущие данные пар по их адресам (несуществующие пары пропускаются)."""
+        result = []
+        for pair_address in pair_addresses:
+            address = self.pair_index.get(pair_address)
+            if address is None:
+                continue
+            result.extend(pair for pair in self.pairs(address) if pair['pairAddress'] == pair_address)
+        return result
+
+    def search(self, query: str) -> List[Dict[str, Any]]:
+        query = query.strip()
+        if query in self.tokens:
+            return self.pairs(query)
+        symbol = query.lstrip('$').upper()
+        for address, token in self.tokens.items():
+            if token['symbol'].upper() == symbol:
+                return self.pairs(address)
+        return []
+
+    def fault(self) -> Optional[str]:
+        """Решает, какой сбой внести в текущий запрос: '429', '5xx', 'hang' или None."""
+        with self._lock:
+            now = time.monotonic()
+            self.stats['requests'] += 1
+            if self.rate_limit:
+                while self._requests and now - self._requests[0] > 60:
+                    self._requests.popleft()
+                if len(self._requests) >= self.rate_limit:
+                    self.stats['rate_limited'] += 1
+                    return '429'
+                self._requests.append(now)
+            roll = random.random()
+            if roll < self.hang_rate:
+                self.stats['hangs'] += 1
+                return 'hang'
+            if roll < self.hang_rate + self.error_rate:
+                self.stats['errors'] += 1
+                return '5xx'
+        return None
+
+    def describe(self) -> Dict[str, Any]:
+        elapsed = time.time() - self.started
+        return {
+            address: {
+                'symbol': token['symbol'],
+                'scenario': token.get('scenario', 'script'),
+                'initial_fdv': token['fdv'],
+                'current_fdv': round(token['fdv'] * interpolate(token['trajectory'], elapsed), 2),
+                'trajectory': token['trajectory'],
+            }
+            for address, token in self.tokens.items()
+        }
+
+class FakeDexScreenerHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов, имитирующий API DexScreener."""
+
+    market: FakeMarket = None
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        market = self.market
+        url = urlparse(self.path)
+        path = url.path.rstrip('/')
+
+        if path == '/__stats':
+            return self._send_json(200, dict(market.stats, uptime=round(time.time() - market.started, 1)))
+        if path == '/__tokens':
+            return self._send_json(200, market.describe())
+
+        fault = market.fault()
+        if fault == '429':
+            return self._send_json(429, {'error': 'rate limited'}, {'Retry-After': '1'})
+        delay = market.latency + random.uniform(0, market.jitter)
+        time.sleep(HANG_SECONDS if fault == 'hang' else delay)
+        if fault == '5xx':
+            return self._send_json(503, {'error': 'service unavailable'})
+
+        if path == '/latest/dex/search':
+            market.stats['search'] += 1
+            query = parse_qs(url.query).get('q', [''])[0]
+            return self._send_json(200, {'schemaVersion': '1.0.0', 'pairs': market.search(query)})
+
+        if path.startswith('/latest/dex/tokens/'):
+            market.stats['tokens'] += 1
+            addresses = [a for a in unquote(path[len('/latest/dex/tokens/'):]).split(',') if a]
+            market.stats['addresses'] += len(addresses)
+            if len(addresses) > MAX_ADDRESSES_PER_REQUEST:
+                return self._send_json(400, {'error': f'too many addresses (max {MAX_ADDRESSES_PER_REQUEST})'})
+            pairs = []
+            for address in addresses:
+                if address in market.tokens:
+                    pairs.extend(market.pairs(address))
+            return self._send_json(200, {'schemaVersion': '1.0.0', 'pairs': pairs or None})
+
+        if path.startswith('/latest/dex/pairs/'):
+            market.stats['pairs'] += 1
+            chain_id, _, rest = unquote(path[len('/latest/dex/pairs/'):]).partition('/')
+            pair_addresses = [a for a in rest.split(',') if a]
+            if len(pair_addresses) > MAX_ADDRESSES_PER_REQUEST:
+                return self._send_json(400, {'error': f'too many pairs (max {MAX_ADDRESSES_PER_REQUEST})'})
+            pairs = [pair for pair in market.pairs_by_address(pair_addresses) if pair['chainId'] == chain_id]
+            return self._send_json(200, {'schemaVersion': '1.0.0', 'pairs': pairs or None})
+
+        self._send_json(404, {'error': 'not found'})
+
+def load_script(market: FakeMarket, path: str) -> None:
+    """Загружает токены со сценариями из JSON файла."""
+    with open(path, 'r', encoding='utf-8') as f:
+        script = json.load(f)
+    for address, token in script.items():
+        market.add_token(address, token.get('symbol', address[:4].upper()), float(token['fdv']),
+                         token.get('trajectory') or [(0, 1.0)])
+
+def load_fixtures(market: FakeMarket, path: str) -> None:
+    """Загружает токены из сохраненного ответа API ({"pairs": [...]})."""
+    with open(path, 'r', encoding='utf-8') as f:
+        pairs = json.load(f).get('pairs') or []
+    by_address: Dict[str, List[Dict[str, Any]]] = {}
+    for pair in pairs:
+        by_address.setdefault(pair['baseToken']['address'], []).append(pair)
+    for address, token_pairs in by_address.items():
+        market.add_token(address, token_pairs[0]['baseToken'].get('symbol', ''),
+                         float(token_pairs[0].get('fdv') or 0), [(0, 1.0)], token_pairs)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Локальная замена API DexScreener для тестирования")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--tokens', type=int, default=100, help="количество синтетических токенов")
+    parser.add_argument('--duration', type=float, default=600, help="длительность сценариев синтетических токенов, сек.")
+    parser.add_argument('--script', help="JSON файл со сценариями токенов")
+    parser.add_argument('--fixtures', help="JSON файл с парами в формате ответа API")
+    parser.add_argument('--latency', type=float, default=0, help="задержка ответа, мс")
+    parser.add_argument('--jitter', type=float, default=0, help="случайная добавка к задержке, мс")
+    parser.add_argument('--rate-limit', type=int, default=0, help="лимит запросов в минуту (сверх - 429), 0 - без лимита")
+    parser.add_argument('--error-rate', type=float, default=0, help="доля ответов 503")
+    parser.add_argument('--hang-rate', type=float, default=0, help=f"доля запросов, зависающих на {HANG_SECONDS:g} сек.")
+    parser.add_argument('--noise', type=float, default=0, help="случайное отклонение fdv (доля)")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    random.seed(args.seed)
+
+    market = FakeMarket(args.latency, args.jitter, args.rate_limit, args.error_rate, args.hang_rate, args.noise)
+    if args.script:
+        load_script(market, args.script)
+    if args.fixtures:
+        load_fixtures(market, args.fixtures)
+    if not args.script and not args.fixtures:
+        market.generate(args.tokens, args.duration)
+
+    FakeDexScreenerHandler.market = market
+    server = ThreadingHTTPServer((args.host, args.port), FakeDexScreenerHandler)
+    server.daemon_threads = True
+    logger.info(f"Тестовый DexScreener запущен на http://{args.host}:{args.port} ({len(market.tokens)} токенов). "
+                f"Для бота: DEXSCREENER_BASE_URL=http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Статистика запросов: {market.stats}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import time
+import heapq
+import logging
+from typing import Dict, Any, Optional, List, Tuple, Mapping
+
+import token_history
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Границы интервала опроса токена (в секундах)
+MIN_POLL_INTERVAL = 10
+MAX_POLL_INTERVAL = 600
+
+# Базовый интервал по возрасту токена: (возраст до, интервал) в секундах
+# Первый час - каждые 10 секунд, до 6 часов - 30 секунд, до суток - минута, до 3 суток - 3 минуты
+AGE_INTERVALS = (
+    (3600, 10),
+    (6 * 3600, 30),
+    (24 * 3600, 60),
+    (3 * 24 * 3600, 180),
+)
+
+# Волатильность (ст. отклонение лог. изменений за VOLATILITY_WINDOW), при которой интервал сокращается вдвое
+VOLATILITY_WINDOW = 900
+VOLATILITY_SCALE = 0.05
+
+# Рост до следующего множителя (в долях), начиная с которого близость к алерту не ускоряет опрос,
+# и минимальный коэффициент для токенов у самого порога
+DISTANCE_SCALE = 0.5
+MIN_DISTANCE_FACTOR = 0.25
+
+# Максимум токенов, опрашиваемых за один запуск мониторинга
+MAX_DUE_PER_TICK = 300
+
+class PollScheduler:
+    """
+    Планировщик опроса токенов.
+
+    Каждому токену назначается время следующего опроса: молодые, волатильные и
+    близкие к следующему множителю токены опрашиваются чаще, старые и спокойные - реже.
+    Токены хранятся в min-heap по времени опроса, поэтому выбор готовых к опросу
+    не требует перебора всех токенов. Устаревшие записи кучи пропускаются при извлечении.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+        self._next: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._next)
+
+    def _push(self, query: str, when: float) -> None:
+        self._next[query] = when
+        heapq.heappush(self._heap, (when, query))
+
+    def sync(self, tokens: Mapping[str, Dict[str, Any]], now: Optional[float] = None) -> None:
+        """Добавляет новые токены (к опросу сразу) и забывает токены, которых больше нет."""
+        now = now or time.time()
+        for query in tokens:
+            if query not in self._next:
+                self._push(query, now)
+        for query in [query for query in self._next if query not in tokens]:
+            del self._next[query]
+        # Пересобираем кучу, если в ней накопилось много устаревших записей
+        if len(self._heap) > 2 * len(self._next) + 64:
+            self._heap = [(when, query) for query, when in self._next.items()]
+            heapq.heapify(self._heap)
+
+    def pop_due(self, now: Optional[float] = None, limit: int = MAX_DUE_PER_TICK) -> List[str]:
+        """Извлекает токены, время опроса которых наступило (сначала самые просроченные)."""
+        now = now or time.time()
+        due = []
+        while self._heap and len(due) < limit and self._heap[0][0] <= now:
+            when, query = heapq.heappop(self._heap)
+            if self._next.get(query) == when:
+                del self._next[query]
+                due.append(query)
+        return due
+
+    def reschedule(self, query: str, token_data: Dict[str, Any], now: Optional[float] = None) -> float:
+        """Назначает токену время следующего опроса. Возвращает интервал в секундах."""
+        now = now or time.time()
+        interval = poll_interval(query, token_data, now)
+        self._push(query, now + interval)
+        return interval
+
+def poll_interval(query: str, token_data: Dict[str, Any], now: Optional[float] = None) -> float:
+    """
+    Вычисляет интервал опроса токена: базовый интервал по возрасту, уменьшенный
+    пропорционально волатильности и близости маркет капа к следующему множителю.
+    """
+    now = now or time.time()
+
+    age = now - (token_data.get('added_time') or now)
+    interval = MAX_POLL_INTERVAL
+    for max_age, age_interval in AGE_INTERVALS:
+        if age < max_age:
+            interval = age_interval
+            break
+
+    history = token_history.get_history(query)
+    if history is not None:
+        # Для короткой истории считаем волатильность по всем имеющимся замерам
+        oldest = history.raw.oldest_time()
+        window = min(VOLATILITY_WINDOW, now - oldest) if oldest is not None else VOLATILITY_WINDOW
+        interval /= 1 + history.volatility(window, now) / VOLATILITY_SCALE
+
+    # Сколько осталось вырасти до следующего множителя, по которому будет алерт
+    initial_mcap = (token_data.get('initial_data') or {}).get('raw_market_cap')
+    last = history.last() if history is not None else None
+    current_mcap = last[1] if last else (token_data.get('token_info') or {}).get('raw_market_cap')
+    if isinstance(initial_mcap, (int, float)) and initial_mcap > 0 and isinstance(current_mcap, (int, float)) and current_mcap > 0:
+        multiplier = current_mcap / initial_mcap
+        next_multiplier = max(2, int(multiplier) + 1, (token_data.get('last_alert_multiplier') or 1) + 1)
+        distance = next_multiplier / multiplier - 1
+        interval *= min(1.0, max(MIN_DISTANCE_FACTOR, distance / DISTANCE_SCALE))
+
+    return min(MAX_POLL_INTERVAL, max(MIN_POLL_INTERVAL, interval))
+
+# Общий планировщик процесса
+scheduler = PollScheduler()
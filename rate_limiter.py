@@ -0,0 +1,98 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Optional
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Очереди запросов: интерактивные (сообщения и кнопки пользователя) обслуживаются раньше фоновых обходов
+LANE_INTERACTIVE = 'interactive'
+LANE_BACKGROUND = 'background'
+
+# Доля скорости, которая восстанавливается после каждого успешного запроса
+RECOVERY_STEP = 0.05
+
+# Нижняя граница скорости после снижений из-за 429 (доля от лимита)
+MIN_RATE_FRACTION = 0.1
+
+class RateLimiter:
+    """
+    Ограничитель запросов к API по алгоритму token bucket.
+
+    Ведро вмещает burst запросов и пополняется со скоростью requests_per_minute / 60
+    в секунду. Пока интерактивный запрос ждет своей очереди, фоновые запросы не
+    получают токены. На ответ 429 скорость уменьшается вдвое и запросы приостанавливаются
+    на Retry-After (или cooldown) секунд, после успешных ответов скорость постепенно
+    возвращается к лимиту.
+    """
+
+    def __init__(self, requests_per_minute: int, cooldown: float, burst: Optional[int] = None):
+        self.max_rate = requests_per_minute / 60.0
+        self.rate = self.max_rate
+        self.cooldown = cooldown
+        self.capacity = burst if burst is not None else max(1, requests_per_minute // 6)
+        self.tokens = float(self.capacity)
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._waiting: Dict[str, int] = {LANE_INTERACTIVE: 0, LANE_BACKGROUND: 0}
+        self.stats: Dict[str, int] = {LANE_INTERACTIVE: 0, LANE_BACKGROUND: 0, 'rate_limited': 0}
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _can_take(self, lane: str, now: float) -> bool:
+        if now < self.blocked_until or self.tokens < 1:
+            return False
+        # Фоновый запрос уступает ожидающим интерактивным
+        return lane == LANE_INTERACTIVE or self._waiting[LANE_INTERACTIVE] == 0
+
+    def _delay(self, now: float) -> float:
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        # Токен есть, но его ждет интерактивный запрос
+        return 0.05
+
+    async def acquire(self, lane: str = LANE_INTERACTIVE) -> None:
+        """Ждет свободный токен в указанной очереди."""
+        self._waiting[lane] += 1
+        try:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._can_take(lane, now):
+                    self.tokens -= 1
+                    self.stats[lane] += 1
+                    return
+                await asyncio.sleep(self._delay(now))
+        finally:
+            self._waiting[lane] -= 1
+
+    def try_acquire(self, lane: str = LANE_INTERACTIVE) -> bool:
+        """Берет токен, только если он доступен сразу."""
+        now = time.monotonic()
+        self._refill(now)
+        if not self._can_take(lane, now):
+            return False
+        self.tokens -= 1
+        self.stats[lane] += 1
+        return True
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        """Снижает скорость и приостанавливает запросы после ответа 429."""
+        pause = retry_after if retry_after is not None else self.cooldown
+        now = time.monotonic()
+        self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+        self.tokens = 0.0
+        self._updated = now
+        self.blocked_until = max(self.blocked_until, now + pause)
+        self.stats['rate_limited'] += 1
+        logger.warning(f"API вернуло 429: пауза {pause:g} сек., лимит снижен до {self.rate * 60:.0f} запросов в минуту")
+
+    def on_success(self) -> None:
+        """Постепенно возвращает скорость к лимиту после успешного ответа."""
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_STEP)
@@ -0,0 +1,123 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable, Iterable
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Время жизни ответа в кэше (в секундах): повторные запросы того же токена
+# от кнопок обновления, обработки адресов и мониторинга в пределах этого
+# времени обслуживаются без обращения к API
+RESPONSE_CACHE_TTL = 3.0
+
+# Максимальное количество ответов в кэше
+MAX_CACHE_ENTRIES = 2000
+
+CacheKey = Tuple[str, str]
+
+def cache_key(endpoint: str, value: str) -> CacheKey:
+    """
+    Ключ кэша: (эндпоинт, нормализованный адрес или запрос).
+    Адреса Solana чувствительны к регистру и не меняются; EVM адреса (0x...) и поисковые
+    запросы приводятся к нижнему регистру.
+    """
+    value = value.strip()
+    if endpoint == 'search' or value.startswith('0x'):
+        value = value.lower()
+    return endpoint, value
+
+class ResponseCache:
+    """
+    Кэш успешных ответов API с ограниченным временем жизни и объединением запросов.
+
+    Пока запрос по ключу выполняется, остальные запросы того же ключа не идут в API,
+    а ждут его результат (single-flight). В кэш попадают только ответы со статусом 200.
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = MAX_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[CacheKey, Tuple[float, Any]] = {}
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+        self.stats = {'hits': 0, 'coalesced': 0, 'misses': 0}
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        """Возвращает неустаревший ответ из кэша."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        return entry[1]
+
+    def put(self, key: CacheKey, response: Any) -> None:
+        """Сохраняет успешный ответ."""
+        if getattr(response, 'status_code', None) != 200:
+            return
+        now = time.monotonic()
+        self._entries.pop(key, None)
+        self._entries[key] = (now + self.ttl, response)
+        if len(self._entries) > self.max_entries:
+            # Сначала удаляем устаревшие ответы, затем самые старые
+            for old_key in [k for k, (expires, _) in self._entries.items() if expires < now]:
+                del self._entries[old_key]
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+
+    def pending(self, key: CacheKey) -> Optional[asyncio.Future]:
+        """Возвращает выполняющийся запрос по ключу."""
+        return self._inflight.get(key)
+
+    def _finish(self, key: CacheKey, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if future.cancelled():
+            return
+        # Результат забираем всегда, чтобы ошибка без ожидающих не попадала в лог asyncio
+        if future.exception() is None:
+            self.put(key, future.result())
+
+    async def fetch(self, key: CacheKey, fetcher: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Возвращает ответ из кэша, присоединяется к выполняющемуся запросу или выполняет fetcher().
+        Отмена ожидающего не отменяет общий запрос.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            self.stats['hits'] += 1
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats['coalesced'] += 1
+            response = await asyncio.shield(inflight)
+            # None - пакетный запрос с этим ключом не удался, запрашиваем сами
+            if response is not None:
+                return response
+
+        self.stats['misses'] += 1
+        task = asyncio.ensure_future(fetcher())
+        self._inflight[key] = task
+        task.add_done_callback(lambda future: self._finish(key, future))
+        return await asyncio.shield(task)
+
+    def reserve(self, keys: Iterable[CacheKey]) -> Dict[CacheKey, asyncio.Future]:
+        """
+        Регистрирует выполняющийся запрос для нескольких ключей (пакетный запрос).
+        Каждый ключ нужно завершить через resolve(), в том числе при ошибке.
+        """
+        loop = asyncio.get_running_loop()
+        futures = {}
+        for key in keys:
+            future = loop.create_future()
+            future.add_done_callback(lambda done, key=key: self._finish(key, done))
+            self._inflight[key] = future
+            futures[key] = future
+        return futures
+
+    def resolve(self, future: asyncio.Future, response: Optional[Any]) -> None:
+        """Завершает зарезервированный ключ ответом (None - запрос не удался)."""
+        if not future.done():
+            future.set_result(response)
@@ -0,0 +1,237 @@
+import json
+import time
+import logging
+import sqlite3
+import threading
+from typing import Dict, Any, Optional, List, Iterable, Tuple
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Общая база для бота и трекера (SQLite в режиме WAL)
+SHARED_DB_PATH = "shared_store.sqlite"
+
+# Пространства имен общей базы
+NS_TRACKER = "tracker"                 # токены, достигшие MIN_SIGNALS (бывший tokens_tracker_database.json)
+NS_TRACKER_TOKENS = "tracker_tokens"   # все токены трекера из каналов (бывший DB_FILE трекера)
+
+def is_tracker_record(data: Dict[str, Any]) -> bool:
+    """
+    Проверяет, что запись имеет схему трекера (список каналов без token_info).
+    Раньше трекер и бот писали токены в один tokens_database.json.
+    """
+    return 'channels' in data and 'token_info' not in data
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+CREATE TABLE IF NOT EXISTS ns_versions (
+    ns TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+class SharedStore:
+    """
+    Общее хранилище ключ-значение с пространствами имен для нескольких процессов.
+
+    Процесс бота и трекер работают с одной SQLite базой в режиме WAL: чтения
+    не блокируют запись, а каждая запись затрагивает только свой ключ, поэтому
+    процессам не нужно перечитывать и перезаписывать файлы целиком.
+    Для каждого пространства имен ведется счетчик версий, по которому удобно
+    проверять, изменились ли данные (например, для кэша Excel отчета).
+    """
+
+    def __init__(self, db_path: str = SHARED_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.executescript(SCHEMA)
+
+    def _bump(self, ns: str) -> None:
+        """Увеличивает версию пространства имен (вызывается внутри транзакции)."""
+        self._conn.execute(
+            "INSERT OR IGNORE INTO ns_versions (ns, version) VALUES (?, 0)", (ns,)
+        )
+        self._conn.execute("UPDATE ns_versions SET version = version + 1 WHERE ns = ?", (ns,))
+
+    def _write(self, ns: str, rows: Iterable[Tuple[str, Dict[str, Any]]], merge: bool) -> int:
+        """Записывает ключи одной транзакцией. Возвращает количество записанных ключей."""
+        now = time.time()
+        written = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key, value in rows:
+                    if merge:
+                        row = self._conn.execute(
+                            "SELECT value FROM kv WHERE ns = ? AND key = ?", (ns, key)
+                        ).fetchone()
+                        if row:
+                            current = json.loads(row[0])
+                            current.update(value)
+                            value = current
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO kv (ns, key, value, updated) VALUES (?, ?, ?, ?)",
+                        (ns, key, json.dumps(value, ensure_ascii=False, default=str), now)
+                    )
+                    written += 1
+                if written:
+                    self._bump(ns)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return written
+
+    def get(self, ns: str, key: str) -> Optional[Dict[str, Any]]:
+        """Возвращает значение по ключу или None."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM kv WHERE ns = ? AND key = ?", (ns, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def contains(self, ns: str, key: str) -> bool:
+        """Проверяет наличие ключа."""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM kv WHERE ns = ? AND key = ?", (ns, key)).fetchone()
+        return row is not None
+
+    def put(self, ns: str, key: str, value: Dict[str, Any]) -> None:
+        """Записывает значение ключа целиком."""
+        self._write(ns, [(key, value)], merge=False)
+
+    def merge(self, ns: str, key: str, value: Dict[str, Any]) -> None:
+        """
+        Объединяет поля значения с уже записанными (создает ключ, если его нет).
+        Поля, записанные другим процессом и отсутствующие в value, сохраняются.
+        """
+        self._write(ns, [(key, value)], merge=True)
+
+    def merge_many(self, ns: str, items: Dict[str, Dict[str, Any]]) -> int:
+        """Объединяет несколько ключей одной транзакцией."""
+        return self._write(ns, items.items(), merge=True)
+
+    def update_fields(self, ns: str, key: str, fields: Dict[str, Any]) -> bool:
+        """Обновляет поля существующего ключа. Возвращает False, если ключа нет."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM kv WHERE ns = ? AND key = ?", (ns, key)).fetchone()
+                if not row:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                value = json.loads(row[0])
+                value.update(fields)
+                self._conn.execute(
+                    "UPDATE kv SET value = ?, updated = ? WHERE ns = ? AND key = ?",
+                    (json.dumps(value, ensure_ascii=False, default=str), time.time(), ns, key)
+                )
+                self._bump(ns)
+                self._conn.execute("COMMIT")
+                return True
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, ns: str, key: str) -> bool:
+        """Удаляет ключ. Возвращает True, если он был."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute("DELETE FROM kv WHERE ns = ? AND key = ?", (ns, key))
+                if cursor.rowcount:
+                    self._bump(ns)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount > 0
+
+    def items(self, ns: str) -> Dict[str, Dict[str, Any]]:
+        """Возвращает все значения пространства имен."""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM kv WHERE ns = ?", (ns,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def get_many(self, ns: str, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Возвращает значения для указанных ключей (отсутствующие пропускаются)."""
+        result = {}
+        if not keys:
+            return result
+        with self._lock:
+            # Ограничение SQLite на количество параметров - читаем пачками
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM kv WHERE ns = ? AND key IN ({placeholders})", (ns, *chunk)
+                ).fetchall()
+                for key, value in rows:
+                    result[key] = json.loads(value)
+        return result
+
+    def count(self, ns: str) -> int:
+        """Возвращает количество ключей в пространстве имен."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM kv WHERE ns = ?", (ns,)).fetchone()[0]
+
+    def version(self, ns: str) -> int:
+        """Возвращает версию пространства имен (меняется при каждой записи из любого процесса)."""
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM ns_versions WHERE ns = ?", (ns,)).fetchone()
+        return row[0] if row else 0
+
+    def import_json_file(self, ns: str, path: str, accept=None) -> int:
+        """
+        Однократно переносит данные из старого JSON-файла, если пространство имен пустое.
+        accept - необязательная проверка значения (для файлов с чужой схемой).
+        """
+        import os
+        if self.count(ns) or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка при чтении {path} для переноса в общую базу: {e}")
+            return 0
+        if not isinstance(data, dict):
+            return 0
+        items = {key: value for key, value in data.items()
+                 if isinstance(value, dict) and (accept is None or accept(value))}
+        return self.import_items(ns, items, source=path)
+
+    def import_items(self, ns: str, items: Dict[str, Dict[str, Any]], source: str) -> int:
+        """Однократно переносит записи из старого хранилища, если пространство имен пустое."""
+        if not items or self.count(ns):
+            return 0
+        imported = self._write(ns, items.items(), merge=True)
+        if imported:
+            logger.info(f"Из {source} в общую базу ({ns}) перенесено {imported} записей")
+        return imported
+
+    def close(self) -> None:
+        """Закрывает соединение с базой."""
+        with self._lock:
+            self._conn.close()
+
+# Соединение с общей базой открывается при первом обращении в каждом процессе
+_store: Optional[SharedStore] = None
+_store_lock = threading.Lock()
+
+def get_store() -> SharedStore:
+    """Возвращает общее хранилище текущего процесса."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SharedStore(SHARED_DB_PATH)
+    return _store
@@ -9,6 +9,7 @@ import time
 import signal
 from datetime import datetime, timedelta
 import pandas as pd  # Добавляем импорт pandas для работы с Excel
+import shared_store
 
 # Исправляем кодировку для Windows
 if sys.platform == 'win32':
@@ -146,8 +147,10 @@ SOURCE_CHANNELS = {
 # Словарь для динамического хранения имен каналов
 channel_names_cache = {}
 
-# Файлы базы данных
-DB_FILE = 'tokens_database.json'
+# Старые файлы базы данных (переносятся в общую базу при первом запуске).
+# DB_FILE совпадал с базой бота (token_storage), поэтому токены трекера
+# теперь хранятся в отдельном пространстве имен общей базы
+LEGACY_DB_FILE = 'tokens_database.json'
 TRACKER_DB_FILE = 'tokens_tracker_database.json'
 TRACKER_EXCEL_FILE = 'tokens_tracker_database.xlsx'
 
@@ -288,26 +291,25 @@ def extract_solana_contracts(text):
 def load_database():
     global tokens_db, tracker_db
     try:
+        store = shared_store.get_store()
+
+        # Однократный перенос старых файлов. В LEGACY_DB_FILE могут лежать токены бота,
+        # поэтому берем только записи со схемой трекера
+        store.import_json_file(shared_store.NS_TRACKER_TOKENS, LEGACY_DB_FILE,
+                               accept=shared_store.is_tracker_record)
+        store.import_json_file(shared_store.NS_TRACKER, TRACKER_DB_FILE)
+
         # Загружаем основную базу данных
-        if os.path.exists(DB_FILE):
-            with open(DB_FILE, 'r', encoding='utf-8') as f:
-                tokens_db = json.load(f)
-            logger.info(f"Загружено {len(tokens_db)} токенов из базы данных")
-        else:
-            logger.info("База данных не найдена, создаем новую")
-            tokens_db = {}
-            
+        tokens_db = store.items(shared_store.NS_TRACKER_TOKENS)
+        logger.info(f"Загружено {len(tokens_db)} токенов из базы данных")
+
         # Загружаем базу данных с отслеживаемыми токенами
-        if os.path.exists(TRACKER_DB_FILE):
-            with open(TRACKER_DB_FILE, 'r', encoding='utf-8') as f:
-                tracker_db = json.load(f)
-            logger.info(f"Загружено {len(tracker_db)} отслеживаемых токенов из базы данных")
-            
-            # Обновляем токены эмодзи, если это необходимо
+        tracker_db = store.items(shared_store.NS_TRACKER)
+        logger.info(f"Загружено {len(tracker_db)} отслеживаемых токенов из базы данных")
+
+        # Обновляем токены эмодзи, если это необходимо
+        if tracker_db:
             update_tracker_with_emojis()
-        else:
-            logger.info("База данных отслеживаемых токенов не найдена, создаем новую")
-            tracker_db = {}
     except Exception as e:
         logger.error(f"Ошибка при загрузке базы данных: {e}")
         tokens_db = {}
@@ -320,7 +322,7 @@ def update_tracker_with_emojis():
     если его нет, на основе тегов каналов.
     """
     try:
-        updates_count = 0
+        updated = []
         for contract, data in tracker_db.items():
             # Если поле emojis отсутствует, добавляем его
             if 'emojis' not in data or not data['emojis']:
@@ -329,7 +331,7 @@ def update_tracker_with_emojis():
                 
                 # Добавляем эмодзи в данные трекера
                 tracker_db[contract]['emojis'] = emojis
-                updates_count += 1
+                updated.append(contract)
                 logger.info(f"Добавлены эмодзи '{emojis}' для токена {contract}")
                 
                 # Обновляем channel_count, если он не соответствует
@@ -339,9 +341,11 @@ def update_tracker_with_emojis():
                     logger.info(f"Обновлен channel_count для токена {contract}: {len(channels)}")
         
         # Если были обновления, сохраняем базу данных
-        if updates_count > 0:
-            logger.info(f"Обновлено {updates_count} токенов с эмодзи")
-            save_tracker_database()
+        if updated:
+            logger.info(f"Обновлено {len(updated)} токенов с эмодзи")
+            shared_store.get_store().merge_many(
+                shared_store.NS_TRACKER, {contract: tracker_db[contract] for contract in updated}
+            )
             save_tracker_excel()
     
     except Exception as e:
@@ -349,25 +353,30 @@ def update_tracker_with_emojis():
         import traceback
         logger.error(traceback.format_exc())
 
-# Функция сохранения базы данных
-def save_database():
+# Функция сохранения токена в базу данных
+def save_database(contract):
+    """Записывает в общую базу только изменившийся токен."""
     try:
-        # Сохраняем основную базу данных
-        with open(DB_FILE, 'w', encoding='utf-8') as f:
-            json.dump(tokens_db, f, ensure_ascii=False, indent=4)
-        logger.info(f"Сохранено {len(tokens_db)} токенов в базу данных")
-        
-        # Сохраняем базу данных отслеживаемых токенов
-        save_tracker_database()
+        if contract in tokens_db:
+            shared_store.get_store().merge(shared_store.NS_TRACKER_TOKENS, contract, tokens_db[contract])
     except Exception as e:
         logger.error(f"Ошибка при сохранении базы данных: {e}")
 
-# Функция сохранения базы данных отслеживаемых токенов (JSON)
-def save_tracker_database():
+# Функция сохранения отслеживаемого токена
+def save_tracker_database(contract, create=False):
+    """
+    Записывает в общую базу только изменившийся отслеживаемый токен.
+    Поля записываются поверх сохраненных, поэтому отметки, выставленные ботом
+    (например, hidden), не теряются. Если бот удалил токен, он не восстанавливается
+    (кроме явного добавления с create=True).
+    """
     try:
-        with open(TRACKER_DB_FILE, 'w', encoding='utf-8') as f:
-            json.dump(tracker_db, f, ensure_ascii=False, indent=4)
-        logger.info(f"Сохранено {len(tracker_db)} отслеживаемых токенов в JSON базу данных")
+        store = shared_store.get_store()
+        if not create and not store.contains(shared_store.NS_TRACKER, contract):
+            logger.info(f"Токен {contract} удален из базы отслеживания, обновление пропущено")
+            tracker_db.pop(contract, None)
+            return
+        store.merge(shared_store.NS_TRACKER, contract, tracker_db[contract])
     except Exception as e:
         logger.error(f"Ошибка при сохранении базы данных отслеживаемых токенов: {e}")
 
@@ -503,7 +512,7 @@ def add_to_tracker(contract, token_data, emojis):
         rule1_passed = analyze_token_for_rule1(contract, tracker_data)
         
         # Сохраняем базы данных
-        save_tracker_database()
+        save_tracker_database(contract, create=True)
         save_tracker_excel()
         
         return rule1_passed
@@ -631,7 +640,7 @@ async def main():
                                 
                                 # Пересчитываем Rule1 для обновленного токена
                                 rule1_passed = analyze_token_for_rule1(contract, tracker_db[contract])
-                                save_tracker_database()
+                                save_tracker_database(contract)
                                 save_tracker_excel()
                             
                             # Если токен набрал нужное количество каналов и сообщение еще не отправлено в RadarDexBot
@@ -664,8 +673,8 @@ async def main():
                                 except Exception as e:
                                     logger.error(f"Ошибка при отправке номера контракта: {e}")
                             
-                            # Сохраняем базу данных после обновления
-                            save_database()
+                            # Сохраняем токен после обновления
+                            save_database(contract)
                     else:
                         # Создаем новую запись о токене
                         tokens_db[contract] = {
@@ -715,8 +724,8 @@ async def main():
                                         logger.error(f"Ошибка при отправке в {MOON_CRYPTO_MONKEY_CHANNEL}: {e}")
                             except Exception as e:
                                 logger.error(f"Ошибка при отправке номера контракта: {e}")                        
-                        # Сохраняем базу данных после добавления нового токена
-                        save_database()
+                        # Сохраняем токен после добавления
+                        save_database(contract)
             else:
                 logger.info("Контракты Solana в сообщении не найдены")
                 
@@ -725,18 +734,7 @@ async def main():
             import traceback
             logger.error(traceback.format_exc())
     
-    # Запускаем периодическое сохранение базы данных
-    async def periodic_save():
-        while True:
-            try:
-                await asyncio.sleep(300)  # Каждые 5 минут
-                save_database()
-            except Exception as e:
-                logger.error(f"Ошибка в задаче сохранения: {e}")
-                await asyncio.sleep(60)  # Подождем минуту перед следующей попыткой
-    
-    # Запускаем фоновую задачу сохранения
-    asyncio.ensure_future(periodic_save())
+    # Каждое изменение сразу записывается в общую базу, периодическое сохранение не нужно
     
     logger.info(f"Бот запущен и отслеживает каналы: {len(SOURCE_CHANNELS)} шт. MIN_SIGNALS={MIN_SIGNALS}")
     logger.info(f"Rule1 фильтр для {MOON_CRYPTO_MONKEY_CHANNEL}: Signals15 >= 10 и Age <= 5 минут")
@@ -751,7 +749,5 @@ async def main():
         import traceback
         logger.error(traceback.format_exc())
     finally:
-        # Сохраняем базу данных перед выходом
-        save_database()
         await client.disconnect()
         logger.info("Соединение закрыто")
\ No newline at end of file
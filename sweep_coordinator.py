@@ -0,0 +1,136 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional, List, Set, Iterable, Mapping, Callable, Awaitable
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Сколько пачек токенов обрабатывается одновременно
+SWEEP_CONCURRENCY = 4
+
+# Размер пачки токенов (совпадает с лимитом адресов в одном запросе к API)
+SWEEP_CHUNK_SIZE = 30
+
+class SweepCoordinator:
+    """
+    Координатор обходов маркет капа.
+
+    Одновременно выполняется только один обход этого координатора: обход, запущенный
+    во время другого, пропускается. Токены обрабатываются пачками, не больше concurrency пачек
+    одновременно. Пачки, не завершенные к сроку (deadline), отменяются, а их токены
+    переносятся в backlog и обрабатываются первыми в следующем обходе.
+
+    Координаторы с общим набором in_flight не обрабатывают один токен одновременно:
+    токен, который сейчас опрашивает другой обход, пропускается и не переносится в backlog.
+    """
+
+    def __init__(self, concurrency: int = SWEEP_CONCURRENCY, chunk_size: int = SWEEP_CHUNK_SIZE,
+                 in_flight: Optional[Set[str]] = None):
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        # Токены, которые сейчас обрабатываются (общий набор для нескольких координаторов)
+        self.in_flight: Set[str] = in_flight if in_flight is not None else set()
+        self.running: Optional[str] = None
+        self.backlog: List[str] = []
+        self._stats: Dict[str, Any] = {
+            'runs': 0,
+            'skipped': 0,
+            'deadline_exceeded': 0,
+            'last_name': None,
+            'last_duration': 0.0,
+            'max_duration': 0.0,
+            'last_processed': 0,
+            'last_carried_over': 0,
+            'last_in_flight_skipped': 0,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает статистику обходов: длительность, количество и размер backlog."""
+        return dict(self._stats, running=self.running, backlog=len(self.backlog))
+
+    def busy(self, name: str) -> bool:
+        """Проверяет, выполняется ли обход. Если да - учитывает пропуск обхода name."""
+        if self.running is None:
+            return False
+        self._stats['skipped'] += 1
+        logger.info(f"Обход '{name}' пропущен: еще выполняется обход '{self.running}'")
+        return True
+
+    async def run(
+        self,
+        name: str,
+        queries: Iterable[str],
+        tokens: Mapping[str, Dict[str, Any]],
+        process: Callable[[Dict[str, Dict[str, Any]]], Awaitable[None]],
+        deadline: float
+    ) -> Optional[List[str]]:
+        """
+        Выполняет обход: сначала токены из backlog, затем queries (только те, что есть в tokens
+        и сейчас не обрабатываются другим обходом).
+        process(пачка) вызывается для каждой пачки {запрос: данные токена}.
+        Возвращает список обработанных токенов или None, если обход пропущен.
+        """
+        if self.busy(name):
+            return None
+
+        self.running = name
+        started = time.monotonic()
+        order = [query for query in dict.fromkeys(self.backlog + list(queries)) if query in tokens]
+        chunks = [order[i:i + self.chunk_size] for i in range(0, len(order), self.chunk_size)]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        processed: List[str] = []
+        skipped: List[str] = []
+
+        async def worker(chunk: List[str]) -> None:
+            async with semaphore:
+                # Токены, которые сейчас опрашивает другой обход, не запрашиваем повторно
+                claimed = [query for query in chunk if query not in self.in_flight]
+                skipped.extend(query for query in chunk if query in self.in_flight)
+                self.in_flight.update(claimed)
+                try:
+                    if claimed:
+                        await process({query: tokens[query] for query in claimed})
+                except Exception as e:
+                    logger.error(f"Ошибка при обработке пачки токенов в обходе '{name}': {e}")
+                finally:
+                    self.in_flight.difference_update(claimed)
+            # Пачка с ошибкой тоже считается обработанной, чтобы не повторять ее бесконечно
+            processed.extend(claimed)
+
+        tasks = [asyncio.ensure_future(worker(chunk)) for chunk in chunks]
+        try:
+            if tasks:
+                _, pending = await asyncio.wait(tasks, timeout=deadline)
+                if pending:
+                    self._stats['deadline_exceeded'] += 1
+                    logger.warning(f"Обход '{name}' не уложился в {deadline} сек., "
+                                   f"отменено пачек: {len(pending)}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            done = set(processed) | set(skipped)
+            self.backlog = [query for query in order if query not in done]
+            duration = time.monotonic() - started
+            self._stats.update(
+                runs=self._stats['runs'] + 1,
+                last_name=name,
+                last_duration=duration,
+                max_duration=max(self._stats['max_duration'], duration),
+                last_processed=len(processed),
+                last_carried_over=len(self.backlog),
+                last_in_flight_skipped=len(skipped),
+            )
+            self.running = None
+            logger.info(f"Обход '{name}' завершен за {duration:.1f} сек.: обработано {len(processed)}, "
+                        f"пропущено (в другом обходе) {len(skipped)}, перенесено в следующий обход {len(self.backlog)}")
+        return processed
+
+# Координаторы обходов процесса: у мониторинга и полной проверки свои слоты и backlog,
+# поэтому долгая полная проверка не блокирует запуски мониторинга. Набор обрабатываемых
+# токенов общий: обходы не опрашивают один токен одновременно и не дублируют уведомления
+in_flight_queries: Set[str] = set()
+monitor_coordinator = SweepCoordinator(in_flight=in_flight_queries)
+full_coordinator = SweepCoordinator(in_flight=in_flight_queries)
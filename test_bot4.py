@@ -1,10 +1,10 @@
 import os
+import re
 import logging
 import time
 import asyncio
 import datetime
 import traceback
-import requests
 import telegram
 from typing import Dict, Any, Optional, List, Tuple
 
@@ -15,12 +15,12 @@ from telegram.error import TimedOut, NetworkError
 
 # Импортируем модули проекта
 import token_storage
+import dex_client
 from config import TELEGRAM_TOKEN, logger
-from utils import format_number, format_tokens_list
+from utils import format_number, format_tokens_list, process_token_data
 
 # Импортируем функции из token_service, модифицируем для тестового бота
 from token_service import (
-    get_token_info as original_get_token_info,
     process_token_address, 
     check_all_market_caps, 
     check_market_cap_only
@@ -72,27 +72,37 @@ console_formatter = logging.Formatter('%(levelname)s: %(message)s')
 console_handler.setFormatter(console_formatter)
 debug_logger.addHandler(console_handler)
 
+# Адрес контракта (Solana base58 или EVM 0x...) - пары такого токена берутся из /tokens/{адрес}
+TOKEN_ADDRESS_PATTERN = re.compile(r'^(0x[a-fA-F0-9]{40}|[1-9A-HJ-NP-Za-km-z]{32,44})$')
+
 # Функция для получения данных о DEX
-def fetch_dex_data(contract_address: str) -> Dict[str, Any]:
+async def fetch_dex_data(query: str) -> Dict[str, Any]:
     """
-    Получает данные о DEX напрямую из API DexScreener.
+    Получает пары токена из API DexScreener одним запросом.
+    Для адреса контракта используется /latest/dex/tokens/{адрес}, для тикера - поиск.
+    Возвращаются только пары, в которых токен базовый.
     """
     try:
-        debug_logger.info(f"Запрос данных о DEX для контракта: {contract_address}")
-        url = f"https://api.dexscreener.com/latest/dex/tokens/{contract_address}"
+        debug_logger.info(f"Запрос данных о DEX для: {query}")
         
-        response = requests.get(url, timeout=10)
+        if TOKEN_ADDRESS_PATTERN.match(query):
+            response = await dex_client.client.token_pairs(query, timeout=10)
+        else:
+            response = await dex_client.client.search(query, timeout=10)
         
         if response.status_code == 200:
-            data = response.json()
-            debug_logger.info(f"Успешно получены данные о DEX для контракта: {contract_address}")
+            pairs = response.json().get('pairs') or []
+            
+            # Для адреса оставляем пары этого токена, для поиска - пары самого релевантного токена
+            if pairs:
+                address = query if TOKEN_ADDRESS_PATTERN.match(query) else (pairs[0].get('baseToken') or {}).get('address', '')
+                pairs = dex_client.base_pairs(pairs, address) or pairs
             
             # Логируем количество пар и их названия для отладки
-            pairs = data.get('pairs', [])
             dex_names = [pair.get('dexId', 'Unknown') for pair in pairs]
             debug_logger.info(f"Получены данные о {len(pairs)} парах. DEX: {', '.join(dex_names)}")
             
-            return data
+            return {"pairs": pairs}
         else:
             debug_logger.warning(f"Ошибка {response.status_code} при запросе данных о DEX")
             return {"pairs": []}
@@ -101,133 +111,28 @@ def fetch_dex_data(contract_address: str) -> Dict[str, Any]:
         debug_logger.error(traceback.format_exc())
         return {"pairs": []}
 
-async def get_token_info(
-    query: str, 
-    chat_id: int, 
-    message_id: Optional[int] = None, 
-    context: Optional[ContextTypes.DEFAULT_TYPE] = None
-) -> Optional[Dict[str, Any]]:
-    """Получает информацию о токене и отправляет или обновляет сообщение с расширенной информацией."""
-    try:
-        # Вызываем оригинальную функцию только для получения данных, без отправки сообщения
-        if message_id is None:
-            token_info = await original_get_token_info(query, None, None, None)
-        else:
-            # Если обновляем существующее сообщение, используем нашу версию форматирования
-            # и не позволяем original_get_token_info обновлять сообщение
-            token_info = await original_get_token_info(query, None, None, None)
-            
-        if not token_info:
-            return None
-        
-        # Получаем дополнительные данные из хранилища
-        stored_data = token_storage.get_token_data(query)
-        
-        # Если данных нет, создаем начальные данные перед любыми операциями
-        if not stored_data:
-            # Сохраняем начальные данные для нового токена
-            current_time = datetime.datetime.now().strftime("%H:%M:%S")
-            initial_data = {
-                'time': current_time,
-                'market_cap': token_info.get('market_cap', 'Неизвестно'),
-                'raw_market_cap': token_info.get('raw_market_cap', 0)
-            }
-            stored_data = {
-                'initial_data': initial_data,
-                'token_info': token_info
-            }
-        
-        # По умолчанию устанавливаем значения
-        token_info['dex_info'] = 'Unknown DEX'
-        token_info['txns_trend'] = {
-            "m5_buys": 0,
-            "m5_sells": 0,
-            "h1_buys": 0,
-            "h1_sells": 0,
-            "h24_buys": 0,
-            "h24_sells": 0,
-            "status": "🟡 Нейтральный тренд"
-        }
-        
-        # Запрашиваем данные напрямую с API для получения данных о всех DEX
-        try:
-            # Важное изменение: используем правильную конструкцию адреса токена при запросе
-            dex_data = fetch_dex_data(query)
-            
-            if dex_data and 'pairs' in dex_data and dex_data['pairs']:
-                pairs = dex_data.get('pairs', [])
-                
-                # Используем нашу функцию для нахождения популярного DEX и PUMPFUN DEX
-                popular_dex, pumpfun_dex = find_dexes_info(dex_data)
-                
-                # Обрабатываем основной DEX
-                if popular_dex:
-                    token_info['dex_info'] = popular_dex.get('dexId', 'Unknown DEX')
-                    #token_info['txns_trend'] = analyze_transactions(popular_dex.get('txns', {}))
-                
-                # Добавляем информацию о PUMPFUN, если найден
-                if pumpfun_dex:
-                    token_info['pumpfun_data'] = {
-                        'txns': pumpfun_dex.get('txns', {}),
-                        'boosts': pumpfun_dex.get('boosts', {}).get('active', None)
-                    }
-        except Exception as e:
-            debug_logger.error(f"Ошибка при получении данных DEX: {str(e)}")
-            debug_logger.error(traceback.format_exc())
-        
-        # Форматируем сообщение с расширенной информацией
-        message = format_enhanced_message(token_info, stored_data.get('initial_data', {}))
-        
-        # Создаем кнопку обновления
-        keyboard = [[InlineKeyboardButton("🔄 Обновить", callback_data=f"refresh:{query}")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        # Если есть context и chat_id, отправляем или обновляем сообщение
-        if context and chat_id:
-            if message_id:
-                try:
-                    await context.bot.edit_message_text(
-                        chat_id=chat_id,
-                        message_id=message_id,
-                        text=message,
-                        parse_mode=ParseMode.MARKDOWN,
-                        reply_markup=reply_markup,
-                        disable_web_page_preview=True
-                    )
-                except Exception as e:
-                    if "Message is not modified" not in str(e):
-                        logger.error(f"Ошибка при обновлении сообщения: {e}")
-            else:
-                try:
-                    sent_msg = await context.bot.send_message(
-                        chat_id=chat_id,
-                        text=message,
-                        parse_mode=ParseMode.MARKDOWN,
-                        reply_markup=reply_markup,
-                        disable_web_page_preview=True
-                    )
-                    
-                    # Сохраняем данные о токене в хранилище
-                    token_data_to_store = {
-                        'last_update_time': time.time(),
-                        'message_id': sent_msg.message_id,
-                        'chat_id': sent_msg.chat_id,
-                        'initial_data': stored_data.get('initial_data', {}),
-                        'token_info': token_info,
-                        'last_alert_multiplier': stored_data.get('last_alert_multiplier', 1),
-                        'added_time': stored_data.get('added_time', time.time()),
-                        'raw_api_data': stored_data.get('raw_api_data', {})
-                    }
-                    
-                    token_storage.store_token_data(query, token_data_to_store)
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке нового сообщения: {e}")
-        
-        return token_info
-    except Exception as e:
-        logger.error(f"Ошибка в get_token_info: {str(e)}")
+def build_token_info(query: str, dex_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Формирует token_info из пар токена: данные берутся из основной пары (find_dexes_info),
+    к ним добавляются DEX основной пары и данные PUMPFUN.
+    """
+    popular_dex, pumpfun_dex = find_dexes_info(dex_data)
+    if not popular_dex:
         return None
-        
+    
+    token_info = process_token_data(popular_dex)
+    token_info['dex_info'] = popular_dex.get('dexId', 'Unknown DEX')
+    
+    # Добавляем информацию о PUMPFUN, если найден
+    if pumpfun_dex:
+        token_info['pumpfun_data'] = {
+            'txns': pumpfun_dex.get('txns', {}),
+            'boosts': pumpfun_dex.get('boosts', {}).get('active', None)
+        }
+    
+    # Сохраняем замер в историю маркет капа токена
+    token_storage.record_market_cap(query, token_info['raw_market_cap'], (popular_dex.get('volume') or {}).get('m5'))
+    return token_info
         
 def find_dexes_info(dex_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """
@@ -299,13 +204,9 @@ async def get_token_info(
 ) -> Optional[Dict[str, Any]]:
     """Получает информацию о токене и отправляет или обновляет сообщение с расширенной информацией."""
     try:
-        # Вызываем оригинальную функцию только для получения данных, без отправки сообщения
-        if message_id is None:
-            token_info = await original_get_token_info(query, None, None, None)
-        else:
-            # Если обновляем существующее сообщение, используем нашу версию форматирования
-            # и не позволяем original_get_token_info обновлять сообщение
-            token_info = await original_get_token_info(query, None, None, None)
+        # Пары токена запрашиваются один раз: из них собираются и данные токена, и информация о DEX
+        dex_data = await fetch_dex_data(query)
+        token_info = build_token_info(query, dex_data)
             
         if not token_info:
             return None
@@ -327,61 +228,6 @@ async def get_token_info(
                 'token_info': token_info
             }
         
-        # По умолчанию устанавливаем значения
-        token_info['dex_info'] = 'Unknown DEX'
-        # Убираем txns_trend, так как анализ транзакций удален
-        
-        # Запрашиваем данные напрямую с API для получения данных о всех DEX
-        try:
-            url = f"https://api.dexscreener.com/latest/dex/tokens/{query}"
-            response = requests.get(url, timeout=10)
-            
-            if response.status_code == 200:
-                dex_data = response.json()
-                pairs = dex_data.get('pairs', [])
-                
-                popular_dex = None
-                pumpfun_dex = None
-                max_txns = 0
-                
-                # Находим PUMPFUN и самый популярный DEX
-                for pair in pairs:
-                    dex_id = pair.get('dexId', 'Unknown')
-                    txns = pair.get('txns', {})
-                    
-                    # Считаем общее количество транзакций за 24 часа
-                    h24_data = txns.get('h24', {})
-                    h24_buys = h24_data.get('buys', 0) if isinstance(h24_data, dict) else 0
-                    h24_sells = h24_data.get('sells', 0) if isinstance(h24_data, dict) else 0
-                    total_txns = h24_buys + h24_sells
-                    
-                    # Проверяем, не PUMPFUN ли это
-                    if dex_id.lower() in ['pumpfun', 'pump.fun', 'pump fun']:
-                        pumpfun_dex = pair
-                    
-                    # Проверяем, не самый ли это популярный DEX
-                    if total_txns > max_txns:
-                        max_txns = total_txns
-                        popular_dex = pair
-                
-                # Если популярный DEX не найден, берем первую пару, если она есть
-                if not popular_dex and pairs:
-                    popular_dex = pairs[0]
-                
-                # Обрабатываем основной DEX
-                if popular_dex:
-                    token_info['dex_info'] = popular_dex.get('dexId', 'Unknown DEX')
-                    # Убираем вызов analyze_transactions здесь
-                
-                # Добавляем информацию о PUMPFUN, если найден
-                if pumpfun_dex:
-                    token_info['pumpfun_data'] = {
-                        'txns': pumpfun_dex.get('txns', {}),
-                        'boosts': pumpfun_dex.get('boosts', {}).get('active', None)
-                    }
-        except Exception:
-            pass  # Продолжаем работу даже при ошибке API
-        
         # Форматируем сообщение с расширенной информацией
         message = format_enhanced_message(token_info, stored_data.get('initial_data', {}))
         
@@ -423,7 +269,7 @@ async def get_token_info(
                         'token_info': token_info,
                         'last_alert_multiplier': stored_data.get('last_alert_multiplier', 1),
                         'added_time': stored_data.get('added_time', time.time()),
-                        'raw_api_data': stored_data.get('raw_api_data', {})
+                        'raw_api_ref': stored_data.get('raw_api_ref')
                     }
                     
                     token_storage.store_token_data(query, token_data_to_store)
@@ -861,6 +707,13 @@ async def handle_refresh_token(update: Update, context: ContextTypes.DEFAULT_TYP
         current_time = time.time()
         stored_data = token_storage.get_token_data(token_query)
         
+        # Кнопка могла быть создана для адреса или тикера - ищем токен по индексам
+        if not stored_data:
+            resolved_query = token_storage.resolve_token_query(token_query)
+            if resolved_query is not None:
+                token_query = resolved_query
+                stored_data = token_storage.get_token_data(token_query)
+        
         if stored_data:
             last_update_time = stored_data.get('last_update_time', 0)
             if current_time - last_update_time < 5:  # Минимум 5 секунд между обновлениями
@@ -945,6 +798,14 @@ async def on_startup(application):
         debug_logger.error(f"Ошибка при инициализации бота: {str(e)}")
         debug_logger.error(traceback.format_exc())
 
+async def on_shutdown(application):
+    """Выполняется при остановке бота."""
+    try:
+        # Закрываем пул соединений к DexScreener
+        await dex_client.aclose()
+    except Exception as e:
+        debug_logger.error(f"Ошибка при остановке бота: {str(e)}")
+
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Отображает статистику по токенам за последние 12 часов."""
     try:
@@ -1047,6 +908,7 @@ def main():
         
         # Добавляем функцию, которая выполнится при запуске бота
         application.post_init = on_startup
+        application.post_shutdown = on_shutdown
         
         # Устанавливаем команды меню напрямую
         setup_commands_direct(TELEGRAM_TOKEN)
@@ -1055,6 +917,9 @@ def main():
         # Запускаем бота - СИНХРОННЫЙ блокирующий вызов
         debug_logger.info("Бот запущен и готов к работе")
         application.run_polling(allowed_updates=Update.ALL_TYPES)
+        
+        # Сворачиваем журнал изменений в снапшот перед выходом
+        token_storage.close_storage()
             
     except Exception as e:
         debug_logger.error(f"Критическая ошибка при запуске бота: {str(e)}")
@@ -0,0 +1,98 @@
+import asyncio
+import importlib
+
+import httpx
+import pytest
+
+import dex_client
+from circuit_breaker import CircuitBreaker
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache
+
+ADDRESS = '7GCihgDB8fe6KNjn2MYtkzZcRjQy3t9GHdC8uHYmW2hr'
+OTHER = 'So11111111111111111111111111111111111111112'
+
+def pair(dex_id, base, buys, sells, fdv=1000):
+    return {
+        'chainId': 'solana', 'dexId': dex_id, 'pairAddress': f"P-{dex_id}-{base[:4]}",
+        'baseToken': {'address': base, 'symbol': 'pop'},
+        'txns': {'h24': {'buys': buys, 'sells': sells}},
+        'volume': {'m5': 10, 'h1': 100}, 'fdv': fdv, 'boosts': {'active': 3},
+    }
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    # Модуль бота создает каталог логов и загружает базу токенов из текущего каталога
+    monkeypatch.chdir(tmp_path)
+    test_bot4 = importlib.import_module('test_bot4')
+    samples = []
+    monkeypatch.setattr(test_bot4.token_storage, 'record_market_cap',
+                        lambda query, fdv, volume=None: samples.append((query, fdv, volume)))
+    return test_bot4, samples
+
+def use_transport(monkeypatch, handler):
+    requests = []
+
+    def recording_handler(request):
+        requests.append(request.url)
+        return handler(request)
+
+    client = dex_client.DexClient(RateLimiter(6000, 1, burst=100), ResponseCache(ttl=60), CircuitBreaker())
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(recording_handler))
+    monkeypatch.setattr(dex_client, 'client', client)
+    return requests
+
+def test_fetch_by_address_keeps_pairs_of_that_token(bot, monkeypatch):
+    test_bot4, _ = bot
+    requests = use_transport(monkeypatch, lambda request: httpx.Response(200, json={'pairs': [
+        pair('raydium', ADDRESS, 10, 10), pair('orca', OTHER, 50, 50),
+    ]}))
+
+    data = asyncio.run(test_bot4.fetch_dex_data(ADDRESS))
+    assert [item['dexId'] for item in data['pairs']] == ['raydium']
+    assert requests[0].path == f"/latest/dex/tokens/{ADDRESS}"
+
+def test_fetch_by_ticker_keeps_pairs_of_first_result(bot, monkeypatch):
+    test_bot4, _ = bot
+    requests = use_transport(monkeypatch, lambda request: httpx.Response(200, json={'pairs': [
+        pair('raydium', ADDRESS, 10, 10), pair('orca', OTHER, 50, 50), pair('pumpfun', ADDRESS, 1, 1),
+    ]}))
+
+    data = asyncio.run(test_bot4.fetch_dex_data('$POP'))
+    assert [item['dexId'] for item in data['pairs']] == ['raydium', 'pumpfun']
+    assert requests[0].path == '/latest/dex/search'
+    assert requests[0].params['q'] == '$POP'
+
+@pytest.mark.parametrize('handler', [
+    lambda request: httpx.Response(404),
+    lambda request: httpx.Response(200, json={'pairs': None}),
+    lambda request: httpx.Response(200, content=b'not json'),
+])
+def test_fetch_errors_return_no_pairs(bot, monkeypatch, handler):
+    test_bot4, _ = bot
+    use_transport(monkeypatch, handler)
+    assert asyncio.run(test_bot4.fetch_dex_data(ADDRESS)) == {'pairs': []}
+
+def test_build_token_info_uses_most_traded_pair(bot):
+    test_bot4, samples = bot
+    dex_data = {'pairs': [
+        pair('pumpfun', ADDRESS, 5, 5, fdv=900),
+        pair('raydium', ADDRESS, 40, 20, fdv=1200),
+    ]}
+
+    token_info = test_bot4.build_token_info(ADDRESS, dex_data)
+    assert token_info['dex_info'] == 'raydium'
+    assert token_info['ticker'] == 'POP'
+    assert token_info['raw_market_cap'] == 1200
+    assert token_info['pumpfun_data'] == {'txns': {'h24': {'buys': 5, 'sells': 5}}, 'boosts': 3}
+    # Замер маркет капа передается в хранилище (история ведется только для отслеживаемых токенов)
+    assert samples == [(ADDRESS, 1200, 10)]
+
+def test_build_token_info_without_pairs(bot):
+    test_bot4, samples = bot
+    assert test_bot4.build_token_info(ADDRESS, {'pairs': []}) is None
+    # Пары без транзакций: берется первая, данных PUMPFUN нет
+    token_info = test_bot4.build_token_info(ADDRESS, {'pairs': [pair('orca', ADDRESS, 0, 0)]})
+    assert token_info['dex_info'] == 'orca'
+    assert 'pumpfun_data' not in token_info
+    assert len(samples) == 1
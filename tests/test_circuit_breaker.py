@@ -0,0 +1,108 @@
+import types
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN, MAX_RESET_TIMEOUT
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker, 'time', types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+def test_opens_after_threshold_and_rejects(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.closed and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert not breaker.allow()
+    assert breaker.stats == {'opened': 1, 'rejected': 1}
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.closed
+
+def test_half_open_lets_through_a_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    open_breaker(breaker)
+    clock.now += 9.9
+    assert not breaker.allow()
+
+    clock.now += 0.1
+    assert breaker.allow()
+    assert breaker.state == STATE_HALF_OPEN
+    # Пока пробный запрос выполняется, остальные отклоняются
+    assert not breaker.allow()
+
+def test_successful_probe_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    open_breaker(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.reset_timeout == 10
+    assert breaker.allow() and breaker.allow()
+
+def test_failed_probe_reopens_with_doubled_pause_up_to_limit(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    open_breaker(breaker)
+    pauses = []
+    for _ in range(6):
+        clock.now += breaker.reset_timeout
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == STATE_OPEN
+        pauses.append(breaker.reset_timeout)
+    assert pauses == [20, 40, 80, MAX_RESET_TIMEOUT, MAX_RESET_TIMEOUT, MAX_RESET_TIMEOUT]
+
+    # Успешная проба возвращает исходную паузу
+    clock.now += breaker.reset_timeout
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.reset_timeout == 10
+
+def test_stuck_probe_is_replaced(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    open_breaker(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    # Пробный запрос так и не завершился (например, был отменен)
+    clock.now += 10
+    assert breaker.allow()
+
+def test_rate_limited_response_does_not_break_failure_streak(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=10)
+    for status_code in (503, 502, 429, 500, 429, 504):
+        breaker.record_response(status_code)
+    assert breaker.closed
+    breaker.record_response(500)
+    assert breaker.state == STATE_OPEN
+
+def test_non_5xx_responses_count_as_success(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.record_response(503)
+    breaker.record_response(404)
+    breaker.record_response(503)
+    assert breaker.closed
+    assert breaker.failures == 1
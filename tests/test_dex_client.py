@@ -0,0 +1,264 @@
+import asyncio
+import sys
+
+import httpx
+import pytest
+
+import dex_client
+from circuit_breaker import CircuitBreaker, STATE_HALF_OPEN
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache, cache_key
+
+def make_client(handler):
+    client = dex_client.DexClient(RateLimiter(6000, 1, burst=100), ResponseCache(ttl=60), CircuitBreaker())
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+def pair(address, pair_address=None):
+    return {'pairAddress': pair_address or f"P-{address}", 'baseToken': {'address': address}}
+
+def batch_addresses(request):
+    return request.url.path.rsplit('/', 1)[-1].split(',')
+
+def test_batch_splits_addresses_by_request_limit():
+    requests = []
+
+    def handler(request):
+        addresses = batch_addresses(request)
+        requests.append(addresses)
+        return httpx.Response(200, json={'pairs': [pair(address) for address in addresses]})
+
+    async def scenario():
+        client = make_client(handler)
+        return await client.tokens_pairs_batch([f"A{index}" for index in range(65)])
+
+    result = asyncio.run(scenario())
+    assert sorted(len(addresses) for addresses in requests) == [5, 30, 30]
+    assert len(result) == 65
+    assert result['A7'] == [pair('A7')]
+
+@pytest.mark.parametrize('count, sizes', [(30, [30]), (31, [1, 30]), (60, [30, 30])])
+def test_batch_limit_boundaries(count, sizes):
+    requests = []
+
+    def handler(request):
+        requests.append(batch_addresses(request))
+        return httpx.Response(200, json={'pairs': []})
+
+    async def scenario():
+        client = make_client(handler)
+        # Повторяющиеся адреса запрашиваются один раз
+        addresses = [f"A{index}" for index in range(count)]
+        return await client.tokens_pairs_batch(addresses + addresses[:5])
+
+    result = asyncio.run(scenario())
+    assert sorted(len(addresses) for addresses in requests) == sizes
+    assert sorted(sum(requests, [])) == sorted(f"A{index}" for index in range(count))
+    assert len(result) == count
+
+def test_batch_maps_pairs_to_base_token():
+    def handler(request):
+        return httpx.Response(200, json={'pairs': [
+            pair('A', 'P1'),
+            pair('A', 'P2'),
+            # Адреса Solana чувствительны к регистру, EVM адреса - нет
+            pair('a', 'P3'),
+            pair('0xabc', 'P4'),
+            # B здесь котируемый токен - пара к нему не относится
+            {'pairAddress': 'P5', 'baseToken': {'address': 'C'}, 'quoteToken': {'address': 'B'}},
+        ]})
+
+    async def scenario():
+        client = make_client(handler)
+        result = await client.tokens_pairs_batch(['A', 'B', 'C', '0xABC'])
+        # Ответ по каждому адресу кэшируется и отдается без нового запроса
+        cached = await client.token_pairs('C')
+        return result, cached
+
+    result, cached = asyncio.run(scenario())
+    assert [item['pairAddress'] for item in result['A']] == ['P1', 'P2']
+    assert result['B'] == []
+    assert [item['pairAddress'] for item in result['C']] == ['P5']
+    assert [item['pairAddress'] for item in result['0xABC']] == ['P4']
+    assert cached.json()['pairs'] == result['C']
+
+def test_batch_results_are_cached_per_address():
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        return httpx.Response(200, json={'pairs': [pair(address) for address in batch_addresses(request)]})
+
+    async def scenario():
+        client = make_client(handler)
+        await client.tokens_pairs_batch(['A', 'B'])
+        single = await client.token_pairs('B')
+        again = await client.tokens_pairs_batch(['A', 'B', 'C'])
+        return single, again, client.cache._inflight
+
+    single, again, inflight = asyncio.run(scenario())
+    assert len(requests) == 2
+    assert requests[-1].endswith('/C')
+    assert single.json() == {'pairs': [pair('B')]}
+    assert again['A'] == [pair('A')]
+    assert inflight == {}
+
+def test_failed_batch_is_absent_and_releases_reservations():
+    def handler(request):
+        return httpx.Response(503)
+
+    async def scenario():
+        client = make_client(handler)
+        result = await client.tokens_pairs_batch(['A', 'B'])
+        return result, client.cache._inflight
+
+    result, inflight = asyncio.run(scenario())
+    assert result == {}
+    assert inflight == {}
+
+def test_cancelled_batch_releases_reservations():
+    async def handler(request):
+        await asyncio.sleep(30)
+
+    async def scenario():
+        client = make_client(handler)
+        batch = asyncio.ensure_future(client.tokens_pairs_batch([f"A{index}" for index in range(10)]))
+        # Отменяем до того, как задачи пакетов успели начаться
+        await asyncio.sleep(0)
+        batch.cancel()
+        await asyncio.gather(batch, return_exceptions=True)
+        return client.cache._inflight
+
+    assert asyncio.run(scenario()) == {}
+
+def test_lookup_after_cancelled_batch_does_not_hang():
+    calls = {'count': 0}
+
+    async def handler(request):
+        calls['count'] += 1
+        if calls['count'] == 1:
+            await asyncio.sleep(30)
+        return httpx.Response(200, json={'pairs': [pair('A')]})
+
+    async def scenario():
+        client = make_client(handler)
+        batch = asyncio.ensure_future(client.tokens_pairs_batch(['A']))
+        await asyncio.sleep(0.01)
+        batch.cancel()
+        await asyncio.gather(batch, return_exceptions=True)
+        return await asyncio.wait_for(client.token_pairs('A'), timeout=2)
+
+    assert asyncio.run(scenario()).json() == {'pairs': [pair('A')]}
+
+def test_single_lookup_joins_running_batch():
+    requests = []
+
+    async def handler(request):
+        requests.append(request.url.path)
+        await asyncio.sleep(0.01)
+        addresses = batch_addresses(request)
+        return httpx.Response(200, json={'pairs': [pair(address) for address in addresses]})
+
+    async def scenario():
+        client = make_client(handler)
+        batch = asyncio.ensure_future(client.tokens_pairs_batch(['A', 'B']))
+        await asyncio.sleep(0)
+        single = await client.token_pairs('B')
+        await batch
+        return single
+
+    single = asyncio.run(scenario())
+    assert len(requests) == 1
+    assert single.json() == {'pairs': [pair('B')]}
+
+def test_batch_uses_cached_responses():
+    requests = []
+
+    def handler(request):
+        requests.append(batch_addresses(request))
+        return httpx.Response(200, json={'pairs': [pair(address) for address in batch_addresses(request)]})
+
+    async def scenario():
+        client = make_client(handler)
+        client.cache.put(cache_key('tokens', 'A'), httpx.Response(200, json={'pairs': [pair('A')]}))
+        return await client.tokens_pairs_batch(['A', 'B'])
+
+    result = asyncio.run(scenario())
+    assert requests == [['B']]
+    assert set(result) == {'A', 'B'}
+
+def test_server_errors_open_breaker_and_stop_requests():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(503)
+
+    async def scenario():
+        client = make_client(handler)
+        for _ in range(client.breaker.failure_threshold):
+            await client.get('https://api.test/x', lane=dex_client.LANE_BACKGROUND)
+        try:
+            await client.get('https://api.test/x', lane=dex_client.LANE_BACKGROUND)
+        except dex_client.CircuitOpenError:
+            return True
+        return False
+
+    assert asyncio.run(scenario())
+    assert len(requests) == CircuitBreaker().failure_threshold
+
+def test_slow_interactive_request_is_hedged():
+    calls = {'count': 0}
+
+    async def handler(request):
+        calls['count'] += 1
+        if calls['count'] == 1:
+            await asyncio.sleep(5)
+        return httpx.Response(200, json={'call': calls['count']})
+
+    async def scenario():
+        client = make_client(handler)
+        client.hedge_delay = lambda: 0.05
+        response = await asyncio.wait_for(client.get('https://api.test/x'), timeout=2)
+        return response, client.stats
+
+    response, stats = asyncio.run(scenario())
+    assert response.json() == {'call': 2}
+    assert stats == {'hedged': 1, 'hedge_won': 1}
+
+def test_no_hedge_while_breaker_is_not_closed():
+    calls = {'count': 0}
+
+    async def handler(request):
+        calls['count'] += 1
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, json={})
+
+    async def scenario():
+        client = make_client(handler)
+        client.hedge_delay = lambda: 0.01
+        client.breaker.state = STATE_HALF_OPEN
+        await client._hedged_send('https://api.test/x', None, None)
+        return client.stats
+
+    assert asyncio.run(scenario())['hedged'] == 0
+    assert calls['count'] == 1
+
+def test_client_falls_back_to_http1_without_h2(monkeypatch):
+    # httpx ставится вместе с python-telegram-bot, а h2 - только с extra [http2]
+    monkeypatch.setitem(sys.modules, 'h2', None)
+    with pytest.raises(ImportError):
+        httpx.AsyncClient(http2=True)
+    monkeypatch.setattr(dex_client, 'h2', None)
+
+    client = dex_client.DexClient(RateLimiter(6000, 1), ResponseCache(ttl=60), CircuitBreaker())
+    pool = client._get_client()._transport._pool
+    assert not pool._http2
+    assert pool._http1
+    asyncio.run(client.aclose())
+
+def test_client_uses_http2_when_h2_is_installed():
+    pytest.importorskip('h2')
+    client = dex_client.DexClient(RateLimiter(6000, 1), ResponseCache(ttl=60), CircuitBreaker())
+    assert client._get_client()._transport._pool._http2
+    asyncio.run(client.aclose())
@@ -0,0 +1,72 @@
+import asyncio
+import importlib
+import types
+
+import pytest
+
+import shared_store
+
+class Bot:
+    def __init__(self):
+        self.documents = []
+        self.messages = []
+
+    async def send_document(self, **kwargs):
+        self.documents.append(kwargs['filename'])
+
+    async def send_message(self, **kwargs):
+        self.messages.append(kwargs['text'])
+
+@pytest.fixture
+def report(tmp_path, monkeypatch):
+    # token_storage загружает базу из текущего каталога при импорте
+    monkeypatch.chdir(tmp_path)
+    token_service = importlib.import_module('token_service')
+    store = shared_store.SharedStore(str(tmp_path / 'shared.sqlite'))
+    monkeypatch.setattr(shared_store, 'get_store', lambda: store)
+    monkeypatch.setattr(token_service, 'excel_report_key', None)
+
+    state = {'version': 1}
+    monkeypatch.setattr(token_service.token_storage, 'get_store_version', lambda: state['version'])
+    monkeypatch.setattr(token_service.token_storage, 'get_active_tokens', lambda: {'A': {'token_info': {'ticker': 'A'}}})
+
+    builds = []
+
+    def build_excel_report(active_tokens, filename):
+        builds.append(sorted(active_tokens))
+        with open(filename, 'wb') as report_file:
+            report_file.write(b'xlsx')
+
+    monkeypatch.setattr(token_service, 'build_excel_report', build_excel_report)
+    yield token_service, store, state, builds
+    store.close()
+
+def test_report_is_cached_by_store_and_tracker_versions(report):
+    token_service, store, state, builds = report
+    bot = Bot()
+    context = types.SimpleNamespace(bot=bot)
+
+    def generate():
+        asyncio.run(token_service.generate_excel(context, 1))
+
+    generate()
+    generate()
+    assert len(builds) == 1
+    assert len(bot.documents) == 2
+
+    # Изменилась база токенов бота
+    state['version'] = 2
+    generate()
+    assert len(builds) == 2
+
+    # Изменилась база трекера (сигналы каналов попадают в отчет)
+    store.merge(shared_store.NS_TRACKER, 'A', {'channels': ['c1']})
+    generate()
+    generate()
+    assert len(builds) == 3
+
+    # Изменения других пространств общей базы отчет не затрагивают
+    store.merge(shared_store.NS_TRACKER_TOKENS, 'B', {'channels': ['c1']})
+    generate()
+    assert len(builds) == 3
+    assert bot.messages == []
@@ -0,0 +1,124 @@
+import asyncio
+import importlib
+from urllib.parse import unquote
+
+import httpx
+import pytest
+
+import dex_client
+import fake_dexscreener
+from circuit_breaker import CircuitBreaker
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache
+
+ADDRESS = 'MigrateTokenAddress1111111111111111111pump'
+
+def market_handler(market, requests):
+    """Отвечает на запросы клиента данными FakeMarket, как fake_dexscreener."""
+    def handler(request):
+        path = unquote(request.url.path)
+        requests.append(path)
+        if path.startswith('/latest/dex/tokens/'):
+            pairs = []
+            for address in path[len('/latest/dex/tokens/'):].split(','):
+                if address in market.tokens:
+                    pairs.extend(market.pairs(address))
+            return httpx.Response(200, json={'pairs': pairs or None})
+        if path.startswith('/latest/dex/pairs/'):
+            chain_id, _, rest = path[len('/latest/dex/pairs/'):].partition('/')
+            pairs = [pair for pair in market.pairs_by_address(rest.split(',')) if pair['chainId'] == chain_id]
+            return httpx.Response(200, json={'pairs': pairs or None})
+        return httpx.Response(404)
+    return handler
+
+@pytest.fixture
+def pinning(tmp_path, monkeypatch):
+    # token_storage загружает базу из текущего каталога при импорте
+    monkeypatch.chdir(tmp_path)
+    token_service = importlib.import_module('token_service')
+
+    # Сценарий "migrate": сначала есть только пара pump.fun, через 50 секунд ликвидность
+    # переезжает в пару Raydium
+    market = fake_dexscreener.FakeMarket()
+    pairs = fake_dexscreener.make_pairs(ADDRESS, 'MIG', 0, 1)
+    pairs.reverse()
+    market.add_token(ADDRESS, 'MIG', 100_000, [(0, 1.0)], pairs)
+    market.tokens[ADDRESS]['migrate_at'] = 50
+
+    requests = []
+    client = dex_client.DexClient(RateLimiter(6000, 1, burst=100), ResponseCache(ttl=0), CircuitBreaker())
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(market_handler(market, requests)))
+    monkeypatch.setattr(dex_client, 'client', client)
+    return token_service, market, requests
+
+def check(token_service, data):
+    """Один обход: возвращает результат и закрепленную пару из изменений (если она сменилась)."""
+    changes = []
+    results = asyncio.run(token_service.check_market_caps_batch({'Q': data}, changes))
+    pins = [change['fields']['primary_pair'] for change in changes
+            if 'primary_pair' in (change.get('fields') or {})]
+    return results['Q'], pins
+
+def endpoints(requests):
+    return [path.split('/')[3] for path in requests]
+
+def test_pinned_pair_is_polled_and_repinned_after_migration(pinning):
+    token_service, market, requests = pinning
+    data = {'token_info': {'ticker': 'MIG', 'ticker_address': ADDRESS},
+            'initial_data': {'raw_market_cap': 50_000}}
+
+    # Первый обход: пары токена запрашиваются по адресу, основная пара закрепляется
+    result, pins = check(token_service, data)
+    assert endpoints(requests) == ['tokens']
+    assert result['raw_market_cap'] == 100_000
+    assert [pin['dex_id'] for pin in pins] == ['pumpfun']
+    data['primary_pair'] = pins[0]
+
+    # Пока ликвидность на месте, опрашивается только закрепленная пара
+    requests.clear()
+    result, pins = check(token_service, data)
+    assert endpoints(requests) == ['pairs']
+    assert requests[0].endswith(f"/solana/{data['primary_pair']['pair_address']}")
+    assert result['raw_market_cap'] == 100_000
+    assert pins == []
+
+    # Ликвидность и торговля ушли в пару Raydium: пара выбирается и закрепляется заново
+    market.started -= 60
+    requests.clear()
+    result, pins = check(token_service, data)
+    assert endpoints(requests) == ['pairs', 'tokens']
+    assert result is not None
+    assert [pin['dex_id'] for pin in pins] == ['raydium']
+    assert pins[0]['liquidity_usd'] > 0
+    data['primary_pair'] = pins[0]
+
+    requests.clear()
+    result, pins = check(token_service, data)
+    assert endpoints(requests) == ['pairs']
+    assert pins == []
+
+def test_stale_pin_is_reevaluated(pinning):
+    token_service, market, requests = pinning
+    data = {'token_info': {'ticker': 'MIG', 'ticker_address': ADDRESS}}
+    _, pins = check(token_service, data)
+    pin = dict(pins[0], pinned_at=pins[0]['pinned_at'] - token_service.PAIR_REEVALUATE_INTERVAL)
+    data['primary_pair'] = pin
+
+    # Закрепление устарело: пары снова запрашиваются по адресу, та же пара закрепляется с новым временем
+    requests.clear()
+    _, pins = check(token_service, data)
+    assert endpoints(requests) == ['tokens']
+    assert pins[0]['pair_address'] == pin['pair_address']
+    assert pins[0]['pinned_at'] > pin['pinned_at']
+
+def test_liquidity_migrated():
+    from token_service import _liquidity_migrated
+
+    pin = {'liquidity_usd': 1000, 'h1_txns': 10}
+    active = {'liquidity': {'usd': 900}, 'txns': {'h1': {'buys': 1, 'sells': 0}}}
+    assert not _liquidity_migrated(pin, active)
+    assert _liquidity_migrated(pin, None)
+    assert _liquidity_migrated(pin, dict(active, liquidity={'usd': 400}))
+    assert _liquidity_migrated(pin, dict(active, txns={'h1': {'buys': 0, 'sells': 0}}))
+    # Без данных о ликвидности при закреплении решает только торговля
+    assert not _liquidity_migrated({'liquidity_usd': None, 'h1_txns': 0}, {'liquidity': {}})
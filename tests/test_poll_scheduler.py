@@ -0,0 +1,85 @@
+import pytest
+
+import token_history
+from poll_scheduler import PollScheduler, poll_interval, MIN_POLL_INTERVAL, MAX_POLL_INTERVAL
+
+NOW = 1_000_000.0
+
+@pytest.fixture(autouse=True)
+def clean_history():
+    token_history.clear()
+    yield
+    token_history.clear()
+
+def token(age, initial=None, current=None, last_alert=1):
+    data = {'added_time': NOW - age, 'last_alert_multiplier': last_alert}
+    if initial is not None:
+        data['initial_data'] = {'raw_market_cap': initial}
+        data['token_info'] = {'raw_market_cap': current}
+    return data
+
+def test_new_tokens_are_due_immediately_and_removed_tokens_are_forgotten():
+    scheduler = PollScheduler()
+    scheduler.sync({'A': token(0), 'B': token(0)}, NOW)
+    assert len(scheduler) == 2
+
+    scheduler.sync({'A': token(0)}, NOW)
+    assert scheduler.pop_due(NOW) == ['A']
+    assert len(scheduler) == 0
+
+def test_pop_due_returns_most_overdue_first_and_respects_limit():
+    scheduler = PollScheduler()
+    scheduler._push('late', NOW - 5)
+    scheduler._push('later', NOW - 50)
+    scheduler._push('future', NOW + 5)
+    scheduler._push('now', NOW)
+
+    assert scheduler.pop_due(NOW, limit=2) == ['later', 'late']
+    assert scheduler.pop_due(NOW) == ['now']
+    assert scheduler.pop_due(NOW + 5) == ['future']
+
+def test_rescheduling_replaces_stale_heap_entry():
+    scheduler = PollScheduler()
+    scheduler._push('A', NOW)
+    scheduler._push('A', NOW + 100)
+    assert scheduler.pop_due(NOW) == []
+    assert scheduler.pop_due(NOW + 100) == ['A']
+
+def test_reschedule_uses_poll_interval():
+    scheduler = PollScheduler()
+    data = token(10 * 24 * 3600)
+    interval = scheduler.reschedule('A', data, NOW)
+    assert interval == MAX_POLL_INTERVAL
+    assert scheduler.pop_due(NOW + interval - 1) == []
+    assert scheduler.pop_due(NOW + interval) == ['A']
+
+@pytest.mark.parametrize('age, expected', [
+    (60, 10),
+    (2 * 3600, 30),
+    (12 * 3600, 60),
+    (2 * 24 * 3600, 180),
+    (30 * 24 * 3600, 600),
+])
+def test_base_interval_by_age(age, expected):
+    assert poll_interval('A', token(age), NOW) == expected
+
+def test_volatile_tokens_are_polled_more_often():
+    data = token(2 * 24 * 3600)
+    calm = poll_interval('A', data, NOW)
+    for index, fdv in enumerate([100, 130, 90, 140, 80, 150]):
+        token_history.record_sample('A', fdv, timestamp=NOW - 300 + index * 60)
+    assert poll_interval('A', data, NOW) < calm
+
+def test_tokens_near_next_multiplier_are_polled_more_often():
+    far = poll_interval('A', token(2 * 24 * 3600, initial=100, current=110), NOW)
+    near = poll_interval('A', token(2 * 24 * 3600, initial=100, current=195), NOW)
+    assert far == 180
+    assert near < far
+    # Уже отправленный x2 переносит цель на x3, и x1.95 больше не близко к порогу
+    after_alert = poll_interval('A', token(2 * 24 * 3600, initial=100, current=195, last_alert=2), NOW)
+    assert after_alert == 180
+
+def test_interval_is_clamped():
+    for index, fdv in enumerate([100, 300, 50, 400, 30, 500]):
+        token_history.record_sample('A', fdv, timestamp=NOW - 60 + index * 10)
+    assert poll_interval('A', token(60, initial=100, current=199), NOW) == MIN_POLL_INTERVAL
@@ -0,0 +1,142 @@
+import asyncio
+import types
+
+import httpx
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, LANE_INTERACTIVE, LANE_BACKGROUND, MIN_RATE_FRACTION
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.advance_on_sleep = True
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, delay):
+        # Ожидание сразу сдвигает время, но отдает управление другим задачам
+        if self.advance_on_sleep:
+            self.now += delay
+        await asyncio.sleep(0)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter, 'time', types.SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(rate_limiter, 'asyncio', types.SimpleNamespace(sleep=clock.sleep))
+    return clock
+
+def test_bucket_refills_at_rate_up_to_capacity(clock):
+    limiter = RateLimiter(60, cooldown=5, burst=3)
+    assert [limiter.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+    clock.now += 0.5
+    assert not limiter.try_acquire()
+    clock.now += 0.5
+    assert limiter.try_acquire()
+
+    # Долгий простой не накапливает больше burst токенов
+    clock.now += 100
+    assert [limiter.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+def test_acquire_waits_for_refill(clock):
+    limiter = RateLimiter(120, cooldown=5, burst=1)
+    started = clock.now
+
+    async def scenario():
+        for _ in range(3):
+            await limiter.acquire(LANE_BACKGROUND)
+
+    asyncio.run(scenario())
+    # Первый запрос из ведра, еще два - по одному на каждые полсекунды
+    assert clock.now - started == pytest.approx(1.0)
+    assert limiter.stats[LANE_BACKGROUND] == 3
+
+def test_interactive_lane_is_served_before_background(clock):
+    # Время сдвигается вручную, пока все запросы ждут в очереди
+    clock.advance_on_sleep = False
+    limiter = RateLimiter(60, cooldown=5, burst=1)
+    limiter.tokens = 0.0
+    order = []
+
+    async def request(lane, name):
+        await limiter.acquire(lane)
+        order.append(name)
+
+    async def scenario():
+        # Фоновые запросы встали в очередь раньше интерактивного
+        background = [asyncio.ensure_future(request(LANE_BACKGROUND, f"background{index}")) for index in range(2)]
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(request(LANE_INTERACTIVE, 'interactive'))
+        for _ in range(3):
+            await asyncio.sleep(0)
+        clock.now += 1
+        await interactive
+        clock.advance_on_sleep = True
+        await asyncio.gather(*background)
+
+    asyncio.run(scenario())
+    assert order[0] == 'interactive'
+    assert sorted(order[1:]) == ['background0', 'background1']
+
+def test_background_try_acquire_yields_to_waiting_interactive(clock):
+    limiter = RateLimiter(60, cooldown=5, burst=5)
+    limiter._waiting[LANE_INTERACTIVE] = 1
+    assert not limiter.try_acquire(LANE_BACKGROUND)
+    assert limiter.try_acquire(LANE_INTERACTIVE)
+    limiter._waiting[LANE_INTERACTIVE] = 0
+    assert limiter.try_acquire(LANE_BACKGROUND)
+
+def test_rate_limited_pauses_for_retry_after_and_halves_rate(clock):
+    limiter = RateLimiter(60, cooldown=5, burst=10)
+    limiter.on_rate_limited(retry_after=2)
+    assert limiter.rate == pytest.approx(0.5)
+    assert limiter.stats['rate_limited'] == 1
+
+    # Во время паузы токены копятся, но не выдаются
+    clock.now += 1.99
+    assert not limiter.try_acquire()
+    clock.now += 0.01
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+
+    # Без Retry-After пауза равна cooldown
+    limiter.on_rate_limited()
+    clock.now += 4.9
+    assert not limiter.try_acquire()
+    clock.now += 0.1
+    assert limiter.try_acquire()
+
+def test_rate_has_floor_and_recovers_after_successes(clock):
+    limiter = RateLimiter(60, cooldown=1, burst=10)
+    for _ in range(10):
+        limiter.on_rate_limited(retry_after=0)
+    assert limiter.rate == pytest.approx(limiter.max_rate * MIN_RATE_FRACTION)
+
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.rate == limiter.max_rate
+
+def test_client_reports_429_with_retry_after(clock):
+    import dex_client
+    from circuit_breaker import CircuitBreaker
+    from response_cache import ResponseCache
+
+    responses = [httpx.Response(429, headers={'Retry-After': '3'}), httpx.Response(200, json={})]
+    limiter = RateLimiter(60, cooldown=10, burst=10)
+    client = dex_client.DexClient(limiter, ResponseCache(ttl=60), CircuitBreaker())
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: responses.pop(0)))
+
+    async def scenario():
+        first = await client.get('https://api.test/a', lane=LANE_BACKGROUND)
+        started = clock.now
+        second = await client.get('https://api.test/b', lane=LANE_BACKGROUND)
+        return first.status_code, second.status_code, clock.now - started
+
+    first, second, waited = asyncio.run(scenario())
+    assert (first, second) == (429, 200)
+    # Второй запрос ждет Retry-After, а не cooldown
+    assert 3 <= waited < 10
+    assert limiter.stats['rate_limited'] == 1
@@ -0,0 +1,163 @@
+import asyncio
+
+import httpx
+import pytest
+
+from response_cache import ResponseCache, cache_key
+
+def ok(body=None):
+    return httpx.Response(200, json=body or {'pairs': []})
+
+class Fetcher:
+    """Считает вызовы и отдает ответ, когда открыт gate."""
+
+    def __init__(self, response=None):
+        self.calls = 0
+        self.gate = asyncio.Event()
+        self.response = response if response is not None else ok()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.gate.wait()
+        if isinstance(self.response, Exception):
+            raise self.response
+        return self.response
+
+def test_cache_key_normalizes_search_and_evm_addresses():
+    assert cache_key('search', '  PEPE ') == ('search', 'pepe')
+    assert cache_key('tokens', '0xABCdef') == ('tokens', '0xabcdef')
+    # Адреса Solana чувствительны к регистру
+    assert cache_key('tokens', 'So1AbC') == ('tokens', 'So1AbC')
+
+def test_concurrent_fetches_share_one_request():
+    async def scenario():
+        cache = ResponseCache(ttl=60)
+        fetcher = Fetcher()
+        key = cache_key('search', 'pepe')
+        first = asyncio.ensure_future(cache.fetch(key, fetcher))
+        second = asyncio.ensure_future(cache.fetch(key, fetcher))
+        await asyncio.sleep(0)
+        fetcher.gate.set()
+        results = await asyncio.gather(first, second)
+        # Третий запрос обслуживается из кэша
+        cached = await cache.fetch(key, fetcher)
+        return fetcher.calls, results, cached, cache
+
+    calls, (first, second), cached, cache = asyncio.run(scenario())
+    assert calls == 1
+    assert first is second is cached
+    assert cache.stats == {'hits': 1, 'coalesced': 1, 'misses': 1}
+
+def test_expired_response_is_fetched_again():
+    async def scenario():
+        cache = ResponseCache(ttl=0)
+        fetcher = Fetcher()
+        fetcher.gate.set()
+        key = cache_key('tokens', 'A')
+        await cache.fetch(key, fetcher)
+        await asyncio.sleep(0.01)
+        await cache.fetch(key, fetcher)
+        return fetcher.calls
+
+    assert asyncio.run(scenario()) == 2
+
+def test_error_responses_are_not_cached():
+    async def scenario():
+        cache = ResponseCache(ttl=60)
+        fetcher = Fetcher(httpx.Response(503))
+        fetcher.gate.set()
+        key = cache_key('tokens', 'A')
+        await cache.fetch(key, fetcher)
+        await cache.fetch(key, fetcher)
+        return fetcher.calls
+
+    assert asyncio.run(scenario()) == 2
+
+def test_cancelled_waiter_does_not_cancel_shared_request():
+    async def scenario():
+        cache = ResponseCache(ttl=60)
+        fetcher = Fetcher()
+        key = cache_key('tokens', 'A')
+        first = asyncio.ensure_future(cache.fetch(key, fetcher))
+        second = asyncio.ensure_future(cache.fetch(key, fetcher))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        fetcher.gate.set()
+        response = await second
+        return first, response, cache.get(key), fetcher.calls
+
+    first, response, cached, calls = asyncio.run(scenario())
+    assert first.cancelled()
+    assert response.status_code == 200
+    assert cached is response
+    assert calls == 1
+
+def test_fetcher_error_reaches_all_waiters_and_is_not_kept_inflight():
+    async def scenario():
+        cache = ResponseCache(ttl=60)
+        fetcher = Fetcher(httpx.ConnectError("down"))
+        key = cache_key('tokens', 'A')
+        waiters = [asyncio.ensure_future(cache.fetch(key, fetcher)) for _ in range(2)]
+        await asyncio.sleep(0)
+        fetcher.gate.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        return results, cache.pending(key)
+
+    results, pending = asyncio.run(scenario())
+    assert all(isinstance(result, httpx.ConnectError) for result in results)
+    assert pending is None
+
+def test_reserved_key_serves_waiting_fetch():
+    async def scenario():
+        cache = ResponseCache(ttl=60)
+        fetcher = Fetcher()
+        key = cache_key('tokens', 'A')
+        reserved = cache.reserve([key])
+        waiter = asyncio.ensure_future(cache.fetch(key, fetcher))
+        await asyncio.sleep(0)
+        response = ok({'pairs': [{'pairAddress': 'P'}]})
+        cache.resolve(reserved[key], response)
+        return await waiter, response, fetcher.calls, cache.pending(key)
+
+    result, response, calls, pending = asyncio.run(scenario())
+    assert result is response
+    assert calls == 0
+    assert pending is None
+
+def test_failed_reservation_falls_back_to_own_request():
+    async def scenario():
+        cache = ResponseCache(ttl=60)
+        fetcher = Fetcher()
+        fetcher.gate.set()
+        key = cache_key('tokens', 'A')
+        reserved = cache.reserve([key])
+        waiter = asyncio.ensure_future(cache.fetch(key, fetcher))
+        await asyncio.sleep(0)
+        cache.resolve(reserved[key], None)
+        return await waiter, fetcher.calls
+
+    response, calls = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert calls == 1
+
+def test_resolve_ignores_completed_reservation():
+    async def scenario():
+        cache = ResponseCache(ttl=60)
+        key = cache_key('tokens', 'A')
+        future = cache.reserve([key])[key]
+        response = ok()
+        cache.resolve(future, response)
+        cache.resolve(future, None)
+        return future.result(), response
+
+    result, response = asyncio.run(scenario())
+    assert result is response
+
+@pytest.mark.parametrize('max_entries', [1, 3])
+def test_cache_is_bounded(max_entries):
+    cache = ResponseCache(ttl=60, max_entries=max_entries)
+    for index in range(10):
+        cache.put(cache_key('tokens', f"A{index}"), ok())
+    assert len(cache._entries) == max_entries
+    assert cache.get(cache_key('tokens', 'A9')) is not None
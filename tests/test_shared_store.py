@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+import shared_store
+from shared_store import SharedStore, NS_TRACKER, NS_TRACKER_TOKENS
+
+@pytest.fixture
+def store(tmp_path):
+    store = SharedStore(str(tmp_path / 'shared.sqlite'))
+    yield store
+    store.close()
+
+def test_merge_keeps_fields_written_by_other_process(store):
+    # Второе соединение с той же базой - как процесс трекера
+    other = SharedStore(store.db_path)
+    try:
+        store.merge(NS_TRACKER, 'A', {'channels': ['c1'], 'first_seen': 'x'})
+        other.merge(NS_TRACKER, 'A', {'channels': ['c1', 'c2'], 'message_id': 5})
+        assert store.get(NS_TRACKER, 'A') == {'channels': ['c1', 'c2'], 'first_seen': 'x', 'message_id': 5}
+
+        # put заменяет значение целиком
+        store.put(NS_TRACKER, 'A', {'channels': []})
+        assert other.get(NS_TRACKER, 'A') == {'channels': []}
+    finally:
+        other.close()
+
+def test_merge_many_and_get_many(store):
+    assert store.merge_many(NS_TRACKER, {f"K{index}": {'index': index} for index in range(1200)}) == 1200
+    assert store.merge_many(NS_TRACKER, {'K1': {'extra': True}}) == 1
+    assert store.get(NS_TRACKER, 'K1') == {'index': 1, 'extra': True}
+
+    # Ключей больше лимита параметров одного запроса SQLite: чтение пачками
+    result = store.get_many(NS_TRACKER, [f"K{index}" for index in range(0, 1300, 2)])
+    assert len(result) == 600
+    assert 'K1200' not in result
+    assert store.get_many(NS_TRACKER, []) == {}
+    assert store.count(NS_TRACKER) == 1200
+
+def test_update_fields_only_changes_existing_keys(store):
+    store.put(NS_TRACKER, 'A', {'channels': ['c1'], 'sent': False})
+    version = store.version(NS_TRACKER)
+
+    assert store.update_fields(NS_TRACKER, 'A', {'sent': True})
+    assert store.get(NS_TRACKER, 'A') == {'channels': ['c1'], 'sent': True}
+    assert store.version(NS_TRACKER) == version + 1
+
+    assert not store.update_fields(NS_TRACKER, 'missing', {'sent': True})
+    assert not store.contains(NS_TRACKER, 'missing')
+    assert store.version(NS_TRACKER) == version + 1
+
+def test_versions_are_counted_per_namespace(store):
+    other = SharedStore(store.db_path)
+    try:
+        assert store.version(NS_TRACKER) == 0
+        store.merge(NS_TRACKER, 'A', {'channels': ['c1']})
+        store.merge(NS_TRACKER_TOKENS, 'B', {'channels': ['c1']})
+        store.merge(NS_TRACKER_TOKENS, 'C', {'channels': ['c1']})
+        assert store.version(NS_TRACKER) == 1
+        assert store.version(NS_TRACKER_TOKENS) == 2
+
+        # Изменения другого процесса видны по версии
+        other.delete(NS_TRACKER, 'A')
+        assert store.version(NS_TRACKER) == 2
+        assert store.items(NS_TRACKER) == {}
+
+        # Удаление отсутствующего ключа и пустая пачка версию не меняют
+        assert not store.delete(NS_TRACKER, 'A')
+        assert store.merge_many(NS_TRACKER, {}) == 0
+        assert store.version(NS_TRACKER) == 2
+    finally:
+        other.close()
+
+def test_import_json_file_runs_once_for_empty_namespace(store, tmp_path):
+    path = tmp_path / 'tokens.json'
+    path.write_text(json.dumps({
+        'tracked': {'channels': ['c1']},
+        'bot_token': {'token_info': {'ticker': 'T'}},
+        'broken': 'not a record',
+    }), encoding='utf-8')
+
+    assert store.import_json_file(NS_TRACKER_TOKENS, str(path), accept=shared_store.is_tracker_record) == 1
+    assert store.items(NS_TRACKER_TOKENS) == {'tracked': {'channels': ['c1']}}
+
+    # Повторный запуск не восстанавливает удаленные после переноса записи
+    store.delete(NS_TRACKER_TOKENS, 'tracked')
+    store.merge(NS_TRACKER_TOKENS, 'new', {'channels': ['c2']})
+    assert store.import_json_file(NS_TRACKER_TOKENS, str(path)) == 0
+    assert list(store.items(NS_TRACKER_TOKENS)) == ['new']
+
+def test_import_json_file_ignores_missing_and_invalid_files(store, tmp_path):
+    assert store.import_json_file(NS_TRACKER, str(tmp_path / 'missing.json')) == 0
+    path = tmp_path / 'broken.json'
+    path.write_text('{"A": ', encoding='utf-8')
+    assert store.import_json_file(NS_TRACKER, str(path)) == 0
+    path.write_text('[1, 2]', encoding='utf-8')
+    assert store.import_json_file(NS_TRACKER, str(path)) == 0
+    assert store.version(NS_TRACKER) == 0
+
+def test_is_tracker_record():
+    assert shared_store.is_tracker_record({'channels': []})
+    assert not shared_store.is_tracker_record({'channels': [], 'token_info': {}})
+    assert not shared_store.is_tracker_record({'token_info': {}})
@@ -0,0 +1,89 @@
+import asyncio
+import importlib
+import types
+
+import pytest
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    # token_storage загружает базу из текущего каталога при импорте
+    monkeypatch.chdir(tmp_path)
+    token_service = importlib.import_module('token_service')
+
+    stored = {'T': {'token_info': {'ticker': 'T'}, 'chat_id': 1, 'last_alert_multiplier': 1}}
+
+    def bulk_update(changes):
+        for change in changes:
+            stored[change['query']].update(change.get('fields') or {})
+        return len(changes)
+
+    monkeypatch.setattr(token_service.token_storage, 'get_token_data', lambda query: dict(stored[query]))
+    monkeypatch.setattr(token_service.token_storage, 'bulk_update', bulk_update)
+
+    async def check_market_caps_batch(tokens, changes):
+        return {query: {'market_cap': '$3', 'current_multiplier': 3, 'send_notification': True} for query in tokens}
+
+    monkeypatch.setattr(token_service, 'check_market_caps_batch', check_market_caps_batch)
+    return token_service, stored
+
+class Bot:
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.sent = []
+
+    async def send_message(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        self.sent.append(kwargs['text'])
+
+def test_alert_is_recorded_before_sending(service):
+    token_service, stored = service
+    bot = Bot(delay=1)
+    snapshot = {'T': dict(stored['T'])}
+
+    async def scenario():
+        chunk = asyncio.ensure_future(token_service._sweep_chunk(snapshot, types.SimpleNamespace(bot=bot), []))
+        await asyncio.sleep(0.05)
+        # Обход отменен по сроку во время отправки
+        chunk.cancel()
+        await asyncio.gather(chunk, return_exceptions=True)
+        assert stored['T']['last_alert_multiplier'] == 3
+
+        # Следующий обход с устаревшими данными пачки уведомление не повторяет
+        bot.delay = 0
+        await token_service._sweep_chunk(snapshot, types.SimpleNamespace(bot=bot), [])
+
+    asyncio.run(scenario())
+    assert bot.sent == []
+
+def test_failed_send_restores_previous_multiplier(service):
+    token_service, stored = service
+    bot = Bot(error=RuntimeError("network"))
+
+    asyncio.run(token_service._sweep_chunk({'T': dict(stored['T'])}, types.SimpleNamespace(bot=bot), []))
+    assert stored['T']['last_alert_multiplier'] == 1
+
+    bot.error = None
+    asyncio.run(token_service._sweep_chunk({'T': dict(stored['T'])}, types.SimpleNamespace(bot=bot), []))
+    assert len(bot.sent) == 1
+    assert stored['T']['last_alert_multiplier'] == 3
+
+def test_market_cap_update_uses_history_stats(service, monkeypatch):
+    token_service, stored = service
+    monkeypatch.setattr(token_service.token_history, '_histories', {})
+    monkeypatch.setattr(token_service.token_storage, 'record_market_cap', token_service.token_history.record_sample)
+    # Пик между обходами (например, при ручном обновлении)
+    token_service.token_history.record_sample('T', 500, timestamp=1000.0)
+
+    data = {'token_info': {'ticker': 'T'}, 'initial_data': {'raw_market_cap': 100}, 'last_alert_multiplier': 1}
+    changes = []
+    result = token_service._apply_market_cap('T', data, {'fdv': 250}, changes)
+
+    assert result['multiplier'] == 2.5
+    assert result['current_multiplier'] == 2
+    assert result['send_notification']
+    assert result['drawdown'] == 0.5
+    assert changes[0]['ath_market_cap'] == 500
+    assert changes[0]['ath_time'] == 1000.0
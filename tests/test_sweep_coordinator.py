@@ -0,0 +1,178 @@
+import asyncio
+
+import sweep_coordinator
+from sweep_coordinator import SweepCoordinator
+
+def make_tokens(count):
+    return {f"T{index}": {'index': index} for index in range(count)}
+
+def test_processes_all_tokens_in_chunks_with_bounded_concurrency():
+    seen = []
+    active = {'now': 0, 'max': 0}
+
+    async def process(chunk):
+        active['now'] += 1
+        active['max'] = max(active['max'], active['now'])
+        await asyncio.sleep(0.01)
+        seen.append(list(chunk))
+        active['now'] -= 1
+
+    async def scenario():
+        coordinator = SweepCoordinator(concurrency=2, chunk_size=3)
+        tokens = make_tokens(10)
+        processed = await coordinator.run('full', list(tokens), tokens, process, deadline=5)
+        return coordinator, processed
+
+    coordinator, processed = asyncio.run(scenario())
+    assert sorted(processed) == sorted(make_tokens(10))
+    assert sorted(len(chunk) for chunk in seen) == [1, 3, 3, 3]
+    assert active['max'] == 2
+    assert coordinator.backlog == []
+    assert coordinator.stats()['last_processed'] == 10
+
+def test_unknown_queries_are_ignored():
+    chunks = []
+
+    async def process(chunk):
+        chunks.append(chunk)
+
+    async def scenario():
+        coordinator = SweepCoordinator()
+        return await coordinator.run('monitor', ['T0', 'gone'], make_tokens(1), process, deadline=5)
+
+    assert asyncio.run(scenario()) == ['T0']
+    assert chunks == [{'T0': {'index': 0}}]
+
+def test_deadline_carries_unfinished_tokens_over_first():
+    async def slow_second_chunk(chunk):
+        if 'T2' in chunk:
+            await asyncio.sleep(10)
+
+    async def scenario():
+        coordinator = SweepCoordinator(concurrency=2, chunk_size=2)
+        tokens = make_tokens(4)
+        processed = await coordinator.run('monitor', list(tokens), tokens, slow_second_chunk, deadline=0.05)
+        first_backlog = list(coordinator.backlog)
+        stats = coordinator.stats()
+
+        order = []
+
+        async def record(chunk):
+            order.extend(chunk)
+
+        await coordinator.run('monitor', ['T0'], tokens, record, deadline=5)
+        return processed, first_backlog, stats, order, coordinator.backlog
+
+    processed, first_backlog, stats, order, backlog = asyncio.run(scenario())
+    assert processed == ['T0', 'T1']
+    assert first_backlog == ['T2', 'T3']
+    assert stats['deadline_exceeded'] == 1
+    assert stats['last_carried_over'] == 2
+    # Токены из backlog обрабатываются раньше новых
+    assert order == ['T2', 'T3', 'T0']
+    assert backlog == []
+
+def test_cancelled_chunk_is_cancelled_not_left_running():
+    state = {'finished': False}
+
+    async def process(chunk):
+        await asyncio.sleep(0.2)
+        state['finished'] = True
+
+    async def scenario():
+        coordinator = SweepCoordinator()
+        await coordinator.run('monitor', ['T0'], make_tokens(1), process, deadline=0.01)
+        await asyncio.sleep(0.3)
+
+    asyncio.run(scenario())
+    assert not state['finished']
+
+def test_failing_chunk_counts_as_processed():
+    async def process(chunk):
+        raise RuntimeError("boom")
+
+    async def scenario():
+        coordinator = SweepCoordinator(chunk_size=2)
+        tokens = make_tokens(3)
+        processed = await coordinator.run('full', list(tokens), tokens, process, deadline=5)
+        return processed, coordinator.backlog
+
+    processed, backlog = asyncio.run(scenario())
+    assert sorted(processed) == ['T0', 'T1', 'T2']
+    assert backlog == []
+
+def test_overlapping_run_is_skipped():
+    async def process(chunk):
+        await asyncio.sleep(0.05)
+
+    async def scenario():
+        coordinator = SweepCoordinator()
+        tokens = make_tokens(2)
+        first = asyncio.ensure_future(coordinator.run('full', list(tokens), tokens, process, deadline=5))
+        await asyncio.sleep(0)
+        skipped = await coordinator.run('full', list(tokens), tokens, process, deadline=5)
+        return skipped, await first, coordinator.stats()
+
+    skipped, first, stats = asyncio.run(scenario())
+    assert skipped is None
+    assert sorted(first) == ['T0', 'T1']
+    assert stats['skipped'] == 1
+    assert stats['running'] is None
+
+def test_full_sweep_does_not_block_monitor_sweep():
+    release = None
+
+    async def slow(chunk):
+        await release.wait()
+
+    async def fast(chunk):
+        pass
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        tokens = make_tokens(2)
+        full = asyncio.ensure_future(sweep_coordinator.full_coordinator.run('full', ['T0'], tokens, slow, deadline=5))
+        await asyncio.sleep(0)
+        busy = sweep_coordinator.monitor_coordinator.busy('monitor')
+        monitor = await sweep_coordinator.monitor_coordinator.run('monitor', ['T1'], tokens, fast, deadline=5)
+        release.set()
+        await full
+        return busy, monitor
+
+    busy, monitor = asyncio.run(scenario())
+    assert not busy
+    assert monitor == ['T1']
+
+def test_sweeps_do_not_process_the_same_token_concurrently():
+    release = None
+    monitored = []
+
+    async def slow(chunk):
+        await release.wait()
+
+    async def record(chunk):
+        monitored.extend(chunk)
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        in_flight = set()
+        full_coordinator = SweepCoordinator(in_flight=in_flight)
+        monitor_coordinator = SweepCoordinator(in_flight=in_flight)
+        tokens = make_tokens(2)
+        full = asyncio.ensure_future(full_coordinator.run('full', ['T0'], tokens, slow, deadline=5))
+        await asyncio.sleep(0)
+        processed = await monitor_coordinator.run('monitor', ['T0', 'T1'], tokens, record, deadline=5)
+        stats = monitor_coordinator.stats()
+        release.set()
+        await full
+        return processed, stats, monitor_coordinator.backlog, in_flight
+
+    processed, stats, backlog, in_flight = asyncio.run(scenario())
+    assert processed == ['T1']
+    assert monitored == ['T1']
+    assert stats['last_in_flight_skipped'] == 1
+    # Токен опросил другой обход - в backlog он не переносится
+    assert backlog == []
+    assert in_flight == set()
@@ -0,0 +1,39 @@
+import gzip
+from datetime import date, datetime
+
+from token_archive import TokenArchive
+
+def day_noon(day):
+    return datetime(day.year, day.month, day.day, 12).timestamp()
+
+def test_tokens_are_partitioned_by_added_day(tmp_path):
+    archive = TokenArchive(str(tmp_path / 'archive'))
+    first, second = date(2024, 1, 1), date(2024, 1, 2)
+    assert archive.append([
+        ('A', {'added_time': day_noon(first)}),
+        ('B', {'added_time': day_noon(second)}),
+    ], 'expired') == 2
+    # Повторная запись дописывает в партицию новый gzip-блок
+    archive.append([('C', {'added_time': day_noon(first)})], 'deleted')
+
+    assert archive.partitions() == [first, second]
+    assert [(entry['q'], entry['reason']) for entry in archive.iter_tokens(end=first)] == [
+        ('A', 'expired'), ('C', 'deleted'),
+    ]
+    assert [entry['q'] for entry in archive.iter_tokens(start=second)] == ['B']
+
+def test_empty_append_creates_nothing(tmp_path):
+    archive = TokenArchive(str(tmp_path / 'archive'))
+    assert archive.append([], 'expired') == 0
+    assert archive.partitions() == []
+
+def test_torn_block_keeps_earlier_records(tmp_path):
+    archive = TokenArchive(str(tmp_path / 'archive'))
+    day = date(2024, 1, 1)
+    archive.append([('A', {'added_time': day_noon(day)})], 'expired')
+    # Недописанный после сбоя gzip-блок
+    block = gzip.compress(b'{"q":"B","reason":"expired","d":{}}\n')
+    with open(archive._partition_path(day), 'ab') as partition:
+        partition.write(block[:len(block) // 2])
+
+    assert [entry['q'] for entry in archive.iter_tokens()] == ['A']
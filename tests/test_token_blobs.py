@@ -0,0 +1,39 @@
+import os
+
+from token_blobs import BlobStore
+
+def blob_files(directory):
+    return sorted(name for _, _, files in os.walk(directory) for name in files)
+
+def test_content_addressing_and_dedup(tmp_path):
+    store = BlobStore(str(tmp_path / 'blobs'))
+    first = store.put({'a': 1, 'b': [1, 2]})
+    # Порядок ключей не влияет на хэш
+    assert store.put({'b': [1, 2], 'a': 1}) == first
+    second = store.put({'a': 2})
+    assert second != first
+    assert len(first) == 64
+    assert blob_files(store.directory) == sorted([f"{first}.json.gz", f"{second}.json.gz"])
+
+    # Новый экземпляр (после перезапуска) читает те же файлы и не пишет их повторно
+    reopened = BlobStore(store.directory)
+    assert reopened.get(first) == {'a': 1, 'b': [1, 2]}
+    assert reopened.put({'a': 1, 'b': [1, 2]}) == first
+    assert len(blob_files(store.directory)) == 2
+
+def test_missing_blob_returns_none(tmp_path):
+    store = BlobStore(str(tmp_path / 'blobs'))
+    assert store.get('0' * 64) is None
+
+def test_prune_keeps_only_live_digests(tmp_path):
+    store = BlobStore(str(tmp_path / 'blobs'))
+    live = store.put({'live': True})
+    dead = store.put({'live': False})
+
+    assert store.prune([live]) == 1
+    assert store.get(live) == {'live': True}
+    assert store.get(dead) is None
+    # Удаленный ответ записывается заново, а не считается уже сохраненным
+    assert store.put({'live': False}) == dead
+    assert store.get(dead) == {'live': False}
+    assert BlobStore(str(tmp_path / 'missing')).prune([]) == 0
@@ -0,0 +1,80 @@
+import json
+import os
+
+import pytest
+
+import token_snapshot
+from token_journal import TokenJournal
+from token_record import TokenRecord
+
+@pytest.fixture(params=['json', 'binary'])
+def journal_path(request, tmp_path):
+    return str(tmp_path / 'tokens.json'), request.param
+
+def test_replays_batches_over_snapshot(journal_path):
+    path, snapshot_format = journal_path
+    journal = TokenJournal(path, snapshot_format=snapshot_format)
+    journal.append_batch({'A': {'x': 1}, 'B': {'x': 2}})
+    journal.append_batch({'A': {'x': 3}}, deletes=['B'])
+    journal.close()
+
+    assert TokenJournal(path, snapshot_format=snapshot_format).load() == {'A': {'x': 3}}
+
+def test_clear_and_legacy_field_entries_are_replayed(tmp_path):
+    path = str(tmp_path / 'tokens.json')
+    journal = TokenJournal(path)
+    journal.append_batch({'A': {'x': 1}})
+    journal.append_clear()
+    journal.append_batch({'B': {'x': 2}})
+    journal.close()
+    # Строка 'field' из журнала старой версии
+    with open(f"{path}.wal", 'a', encoding='utf-8') as log_file:
+        log_file.write(json.dumps({'op': 'field', 'q': 'B', 'f': 'y', 'v': 5}) + '\n')
+
+    assert TokenJournal(path).load() == {'B': {'x': 2, 'y': 5}}
+
+def test_torn_last_line_is_skipped(tmp_path):
+    path = str(tmp_path / 'tokens.json')
+    journal = TokenJournal(path)
+    journal.append_batch({'A': {'x': 1}})
+    journal.close()
+    with open(f"{path}.wal", 'a', encoding='utf-8') as log_file:
+        log_file.write('{"op": "set", "q": "B", "d": {')
+
+    assert TokenJournal(path).load() == {'A': {'x': 1}}
+
+def test_compaction_writes_snapshot_and_truncates_log(journal_path):
+    path, snapshot_format = journal_path
+    journal = TokenJournal(path, snapshot_format=snapshot_format)
+    journal.append_batch({'A': {'x': 1}})
+    data = {'A': TokenRecord({'x': 1, 'extra': [1, 2]}), 'B': TokenRecord({'x': 2})}
+    assert journal.compact(data, background=False)
+    journal.append_batch({'C': {'x': 3}})
+    journal.close()
+
+    assert not os.path.exists(journal.compacting_log_path)
+    if snapshot_format == 'binary':
+        assert token_snapshot.is_snapshot(journal.snapshot_path)
+    assert TokenJournal(path, snapshot_format=snapshot_format).load() == {
+        'A': {'x': 1, 'extra': [1, 2]}, 'B': {'x': 2}, 'C': {'x': 3},
+    }
+
+def test_interrupted_compaction_is_replayed(tmp_path):
+    path = str(tmp_path / 'tokens.json')
+    journal = TokenJournal(path)
+    journal.append_batch({'A': {'x': 1}})
+    journal.close()
+    # Сегмент отложен для сжатия, но снапшот так и не записан
+    os.replace(f"{path}.wal", f"{path}.wal.1")
+    journal = TokenJournal(path)
+    journal.append_batch({'B': {'x': 2}})
+    journal.close()
+
+    assert TokenJournal(path).load() == {'A': {'x': 1}, 'B': {'x': 2}}
+
+def test_binary_format_starts_from_existing_json_snapshot(tmp_path):
+    path = str(tmp_path / 'tokens.json')
+    with open(path, 'w', encoding='utf-8') as snapshot_file:
+        json.dump({'A': {'x': 1}}, snapshot_file)
+
+    assert TokenJournal(path, snapshot_format='binary').load() == {'A': {'x': 1}}
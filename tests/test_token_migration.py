@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+import shared_store
+from token_blobs import BlobStore
+from token_migration import Migration, iter_json_object
+from token_sqlite import SQLiteTokenEngine
+
+DATA = {
+    'Пепе': {'token_info': {'ticker': 'ПЕПЕ', 'raw_market_cap': 12345.678}, 'added_time': 1700000000},
+    'B': {'values': [1, -2.5e3, True, None, "строка с \"кавычками\" и \\"], 'empty': {}},
+    'C': 1234567890123,
+    'D': "🚀🚀🚀",
+}
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 64])
+def test_iter_json_object_handles_chunk_boundaries(tmp_path, chunk_size):
+    path = tmp_path / 'data.json'
+    # Отступы и многобайтовые символы UTF-8 попадают на границы блоков
+    path.write_text(json.dumps(DATA, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    items = list(iter_json_object(str(path), chunk_size=chunk_size))
+    assert [key for key, _, _ in items] == list(DATA)
+    assert {key: value for key, value, _ in items} == DATA
+    # Счетчик прочитанных байт не убывает и в конце равен размеру файла
+    progress = [bytes_read for _, _, bytes_read in items]
+    assert progress == sorted(progress)
+    assert progress[-1] <= path.stat().st_size
+
+def test_iter_json_object_empty_and_invalid(tmp_path):
+    path = tmp_path / 'data.json'
+    path.write_text(' {  } ', encoding='utf-8')
+    assert list(iter_json_object(str(path), chunk_size=2)) == []
+
+    path.write_text('[1, 2]', encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(iter_json_object(str(path)))
+
+    path.write_text('{"A": 1 "B": 2}', encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(iter_json_object(str(path)))
+
+@pytest.fixture
+def targets(tmp_path):
+    engine = SQLiteTokenEngine(str(tmp_path / 'tokens.sqlite'))
+    store = shared_store.SharedStore(str(tmp_path / 'shared.sqlite'))
+    yield engine, store
+    engine.close()
+    store.close()
+
+def make_migration(tmp_path, engine, store):
+    return Migration(engine, store, BlobStore(str(tmp_path / 'blobs')),
+                     state_path=str(tmp_path / 'state.json'), batch_size=3)
+
+def test_interrupted_stage_resumes_from_saved_progress(tmp_path, targets, monkeypatch):
+    engine, store = targets
+    tokens = {f"T{index}": {'added_time': index, 'token_info': {'ticker': f"t{index}"}} for index in range(10)}
+    # Запись трекера в старом общем файле не переносится в базу бота
+    tokens['tracker'] = {'channels': ['c1'], 'first_seen': 'x'}
+    json_path = tmp_path / 'tokens.json'
+    json_path.write_text(json.dumps(tokens), encoding='utf-8')
+
+    written = []
+    original_put_many = engine.put_many
+
+    def failing_put_many(items):
+        if len(written) == 2:
+            raise RuntimeError("сбой посреди переноса")
+        written.append(sorted(items))
+        return original_put_many(items)
+
+    monkeypatch.setattr(engine, 'put_many', failing_put_many)
+    migration = make_migration(tmp_path, engine, store)
+    with pytest.raises(RuntimeError):
+        migration.migrate_tokens(json_path=str(json_path), binary_path=str(tmp_path / 'missing.snap'))
+
+    state = json.loads((tmp_path / 'state.json').read_text(encoding='utf-8'))
+    assert state['tokens'] == {'done': 6, 'finished': False}
+    assert engine.count() == 6
+
+    # Повторный запуск читает прогресс из файла и продолжает с седьмой записи
+    written.clear()
+    resumed = make_migration(tmp_path, engine, store)
+    resumed.migrate_tokens(json_path=str(json_path), binary_path=str(tmp_path / 'missing.snap'))
+
+    assert written == [['T6', 'T7', 'T8'], ['T9']]
+    assert engine.count() == 10
+    assert not engine.contains('tracker')
+    assert engine.get('T9')['token_info']['ticker'] == 't9'
+    assert resumed.state['tokens'] == {'done': 10, 'finished': True}
+
+    # Завершенный этап больше не выполняется
+    written.clear()
+    make_migration(tmp_path, engine, store).migrate_tokens(json_path=str(json_path))
+    assert written == []
+
+def test_tracker_stage_moves_records_to_shared_store(tmp_path, targets):
+    engine, store = targets
+    tracker_path = tmp_path / 'tracker.json'
+    tracker_path.write_text(json.dumps({f"C{index}": {'channels': ['c']} for index in range(4)}), encoding='utf-8')
+
+    migration = make_migration(tmp_path, engine, store)
+    migration.migrate_tracker(path=str(tracker_path))
+    assert store.count(shared_store.NS_TRACKER) == 4
+    assert migration.state['tracker'] == {'done': 4, 'finished': True}
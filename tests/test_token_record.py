@@ -0,0 +1,78 @@
+import json
+
+from token_record import TokenRecord, MarketCapInfo, to_json
+from utils import format_number
+
+LEGACY = {
+    'last_update_time': 1700000100,
+    'message_id': 42,
+    'chat_id': -100,
+    'initial_data': {'time': '12:00:00', 'market_cap': '$10.00K', 'raw_market_cap': 10000},
+    'token_info': {
+        'ticker': 'PEPE',
+        'ticker_address': 'addr',
+        'market_cap': '$25.00K',
+        'raw_market_cap': 25000,
+        'volume_5m': '$1.00K',
+        'websites': [{'label': 'Website', 'url': 'https://example.com'}],
+    },
+    'last_alert_multiplier': 2,
+    'added_time': 1700000000,
+    'ath_market_cap': 30000,
+    'custom_field': {'nested': [1, 2]},
+}
+
+def test_json_round_trip_matches_legacy_dict():
+    record = TokenRecord.from_dict(LEGACY)
+    encoded = json.dumps({'A': record}, default=to_json)
+    decoded = json.loads(encoded)['A']
+
+    # Строки маркет капа не сохраняются - они вычисляются из чисел
+    assert 'market_cap' not in decoded['token_info']
+    assert TokenRecord.from_dict(decoded) == LEGACY
+    assert record == LEGACY
+    assert dict(record) == {key: record[key] for key in LEGACY}
+
+def test_from_dict_keeps_existing_record_and_nests_market_cap_info():
+    record = TokenRecord.from_dict(LEGACY)
+    assert TokenRecord.from_dict(record) is record
+    assert isinstance(record['token_info'], MarketCapInfo)
+    assert isinstance(record['added_time'], float)
+    assert record['custom_field'] == {'nested': [1, 2]}
+
+def test_market_cap_is_derived_from_raw_market_cap():
+    info = MarketCapInfo({'raw_market_cap': 1234567, 'market_cap': 'stale'})
+    assert info['market_cap'] == format_number(1234567.0)
+    assert info.market_cap == format_number(1234567.0)
+
+    info['raw_market_cap'] = 2000
+    assert info['market_cap'] == format_number(2000.0)
+    assert 'market_cap' not in info.to_dict()
+
+def test_market_cap_text_is_kept_without_raw_value():
+    info = MarketCapInfo({'market_cap': 'Неизвестно', 'raw_market_cap': 'n/a'})
+    assert info['market_cap'] == 'Неизвестно'
+    assert info.to_dict() == {'market_cap': 'Неизвестно', 'raw_market_cap': 'n/a'}
+
+    empty = MarketCapInfo()
+    assert 'market_cap' not in empty
+    assert empty.get('market_cap', '-') == '-'
+    assert empty.market_cap == 'Неизвестно'
+
+def test_copy_is_independent_at_top_level():
+    record = TokenRecord.from_dict(LEGACY)
+    clone = record.copy()
+    clone['hidden'] = True
+    clone['custom_field'] = 'changed'
+    assert 'hidden' not in record
+    assert record['custom_field'] == {'nested': [1, 2]}
+    # Вложенные данные общие - хранилище заменяет их целиком
+    assert clone['token_info'] is record['token_info']
+
+def test_missing_fields_behave_like_dict():
+    record = TokenRecord({'chat_id': 1})
+    assert 'hidden' not in record
+    assert record.get('hidden', False) is False
+    assert len(record) == 1
+    del record['chat_id']
+    assert record == {}
@@ -0,0 +1,127 @@
+import importlib
+import json
+import sqlite3
+
+import pytest
+
+from token_record import TokenRecord
+from token_sqlite import SQLiteTokenEngine
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = SQLiteTokenEngine(str(tmp_path / 'tokens.db'))
+    yield engine
+    engine.close()
+
+def token(added_time, ticker='T', address=None, hidden=False, chat_id=1):
+    return {
+        'added_time': added_time, 'hidden': hidden, 'chat_id': chat_id,
+        'token_info': {'ticker': ticker, 'ticker_address': address},
+    }
+
+def test_get_many_reads_in_chunks_and_skips_missing(engine):
+    engine.put_many({f"T{index}": {'index': index} for index in range(1200)})
+
+    result = engine.get_many([f"T{index}" for index in range(0, 1300, 2)])
+    assert len(result) == 600
+    assert result['T1198'] == {'index': 1198}
+    assert 'T1200' not in result
+
+def test_records_round_trip_and_index_columns_follow_updates(engine):
+    engine.put('A', TokenRecord(token(100, ticker='Abc', address='addr1')))
+    data = engine.get('A')
+    assert isinstance(data, TokenRecord)
+    assert data['token_info']['ticker'] == 'Abc'
+    assert engine.by_ticker('ABC') == ['A']
+    assert engine.by_address('addr1') == ['A']
+
+    engine.update_fields('A', {'token_info': {'ticker': 'New', 'ticker_address': 'addr2'}})
+    assert engine.by_ticker('abc') == []
+    assert engine.by_address('addr2') == ['A']
+    assert engine.update_fields('missing', {'x': 1}) is None
+
+def test_time_and_hidden_filters(engine):
+    engine.put_many({
+        'old': token(100),
+        'new': token(200),
+        'new_hidden': token(300, hidden=True),
+    })
+    assert sorted(engine.added_since(150)) == ['new']
+    assert sorted(engine.added_since(150, include_hidden=True)) == ['new', 'new_hidden']
+    assert engine.added_before(200) == ['old']
+    assert sorted(engine.all(include_hidden=False)) == ['new', 'old']
+    assert list(engine.hidden()) == ['new_hidden']
+    assert engine.count() == 3
+    assert engine.count(include_hidden=False) == 2
+
+def test_chat_ids_skip_empty_values(engine):
+    engine.put_many({'A': token(1, chat_id=5), 'B': token(1, chat_id=5), 'C': token(1, chat_id=0), 'D': token(1, chat_id=None)})
+    assert engine.chat_ids() == [5]
+
+def test_modify_many_rolls_back_on_error(engine):
+    engine.put_many({'A': token(1), 'B': token(1)})
+
+    def modify(query, data):
+        if query == 'B':
+            raise RuntimeError("boom")
+        data['hidden'] = True
+        return True
+
+    with pytest.raises(RuntimeError):
+        engine.modify_many(['A', 'B'], modify)
+    assert not engine.get('A').get('hidden')
+    assert engine.hidden() == {}
+
+    assert engine.modify_many(['A', 'B'], lambda query, data: query == 'A') == ['A']
+
+def test_delete_many_and_clear(engine):
+    engine.put_many({'A': token(1), 'B': token(1), 'C': token(1)})
+    assert engine.delete('A')
+    assert not engine.delete('A')
+    engine.delete_many(['B', 'missing'])
+    assert not engine.contains('B')
+    assert engine.clear() == 1
+    assert engine.count() == 0
+
+def test_migration_adds_address_column(tmp_path):
+    path = str(tmp_path / 'tokens.db')
+    # База первой версии схемы: без колонки address
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE tokens (query TEXT PRIMARY KEY, added_time REAL NOT NULL DEFAULT 0, "
+                 "hidden INTEGER NOT NULL DEFAULT 0, chat_id INTEGER, ticker TEXT, data TEXT NOT NULL)")
+    conn.execute("INSERT INTO tokens (query, added_time, ticker, data) VALUES (?, ?, ?, ?)",
+                 ('A', 1, 't', json.dumps(token(1, address='addr1'))))
+    conn.execute("INSERT INTO tokens (query, added_time, ticker, data) VALUES (?, ?, ?, ?)",
+                 ('broken', 1, 't', '{not json'))
+    conn.commit()
+    conn.close()
+
+    engine = SQLiteTokenEngine(path)
+    try:
+        assert engine.by_address('addr1') == ['A']
+        # Поврежденная запись не мешает переносу остальных
+        assert sorted(engine.by_ticker('t')) == ['A', 'broken']
+    finally:
+        engine.close()
+
+@pytest.fixture
+def sqlite_storage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('TOKEN_STORAGE_ENGINE', 'sqlite')
+    token_storage = importlib.reload(importlib.import_module('token_storage'))
+    yield token_storage
+    token_storage.close_storage()
+    # Возвращаем модулю хранилище по умолчанию для остальных тестов
+    monkeypatch.delenv('TOKEN_STORAGE_ENGINE')
+    importlib.reload(token_storage)
+
+def test_engine_is_selected_by_environment(sqlite_storage):
+    assert sqlite_storage.sqlite_engine is not None
+    assert sqlite_storage.sqlite_engine.db_path == sqlite_storage.SQLITE_DB_PATH
+
+    sqlite_storage.store_token_data('A', token(1, ticker='Abc', chat_id=0))
+    sqlite_storage.store_token_data('B', token(2, chat_id=7))
+    assert sqlite_storage.sqlite_engine.contains('A')
+    assert sqlite_storage.resolve_token_query('abc') == 'A'
+    # Как и в режиме JSON, пустые chat_id не попадают в рассылку
+    assert sqlite_storage.get_chat_ids() == [7]
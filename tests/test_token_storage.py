@@ -0,0 +1,305 @@
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import shared_store
+import token_history
+from token_blobs import BlobStore
+from token_journal import TokenJournal
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    # Пути хранилища относительные: все файлы создаются во временном каталоге
+    monkeypatch.chdir(tmp_path)
+    token_storage = importlib.import_module('token_storage')
+    if token_storage.sqlite_engine is not None:
+        pytest.skip("тест для хранилища в памяти с журналом")
+    monkeypatch.setattr(token_storage, 'token_data_store', {})
+    for name, value in (('_time_index', []), ('_ticker_index', {}), ('_address_index', {}),
+                        ('_indexed_keys', {}), ('_views', {}), ('_shared_records', set()), ('_dirty_tokens', set())):
+        monkeypatch.setattr(token_storage, name, value)
+    # Бинарный снапшот сериализуется по записям в Python, поэтому гонка с записью проявляется в нем
+    monkeypatch.setattr(token_storage, 'journal', TokenJournal(token_storage.JSON_DB_PATH, snapshot_format='binary'))
+    # Известные хэши ответов API относятся к каталогу прошлого теста
+    monkeypatch.setattr(token_storage, 'blob_store', BlobStore(token_storage.RAW_API_BLOB_DIR))
+    # Общая база открывается при первом обращении - в том же временном каталоге
+    monkeypatch.setattr(shared_store, '_store', None)
+    yield token_storage
+    # Сбрасываем отложенные записи, пока текущий каталог - временный
+    token_storage.flush()
+    token_storage.journal.close()
+    if shared_store._store is not None:
+        shared_store._store.close()
+
+def test_compaction_is_not_broken_by_concurrent_writes(storage, caplog):
+    stop = threading.Event()
+
+    def writer():
+        index = 0
+        while not stop.is_set():
+            storage.store_token_data(f"q{index}", {'token_info': {'ticker': 'T', 'ticker_address': f"A{index}"}})
+            storage.update_token_field(f"q{index}", f"field{index % 5}", index)
+            if index % 3 == 0:
+                storage.remove_token_data(f"q{index - 1}")
+            index += 1
+
+    thread = threading.Thread(target=writer)
+    # Частое переключение потоков, чтобы запись попадала внутрь сериализации снапшота
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    with caplog.at_level(logging.ERROR):
+        thread.start()
+        try:
+            for _ in range(30):
+                storage.save_data_to_disk(background=False)
+        finally:
+            stop.set()
+            thread.join()
+            sys.setswitchinterval(switch_interval)
+
+    assert not [record for record in caplog.records if 'снапшот' in record.getMessage()]
+
+def test_expired_and_deleted_tokens_are_archived(storage):
+    now = time.time()
+    storage.store_token_data('old', {'added_time': now - storage.TOKEN_RETENTION_PERIOD - 60, 'token_info': {'ticker': 'OLD'}})
+    storage.store_token_data('fresh', {'added_time': now, 'token_info': {'ticker': 'NEW'}})
+    storage.store_token_data('gone', {'added_time': now, 'token_info': {'ticker': 'GONE'}})
+
+    assert storage.clean_expired_tokens() == ['old']
+    assert storage.remove_token_data('gone')
+
+    archived = {entry['q']: entry for entry in storage.archive.iter_tokens()}
+    assert {query: entry['reason'] for query, entry in archived.items()} == {'old': 'expired', 'gone': 'deleted'}
+    assert archived['old']['d']['token_info'] == {'ticker': 'OLD'}
+    assert storage.get_token_data('old') is None
+    assert storage.get_token_data('fresh') is not None
+
+def test_tracker_records_are_moved_to_shared_store(storage):
+    with open(storage.JSON_DB_PATH, 'w', encoding='utf-8') as snapshot_file:
+        json.dump({
+            'bot': {'added_time': 1, 'token_info': {'ticker': 'BOT'}},
+            'Contract1': {'channels': ['c1'], 'channel_count': 1},
+        }, snapshot_file)
+
+    storage.load_data_from_disk()
+    assert list(storage.token_data_store) == ['bot']
+    assert storage.find_tokens_by_ticker('bot') == ['bot']
+    store = shared_store.get_store()
+    assert store.get(shared_store.NS_TRACKER_TOKENS, 'Contract1') == {'channels': ['c1'], 'channel_count': 1}
+
+    # При сбросе запись трекера удаляется из журнала бота
+    storage.flush()
+    assert 'Contract1' not in storage.journal.load()
+
+def test_market_cap_history_is_kept_only_for_tracked_tokens(storage, monkeypatch):
+    monkeypatch.setattr(token_history, '_histories', {})
+    storage.store_token_data('tracked', {'token_info': {'ticker': 'T'}})
+
+    storage.record_market_cap('tracked', 100.0, 5.0)
+    storage.record_market_cap('lookup', 200.0)
+    assert token_history.get_history('tracked').last()[1:] == (100.0, 5.0)
+    assert token_history.get_history('lookup') is None
+
+    storage.remove_token_data('tracked')
+    assert token_history.get_history('tracked') is None
+
+def test_every_mutation_publishes_a_new_snapshot(storage):
+    storage.store_token_data('A', {'token_info': {'ticker': 'A'}, 'ath_market_cap': 1})
+    mutations = [
+        (lambda: storage.update_token_field('A', 'n', 1), lambda view: view['A']['n'] == 1),
+        (lambda: storage.update_token_ath('A', 5), lambda view: view['A']['ath_market_cap'] == 5),
+        (lambda: storage.bulk_update([{'query': 'A', 'fields': {'n': 2}}]), lambda view: view['A']['n'] == 2),
+        (lambda: storage.hide_token('A'), lambda view: view['A']['hidden']),
+        (lambda: storage.unhide_token('A'), lambda view: not view['A']['hidden']),
+        (lambda: storage.bulk_store({'B': {'token_info': {'ticker': 'B'}}}), lambda view: 'B' in view),
+        (lambda: storage.remove_token_data('B'), lambda view: 'B' not in view),
+    ]
+    for mutate, check in mutations:
+        before = storage.get_snapshot()
+        mutate()
+        after = storage.get_snapshot()
+        assert after.version != before.version
+        assert check(after)
+    # Без изменений представление переиспользуется
+    assert storage.get_snapshot() is after
+    assert not storage.update_token_ath('A', 3)
+    assert storage.get_snapshot() is after
+
+def assert_indexes_match_store(storage):
+    # Индексы после любой последовательности изменений совпадают с построенными заново
+    actual = (list(storage._time_index), storage._ticker_index, storage._address_index, dict(storage._indexed_keys))
+    storage._rebuild_indexes()
+    expected = (list(storage._time_index), storage._ticker_index, storage._address_index, dict(storage._indexed_keys))
+    assert actual == expected
+
+def test_time_index_follows_changes(storage):
+    now = time.time()
+    old = now - storage.TOKEN_RETENTION_PERIOD - 60
+    storage.store_token_data('old', {'added_time': old})
+    storage.store_token_data('new', {'added_time': now})
+    storage.bulk_store({'hidden': {'added_time': now - 10}})
+    storage.hide_token('hidden')
+    assert_indexes_match_store(storage)
+
+    assert storage.get_tokens_added_before(now - 60) == ['old']
+    assert list(storage.get_active_tokens()) == ['new']
+    assert list(storage.get_tokens_added_since(now - 60, include_hidden=True)) == ['hidden', 'new']
+
+    # Изменение added_time переносит токен в индексе
+    storage.update_token_field('new', 'added_time', old - 1)
+    assert storage.get_tokens_added_before(now - 60) == ['new', 'old']
+    storage.bulk_update([{'query': 'new', 'fields': {'added_time': now}}])
+    assert_indexes_match_store(storage)
+
+    assert storage.clean_expired_tokens() == ['old']
+    storage.remove_token_data('hidden')
+    assert storage.get_tokens_added_before(now + 60) == ['new']
+    assert_indexes_match_store(storage)
+
+    storage.delete_all_tokens()
+    assert storage._time_index == []
+
+def token_with(ticker, address, added_time):
+    return {'added_time': added_time, 'token_info': {'ticker': ticker, 'ticker_address': address}}
+
+def test_ticker_and_address_indexes_follow_changes(storage):
+    storage.store_token_data('q1', token_with('Pepe', 'addr1', 100))
+    storage.store_token_data('q2', token_with('PEPE', 'addr2', 200))
+    assert sorted(storage.find_tokens_by_ticker('pepe')) == ['q1', 'q2']
+    assert storage.find_tokens_by_address('addr1') == ['q1']
+
+    # Новые token_info переносят токен в индексах
+    storage.bulk_update([{'query': 'q1', 'token_info': {'ticker': 'Dog', 'ticker_address': 'addr3'}}])
+    assert storage.find_tokens_by_ticker('pepe') == ['q2']
+    assert storage.find_tokens_by_ticker('DOG') == ['q1']
+    assert storage.find_tokens_by_address('addr1') == []
+    assert storage.find_tokens_by_address('addr3') == ['q1']
+
+    # Скрытие токен из индексов не убирает
+    storage.hide_token('q2')
+    assert storage.find_tokens_by_ticker('pepe') == ['q2']
+    assert_indexes_match_store(storage)
+
+    storage.delete_token('q2')
+    assert storage.find_tokens_by_ticker('pepe') == []
+    assert storage.find_tokens_by_address('addr2') == []
+    assert_indexes_match_store(storage)
+
+def test_resolve_token_query(storage):
+    storage.store_token_data('first', token_with('Pepe', 'addr1', 100))
+    storage.store_token_data('second', token_with('pepe', 'addr2', 200))
+    storage.store_token_data('addr9', token_with('Key', 'addr1', 50))
+
+    # Ключ хранилища важнее совпадений по индексам
+    assert storage.resolve_token_query('addr9') == 'addr9'
+    # При дубликатах выбирается токен, добавленный последним
+    assert storage.resolve_token_query('PEPE') == 'second'
+    assert storage.resolve_token_query('addr1') == 'first'
+    # Адрес проверяется раньше тикера
+    storage.store_token_data('tricky', token_with('addr2', 'addr7', 300))
+    assert storage.resolve_token_query('addr2') == 'second'
+    assert storage.resolve_token_query('unknown') is None
+
+def test_raw_api_data_is_moved_to_blob_store(storage):
+    payload = {'pairAddress': 'P1', 'fdv': 100}
+    # Запись старого формата в снапшоте хранит ответ API целиком
+    with open(storage.JSON_DB_PATH, 'w', encoding='utf-8') as snapshot_file:
+        json.dump({'old': {'added_time': 1, 'token_info': {'ticker': 'OLD'}, 'raw_api_data': payload}}, snapshot_file)
+    storage.load_data_from_disk()
+
+    record = storage.get_token_data('old')
+    assert 'raw_api_data' not in record
+    assert storage.blob_store.get(record['raw_api_ref']) == payload
+    assert storage.get_raw_api_data(record) == payload
+
+    # Новые токены сохраняются со ссылкой; одинаковые ответы хранятся один раз
+    storage.store_token_data('new', {'token_info': {'ticker': 'NEW'}, 'raw_api_data': dict(payload)})
+    assert storage.get_token_data('new')['raw_api_ref'] == record['raw_api_ref']
+    storage.store_token_data('empty', {'token_info': {'ticker': 'E'}, 'raw_api_data': {}})
+    assert 'raw_api_ref' not in storage.get_token_data('empty')
+    assert storage.get_raw_api_data(storage.get_token_data('empty')) == {}
+
+    # Перенос записывается в журнал при сбросе
+    storage.flush()
+    assert storage.journal.load()['old']['raw_api_ref'] == record['raw_api_ref']
+
+def test_bulk_store_and_bulk_update_write_one_journal_batch(storage, monkeypatch):
+    batches = []
+    append_batch = storage.journal.append_batch
+
+    def recording_append_batch(upserts, deletes=()):
+        batches.append((sorted(upserts), list(deletes)))
+        return append_batch(upserts, deletes)
+
+    monkeypatch.setattr(storage.journal, 'append_batch', recording_append_batch)
+    assert storage.bulk_store({f"T{index}": token_with(f"t{index}", f"a{index}", 100 + index) for index in range(3)}) == 3
+    assert batches == [(['T0', 'T1', 'T2'], [])]
+
+    batches.clear()
+    updated = storage.bulk_update([
+        {'query': 'T0', 'token_info': {'raw_market_cap': 5000}, 'ath_market_cap': 5000, 'ath_time': 123},
+        {'query': 'T0', 'fields': {'last_alert_multiplier': 2}},
+        {'query': 'T1', 'ath_market_cap': 'n/a'},
+        {'query': 'missing', 'fields': {'hidden': True}},
+    ])
+    # T1 не изменился, а отсутствующий токен не создается
+    assert updated == 1
+    assert batches == [(['T0'], [])]
+    data = storage.get_token_data('T0')
+    assert data['token_info']['raw_market_cap'] == 5000
+    assert (data['ath_market_cap'], data['ath_time'], data['last_alert_multiplier']) == (5000, 123, 2)
+    assert storage.get_token_data('missing') is None
+    assert storage.bulk_update([]) == 0
+
+def test_bulk_update_failure_leaves_batch_unapplied(storage, monkeypatch):
+    storage.bulk_store({'A': token_with('a', 'addr1', 100), 'B': token_with('b', 'addr2', 200)})
+    before = storage.get_snapshot()
+    version = storage.get_store_version()
+    batches = []
+    monkeypatch.setattr(storage.journal, 'append_batch', lambda upserts, deletes=(): batches.append(upserts))
+
+    with pytest.raises(TypeError):
+        storage.bulk_update([
+            {'query': 'A', 'token_info': {'ticker': 'changed'}, 'fields': {'hidden': True}},
+            # token_info должен быть словарем: ошибка во второй записи пачки
+            {'query': 'B', 'token_info': 5},
+        ])
+
+    # Первая запись пачки тоже не применена: ни в памяти, ни в журнале, ни в индексах
+    assert storage.get_token_data('A')['token_info']['ticker'] == 'a'
+    assert not storage.get_token_data('A').get('hidden')
+    assert storage.resolve_token_query('changed') is None
+    assert storage.get_store_version() == version
+    assert storage.get_snapshot() is before
+    storage.flush()
+    assert batches == []
+    assert_indexes_match_store(storage)
+
+def test_excel_file_is_rebuilt_only_after_changes(storage, monkeypatch):
+    monkeypatch.setattr(storage, 'excel_version', None)
+    storage.store_token_data('A', token_with('a', 'addr1', 100))
+    builds = []
+    prepare_excel_data = storage.prepare_excel_data
+    monkeypatch.setattr(storage, 'prepare_excel_data', lambda query, data: builds.append(query) or prepare_excel_data(query, data))
+
+    path = storage.get_excel_all_tokens()
+    assert builds == ['A']
+    # Без изменений хранилища отдается уже собранный файл
+    assert storage.get_excel_all_tokens() == path
+    assert builds == ['A']
+
+    storage.update_token_field('A', 'hidden', True)
+    storage.get_excel_all_tokens()
+    assert builds == ['A', 'A']
+
+    # Удаленный файл собирается заново, даже если версия не менялась
+    os.remove(path)
+    storage.get_excel_all_tokens()
+    assert builds == ['A', 'A', 'A']
+    assert os.path.exists(path)
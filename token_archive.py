@@ -0,0 +1,101 @@
+import os
+import gzip
+import json
+import time
+import logging
+import threading
+from datetime import datetime, date
+from typing import Dict, Any, Optional, Iterable, Iterator, List, Tuple
+
+from token_record import to_json
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Каталог архива удаленных и истекших токенов
+ARCHIVE_DIR = "tokens_archive"
+
+# Формат имени файла партиции: tokens_ГГГГ-ММ-ДД.jsonl.gz
+PARTITION_PREFIX = "tokens_"
+PARTITION_SUFFIX = ".jsonl.gz"
+
+class TokenArchive:
+    """
+    Архив токенов, разбитый на файлы по дням.
+
+    Токен попадает в партицию по дате добавления (added_time), поэтому для анализа
+    за период достаточно прочитать только файлы нужных дней. Файлы только дописываются:
+    каждая запись архивации добавляется к файлу отдельным gzip-блоком одной строкой JSON
+    вида {"q": запрос, "reason": причина, "archived_at": время, "d": данные токена}.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _partition_path(self, day: date) -> str:
+        return os.path.join(self.directory, f"{PARTITION_PREFIX}{day.isoformat()}{PARTITION_SUFFIX}")
+
+    @staticmethod
+    def _partition_day(data: Dict[str, Any], archived_at: float) -> date:
+        added_time = data.get('added_time') or archived_at
+        try:
+            return datetime.fromtimestamp(float(added_time)).date()
+        except (TypeError, ValueError, OverflowError, OSError):
+            return datetime.fromtimestamp(archived_at).date()
+
+    def append(self, tokens: Iterable[Tuple[str, Dict[str, Any]]], reason: str) -> int:
+        """
+        Дописывает токены в партиции их дней. Каждая партиция открывается один раз за вызов.
+        Возвращает количество заархивированных токенов.
+        """
+        archived_at = time.time()
+        lines: Dict[date, List[str]] = {}
+        for query, data in tokens:
+            entry = {'q': query, 'reason': reason, 'archived_at': archived_at, 'd': data}
+            line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=to_json)
+            lines.setdefault(self._partition_day(data, archived_at), []).append(line)
+
+        if not lines:
+            return 0
+
+        count = 0
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            for day, day_lines in lines.items():
+                # Режим 'ab' добавляет к файлу новый gzip-блок, ранее записанные не переписываются
+                with gzip.open(self._partition_path(day), 'ab') as partition:
+                    partition.write(('\n'.join(day_lines) + '\n').encode('utf-8'))
+                count += len(day_lines)
+        logger.info(f"В архив ({reason}) добавлено {count} токенов в {len(lines)} партиций")
+        return count
+
+    def partitions(self, start: Optional[date] = None, end: Optional[date] = None) -> List[date]:
+        """Возвращает отсортированный список дней, за которые есть партиции (включая границы)."""
+        if not os.path.isdir(self.directory):
+            return []
+        days = []
+        for name in os.listdir(self.directory):
+            if not (name.startswith(PARTITION_PREFIX) and name.endswith(PARTITION_SUFFIX)):
+                continue
+            try:
+                day = date.fromisoformat(name[len(PARTITION_PREFIX):-len(PARTITION_SUFFIX)])
+            except ValueError:
+                continue
+            if (start is None or day >= start) and (end is None or day <= end):
+                days.append(day)
+        return sorted(days)
+
+    def iter_tokens(self, start: Optional[date] = None, end: Optional[date] = None) -> Iterator[Dict[str, Any]]:
+        """Перебирает записи архива за период, читая только нужные партиции."""
+        for day in self.partitions(start, end):
+            path = self._partition_path(day)
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as partition:
+                    for line in partition:
+                        line = line.strip()
+                        if line:
+                            yield json.loads(line)
+            except (OSError, EOFError, ValueError) as e:
+                # Недописанный блок после сбоя - все, что было до него, уже прочитано
+                logger.error(f"Ошибка при чтении партиции архива {path}: {e}")
@@ -0,0 +1,84 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, Any, Optional, Iterable
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Каталог для сжатых исходных ответов API
+BLOB_DIR = "raw_api_blobs"
+
+class BlobStore:
+    """
+    Холодное хранилище исходных ответов API, адресуемое по содержимому.
+
+    Ответ сериализуется в канонический JSON, ключом служит его SHA-256, а сам
+    ответ сжимается gzip в файл <каталог>/<2 символа хэша>/<хэш>.json.gz.
+    Одинаковые ответы хранятся один раз, и запись на диск происходит только
+    когда содержимое (а значит, хэш) изменилось.
+    """
+
+    def __init__(self, directory: str = BLOB_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # Хэши, про которые уже известно, что они лежат на диске
+        self._known: set = set()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.json.gz")
+
+    def put(self, payload: Dict[str, Any]) -> str:
+        """Сохраняет ответ (если такого еще нет) и возвращает его хэш."""
+        # Канонический JSON: одинаковые ответы дают одинаковый хэш независимо от порядка ключей
+        canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+        digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+        if digest in self._known:
+            return digest
+
+        path = self._path(digest)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with gzip.open(tmp_path, 'wb') as blob_file:
+                    blob_file.write(canonical.encode('utf-8'))
+                os.replace(tmp_path, path)
+            self._known.add(digest)
+        return digest
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        """Загружает ответ по хэшу. Возвращает None, если его нет."""
+        try:
+            with gzip.open(self._path(digest), 'rb') as blob_file:
+                return json.loads(blob_file.read().decode('utf-8'))
+        except FileNotFoundError:
+            logger.warning(f"Исходные данные API {digest} не найдены в хранилище")
+        except Exception as e:
+            logger.error(f"Ошибка при чтении исходных данных API {digest}: {e}")
+        return None
+
+    def prune(self, live_digests: Iterable[str]) -> int:
+        """Удаляет ответы, на которые больше не ссылается ни один токен. Возвращает их количество."""
+        live = set(live_digests)
+        removed = 0
+        if not os.path.isdir(self.directory):
+            return 0
+        with self._lock:
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    digest = name.split('.', 1)[0]
+                    if digest in live:
+                        continue
+                    try:
+                        os.remove(os.path.join(root, name))
+                        self._known.discard(digest)
+                        removed += 1
+                    except OSError as e:
+                        logger.error(f"Ошибка при удалении исходных данных API {name}: {e}")
+        if removed:
+            logger.info(f"Удалено {removed} неиспользуемых ответов API из {self.directory}")
+        return removed
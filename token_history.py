@@ -0,0 +1,231 @@
+import math
+import time
+import logging
+import threading
+from array import array
+from typing import Dict, Any, Optional, List, Tuple
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Количество последних необработанных замеров (timestamp, fdv, volume) на токен
+RAW_CAPACITY = 360
+
+# Уровни агрегации: (шаг в секундах, количество хранимых интервалов)
+# 1 минута - 3 часа, 5 минут - сутки, 1 час - 30 дней
+ROLLUP_LEVELS = (
+    (60, 180),
+    (300, 288),
+    (3600, 720),
+)
+
+class RingBuffer:
+    """
+    Кольцевой буфер записей фиксированной ширины на array('d').
+
+    Все значения лежат в одном плоском массиве чисел double, поэтому память
+    на токен ограничена и не зависит от длительности отслеживания. Массив растет
+    по мере добавления записей и только после заполнения начинает перезаписываться
+    по кругу, поэтому токен с несколькими замерами почти не занимает памяти.
+    """
+
+    __slots__ = ('width', 'capacity', '_data', '_start', '_count')
+
+    def __init__(self, capacity: int, width: int):
+        self.width = width
+        self.capacity = capacity
+        self._data = array('d')
+        self._start = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _offset(self, index: int) -> int:
+        return ((self._start + index) % self.capacity) * self.width
+
+    def append(self, values: Tuple[float, ...]) -> None:
+        """Добавляет запись; при переполнении затирает самую старую."""
+        if self._count < self.capacity:
+            # Пока буфер не заполнен, _start = 0 и новая запись дописывается в конец массива
+            self._data.extend(values)
+            self._count += 1
+            return
+        offset = self._start * self.width
+        self._start = (self._start + 1) % self.capacity
+        self._data[offset:offset + self.width] = array('d', values)
+
+    def last(self) -> Optional[Tuple[float, ...]]:
+        """Возвращает последнюю запись."""
+        if not self._count:
+            return None
+        offset = self._offset(self._count - 1)
+        return tuple(self._data[offset:offset + self.width])
+
+    def replace_last(self, values: Tuple[float, ...]) -> None:
+        """Перезаписывает последнюю запись (для обновления текущего интервала)."""
+        offset = self._offset(self._count - 1)
+        self._data[offset:offset + self.width] = array('d', values)
+
+    def since(self, timestamp: float) -> List[Tuple[float, ...]]:
+        """Возвращает записи, у которых первое поле (время) не меньше указанного."""
+        result = []
+        for index in range(self._count - 1, -1, -1):
+            offset = self._offset(index)
+            if self._data[offset] < timestamp:
+                break
+            result.append(tuple(self._data[offset:offset + self.width]))
+        result.reverse()
+        return result
+
+    def oldest_time(self) -> Optional[float]:
+        """Возвращает время самой старой записи."""
+        if not self._count:
+            return None
+        return self._data[self._offset(0)]
+
+class MarketCapHistory:
+    """
+    История маркет капа одного токена.
+
+    Последние замеры хранятся как есть (timestamp, fdv, volume), а все замеры
+    дополнительно сворачиваются в интервалы 1м/5м/1ч вида
+    (начало интервала, max fdv, min fdv, последний fdv, последний volume).
+    ATH отслеживается отдельно и не теряется при вытеснении старых интервалов.
+    """
+
+    __slots__ = ('raw', 'rollups', 'ath', 'ath_time', 'first_fdv', 'first_time')
+
+    def __init__(self):
+        self.raw = RingBuffer(RAW_CAPACITY, 3)
+        self.rollups = [(step, RingBuffer(capacity, 5)) for step, capacity in ROLLUP_LEVELS]
+        self.ath = 0.0
+        self.ath_time = 0.0
+        self.first_fdv = 0.0
+        self.first_time = 0.0
+
+    def add(self, timestamp: float, fdv: float, volume: float = 0.0) -> None:
+        """Добавляет замер и обновляет агрегаты."""
+        self.raw.append((timestamp, fdv, volume))
+        if not self.first_time:
+            self.first_fdv = fdv
+            self.first_time = timestamp
+        if fdv > self.ath:
+            self.ath = fdv
+            self.ath_time = timestamp
+
+        for step, buffer in self.rollups:
+            bucket = timestamp - timestamp % step
+            last = buffer.last()
+            if last is not None and last[0] == bucket:
+                buffer.replace_last((bucket, max(last[1], fdv), min(last[2], fdv), fdv, volume))
+            else:
+                buffer.append((bucket, fdv, fdv, fdv, volume))
+
+    def last(self) -> Optional[Tuple[float, float, float]]:
+        """Возвращает последний замер (timestamp, fdv, volume)."""
+        return self.raw.last()
+
+    def series(self, seconds: float, now: Optional[float] = None) -> List[Tuple[float, float]]:
+        """
+        Возвращает ряд (время, fdv) за последние seconds секунд.
+        Берется самый подробный уровень, который покрывает весь период.
+        """
+        since = (now or time.time()) - seconds
+        oldest_raw = self.raw.oldest_time()
+        if oldest_raw is not None and oldest_raw <= since:
+            return [(ts, fdv) for ts, fdv, _ in self.raw.since(since)]
+        for step, buffer in self.rollups:
+            oldest = buffer.oldest_time()
+            if oldest is not None and oldest <= since:
+                return [(ts, close) for ts, _, _, close, _ in buffer.since(since - step)]
+        # История короче запрошенного периода - отдаем самый длинный уровень целиком
+        step, buffer = self.rollups[-1]
+        return [(ts, close) for ts, _, _, close, _ in buffer.since(0)]
+
+    def high(self, seconds: float, now: Optional[float] = None) -> float:
+        """Максимальный маркет кап за последние seconds секунд."""
+        since = (now or time.time()) - seconds
+        for step, buffer in self.rollups:
+            oldest = buffer.oldest_time()
+            if oldest is not None and oldest <= since:
+                return max((row[1] for row in buffer.since(since - step)), default=0.0)
+        return self.ath
+
+    def drawdown(self) -> float:
+        """Просадка от ATH в долях (0.25 = на 25% ниже ATH)."""
+        last = self.last()
+        if not last or not self.ath:
+            return 0.0
+        return max(0.0, (self.ath - last[1]) / self.ath)
+
+    def multiplier(self, initial_mcap: Optional[float] = None) -> float:
+        """Текущий множитель относительно начального маркет капа."""
+        last = self.last()
+        base = initial_mcap or self.first_fdv
+        if not last or not base:
+            return 1.0
+        return last[1] / base
+
+    def ath_multiplier(self, initial_mcap: Optional[float] = None) -> float:
+        """Множитель ATH относительно начального маркет капа."""
+        base = initial_mcap or self.first_fdv
+        if not base:
+            return 1.0
+        return self.ath / base
+
+    def volatility(self, seconds: float = 3600, now: Optional[float] = None) -> float:
+        """Стандартное отклонение логарифмических изменений fdv за период."""
+        values = [fdv for _, fdv in self.series(seconds, now) if fdv > 0]
+        if len(values) < 3:
+            return 0.0
+        returns = [math.log(current / previous) for previous, current in zip(values, values[1:])]
+        mean = sum(returns) / len(returns)
+        return math.sqrt(sum((value - mean) ** 2 for value in returns) / len(returns))
+
+# Истории маркет капа по ключу токена
+_histories: Dict[str, MarketCapHistory] = {}
+_lock = threading.Lock()
+
+def record_sample(query: str, fdv: Any, volume: Any = None, timestamp: Optional[float] = None) -> None:
+    """Добавляет замер маркет капа токена в историю. Нечисловые значения пропускаются."""
+    if not isinstance(fdv, (int, float)) or isinstance(fdv, bool):
+        return
+    volume = float(volume) if isinstance(volume, (int, float)) and not isinstance(volume, bool) else 0.0
+    timestamp = float(timestamp or time.time())
+    with _lock:
+        history = _histories.get(query)
+        if history is None:
+            history = _histories[query] = MarketCapHistory()
+        history.add(timestamp, float(fdv), volume)
+
+def get_history(query: str) -> Optional[MarketCapHistory]:
+    """Возвращает историю маркет капа токена или None, если замеров не было."""
+    return _histories.get(query)
+
+def get_stats(query: str, initial_mcap: Optional[float] = None) -> Dict[str, Any]:
+    """Возвращает сводку по истории токена: ATH, просадку и множители."""
+    history = _histories.get(query)
+    if history is None or not history.last():
+        return {}
+    last_time, last_fdv, last_volume = history.last()
+    return {
+        'last_time': last_time,
+        'last_market_cap': last_fdv,
+        'last_volume': last_volume,
+        'ath_market_cap': history.ath,
+        'ath_time': history.ath_time,
+        'drawdown': history.drawdown(),
+        'multiplier': history.multiplier(initial_mcap),
+        'ath_multiplier': history.ath_multiplier(initial_mcap),
+    }
+
+def drop(query: str) -> None:
+    """Удаляет историю токена."""
+    with _lock:
+        _histories.pop(query, None)
+
+def clear() -> None:
+    """Удаляет истории всех токенов."""
+    with _lock:
+        _histories.clear()
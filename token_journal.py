@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, Any, Optional, Iterable
+
+import token_snapshot
+from token_record import to_json
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Размер журнала (в байтах), после которого запускается фоновое сжатие в снапшот
+COMPACT_THRESHOLD_BYTES = 4 * 1024 * 1024  # 4 МБ
+
+class TokenJournal:
+    """
+    Журнал изменений (append-only) для хранилища токенов.
+
+    Каждая мутация дописывается в журнал одной короткой JSON-строкой, поэтому
+    стоимость записи пропорциональна изменению, а не размеру базы. При запуске
+    загружается снапшот и поверх него проигрывается журнал. Когда журнал
+    разрастается, он в фоне сворачивается в новый снапшот.
+
+    Снапшот хранится в JSON (snapshot_format="json") или в бинарном формате
+    token_snapshot (snapshot_format="binary", файл с расширением .snap рядом
+    с JSON). Бинарный формат при первом запуске подхватывает старый JSON-снапшот.
+
+    Форматы строк журнала:
+        {"op": "set", "q": query, "d": data}          - запись токена целиком
+        {"op": "field", "q": query, "f": field, "v": value} - обновление поля (только в старых журналах)
+        {"op": "del", "q": query}                     - удаление токена
+        {"op": "clear"}                               - удаление всех токенов
+    """
+
+    def __init__(self, snapshot_path: str, compact_threshold: int = COMPACT_THRESHOLD_BYTES,
+                 snapshot_format: str = "json"):
+        self.snapshot_format = snapshot_format
+        self.json_snapshot_path = snapshot_path
+        if snapshot_format == "binary":
+            self.snapshot_path = f"{os.path.splitext(snapshot_path)[0]}.snap"
+        else:
+            self.snapshot_path = snapshot_path
+        self.log_path = f"{snapshot_path}.wal"
+        # Сегмент журнала, который сейчас сворачивается в снапшот
+        self.compacting_log_path = f"{snapshot_path}.wal.1"
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._log_file = None
+        self._compact_thread: Optional[threading.Thread] = None
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Загружает снапшот и проигрывает поверх него журнал изменений."""
+        data: Dict[str, Dict[str, Any]] = {}
+        try:
+            if self.snapshot_format == "binary" and os.path.exists(self.snapshot_path):
+                # Снапшот разбирается целиком, а не через token_snapshot.open_lazy: журнал
+                # проигрывается поверх изменяемого словаря, а token_storage при загрузке
+                # все равно читает каждую запись (индексы по added_time, тикеру и адресу,
+                # перенос raw_api_data, отделение записей трекера). Ленивое открытие
+                # используют читатели отдельных записей - token_migration и бенчмарк.
+                data = token_snapshot.read(self.snapshot_path)
+            elif os.path.exists(self.json_snapshot_path):
+                with open(self.json_snapshot_path, 'r', encoding='utf-8') as snapshot_file:
+                    data = json.load(snapshot_file)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке снапшота {self.snapshot_path}: {e}")
+
+        # Сначала недосжатый сегмент (если сжатие прервалось), затем текущий журнал.
+        # Операции идемпотентны, поэтому повторное применение безопасно.
+        replayed = 0
+        for path in (self.compacting_log_path, self.log_path):
+            replayed += self._replay(path, data)
+
+        if replayed:
+            logger.info(f"Из журнала {self.log_path} применено {replayed} изменений")
+        return data
+
+    def _replay(self, path: str, data: Dict[str, Dict[str, Any]]) -> int:
+        """Применяет операции из файла журнала к словарю данных."""
+        if not os.path.exists(path):
+            return 0
+
+        applied = 0
+        with open(path, 'r', encoding='utf-8') as log_file:
+            for line_number, line in enumerate(log_file, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Оборванная последняя строка после аварийного завершения
+                    logger.warning(f"Пропущена поврежденная строка {line_number} в журнале {path}")
+                    continue
+
+                op = entry.get('op')
+                query = entry.get('q')
+                if op == 'set':
+                    data[query] = entry.get('d', {})
+                elif op == 'field':
+                    if query in data:
+                        data[query][entry['f']] = entry.get('v')
+                elif op == 'del':
+                    data.pop(query, None)
+                elif op == 'clear':
+                    data.clear()
+                else:
+                    logger.warning(f"Неизвестная операция '{op}' в журнале {path}")
+                    continue
+                applied += 1
+        return applied
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        """Дописывает одну запись в конец журнала."""
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=to_json)
+        with self._lock:
+            if self._log_file is None:
+                self._log_file = open(self.log_path, 'a', encoding='utf-8')
+            self._log_file.write(line + '\n')
+            self._log_file.flush()
+
+    def append_clear(self) -> None:
+        """Записывает удаление всех токенов."""
+        self._append({'op': 'clear'})
+
+    def append_batch(self, upserts: Dict[str, Dict[str, Any]], deletes: Iterable[str] = ()) -> None:
+        """Записывает пачку токенов и удалений одной операцией записи."""
+        lines = [json.dumps({'op': 'set', 'q': query, 'd': data}, ensure_ascii=False, separators=(',', ':'), default=to_json)
+                 for query, data in upserts.items()]
+        lines.extend(json.dumps({'op': 'del', 'q': query}, ensure_ascii=False, separators=(',', ':')) for query in deletes)
+        if not lines:
+            return
+        with self._lock:
+            if self._log_file is None:
+                self._log_file = open(self.log_path, 'a', encoding='utf-8')
+            self._log_file.write('\n'.join(lines) + '\n')
+            self._log_file.flush()
+
+    def needs_compaction(self) -> bool:
+        """Проверяет, пора ли свернуть журнал в снапшот."""
+        try:
+            return os.path.getsize(self.log_path) >= self.compact_threshold
+        except OSError:
+            return False
+
+    def is_compacting(self) -> bool:
+        """Возвращает True, если фоновое сжатие еще выполняется."""
+        return self._compact_thread is not None and self._compact_thread.is_alive()
+
+    def compact(self, data: Dict[str, Dict[str, Any]], background: bool = True) -> bool:
+        """
+        Сворачивает журнал в новый снапшот.
+
+        Данные сериализуются сразу (под блокировкой), текущий сегмент журнала
+        откладывается в сторону, а запись снапшота на диск выполняется в фоне.
+        Новые изменения тем временем пишутся в свежий сегмент журнала.
+        """
+        with self._lock:
+            if self.is_compacting():
+                return False
+
+            try:
+                if self.snapshot_format == "binary":
+                    payload = token_snapshot.pack(data, default=to_json)[1]
+                else:
+                    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=to_json)
+            except Exception as e:
+                logger.error(f"Ошибка при сериализации снапшота: {e}")
+                return False
+
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+
+            if os.path.exists(self.log_path):
+                if os.path.exists(self.compacting_log_path):
+                    # Предыдущее сжатие не завершилось: дописываем текущий сегмент к нему
+                    with open(self.log_path, 'r', encoding='utf-8') as src, \
+                            open(self.compacting_log_path, 'a', encoding='utf-8') as dst:
+                        dst.write(src.read())
+                    os.remove(self.log_path)
+                else:
+                    os.replace(self.log_path, self.compacting_log_path)
+
+            if background:
+                self._compact_thread = threading.Thread(
+                    target=self._write_snapshot, args=(payload, len(data)),
+                    name="token-journal-compact", daemon=True
+                )
+                self._compact_thread.start()
+            else:
+                self._write_snapshot(payload, len(data))
+            return True
+
+    def _write_snapshot(self, payload, count: int) -> None:
+        """Атомарно записывает снапшот и удаляет свернутый сегмент журнала."""
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            if isinstance(payload, bytes):
+                # Бинарный снапшот: сжатие и запись тоже выполняются в фоне
+                token_snapshot.write(self.snapshot_path, count, payload)
+            else:
+                with open(tmp_path, 'w', encoding='utf-8') as tmp_file:
+                    tmp_file.write(payload)
+                    tmp_file.flush()
+                    os.fsync(tmp_file.fileno())
+                os.replace(tmp_path, self.snapshot_path)
+
+            if os.path.exists(self.compacting_log_path):
+                os.remove(self.compacting_log_path)
+            logger.info(f"Журнал свернут в снапшот: {count} токенов в {self.snapshot_path}")
+        except Exception as e:
+            logger.error(f"Ошибка при записи снапшота {self.snapshot_path}: {e}")
+
+    def close(self) -> None:
+        """Дожидается фонового сжатия и закрывает файл журнала."""
+        thread = self._compact_thread
+        if thread is not None and thread.is_alive():
+            thread.join()
+        with self._lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
@@ -0,0 +1,452 @@
+"""
+Потоковый перенос старых баз токенов в SQLite хранилище.
+
+Переносит:
+- tokens_database.json (или бинарный снапшот .snap) и журнал изменений .wal в SQLite базу
+  токенов бота (TOKEN_STORAGE_ENGINE=sqlite);
+- tokens_tracker_database.json в общую базу (пространство имен трекера);
+- токены из tokens_database.xlsx, которых нет в JSON базе.
+
+Файлы читаются потоково и пишутся пачками, поэтому память не зависит от размера базы.
+После каждой пачки прогресс сохраняется в файл состояния, и прерванный перенос
+при повторном запуске продолжается с места остановки.
+
+Запуск: python token_migration.py [--batch-size N] [--restart]
+"""
+import os
+import sys
+import json
+import time
+import codecs
+import logging
+import argparse
+from datetime import datetime
+from typing import Dict, Any, Optional, Iterator, Tuple, Callable
+
+# openpyxl нужен только для переноса Excel базы
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+import shared_store
+import token_snapshot
+from token_blobs import BlobStore
+from token_record import TokenRecord
+from token_sqlite import SQLiteTokenEngine
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Исходные файлы (совпадают с путями token_storage и solana_contract_tracker)
+JSON_DB_PATH = "tokens_database.json"
+BINARY_DB_PATH = "tokens_database.snap"
+TRACKER_DB_PATH = "tokens_tracker_database.json"
+EXCEL_DB_PATH = "tokens_database.xlsx"
+
+# Целевые хранилища
+SQLITE_DB_PATH = "tokens_database.sqlite"
+RAW_API_BLOB_DIR = "raw_api_blobs"
+
+# Файл с прогрессом переноса
+STATE_PATH = "migration_state.json"
+
+# Размер пачки записей на одну транзакцию и размер читаемого блока файла
+BATCH_SIZE = 500
+CHUNK_SIZE = 1024 * 1024
+
+# Служебные колонки Excel базы, которые не относятся к token_info
+EXCEL_META_COLUMNS = {
+    'query', 'data_type', 'creation_date', 'last_update', 'hidden',
+    'chat_id', 'message_id', 'last_alert_multiplier', 'ath_market_cap', 'ath_time',
+}
+
+def iter_json_object(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, Any, int]]:
+    """
+    Потоково перебирает пары (ключ, значение) JSON-объекта верхнего уровня.
+
+    Файл читается блоками, каждое значение разбирается json.JSONDecoder.raw_decode,
+    поэтому в памяти одновременно находится только текущий блок и одна запись.
+    Третий элемент кортежа - количество прочитанных байт (для отображения прогресса).
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(path, 'rb') as source:
+        buffer = ''
+        pos = 0
+        eof = False
+        bytes_read = 0
+
+        def refill() -> bool:
+            nonlocal buffer, pos, eof, bytes_read
+            if eof:
+                return False
+            chunk = source.read(chunk_size)
+            bytes_read += len(chunk)
+            eof = not chunk
+            buffer = buffer[pos:] + text_decoder.decode(chunk, final=eof)
+            pos = 0
+            return not eof or bool(buffer)
+
+        def skip_ws() -> Optional[str]:
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if not refill():
+                    return None
+
+        def decode_value() -> Any:
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # Значение, упершееся в конец блока, могло быть обрезано (например, число)
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                refill()
+
+        if buffer == '' and not refill():
+            return
+        if skip_ws() != '{':
+            raise ValueError(f"Файл {path} не содержит JSON-объект")
+        pos += 1
+        if skip_ws() == '}':
+            return
+        while True:
+            key = decode_value()
+            if skip_ws() != ':':
+                raise ValueError(f"Ошибка разбора {path}: ожидалось ':' после ключа '{key}'")
+            pos += 1
+            skip_ws()
+            value = decode_value()
+            yield key, value, bytes_read
+            separator = skip_ws()
+            if separator == ',':
+                pos += 1
+                skip_ws()
+            elif separator == '}':
+                return
+            else:
+                raise ValueError(f"Ошибка разбора {path}: неожиданный символ {separator!r}")
+
+def iter_journal(path: str) -> Iterator[Tuple[Dict[str, Any], int]]:
+    """Построчно перебирает операции журнала изменений вместе с количеством прочитанных байт."""
+    bytes_read = 0
+    with open(path, 'rb') as journal_file:
+        for line in journal_file:
+            bytes_read += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line.decode('utf-8')), bytes_read
+            except ValueError:
+                # Недописанная последняя строка после сбоя
+                logger.warning(f"Пропущена поврежденная строка журнала {path}")
+
+def iter_excel_tokens(path: str) -> Iterator[Tuple[str, Dict[str, Any], int, int]]:
+    """
+    Перебирает токены Excel базы в режиме read_only (строки читаются потоково).
+    Для каждого токена возвращает (query, запись, номер строки, всего строк).
+    Строки 'initial' и 'current' одного токена идут подряд.
+    """
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        total_rows = sheet.max_row or 0
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header:
+            return
+        columns = [str(name) if name is not None else '' for name in header]
+
+        pending_query = None
+        pending_rows: Dict[str, Dict[str, Any]] = {}
+        row_number = 1
+        for values in rows:
+            row_number += 1
+            row = {column: value for column, value in zip(columns, values)
+                   if column and value is not None and value != ''}
+            query = row.get('query')
+            if query is None:
+                continue
+            query = str(query)
+            if pending_query is not None and query != pending_query:
+                yield pending_query, excel_rows_to_record(pending_rows), row_number - 1, total_rows
+                pending_rows = {}
+            pending_query = query
+            pending_rows[row.get('data_type', 'current')] = row
+        if pending_query is not None:
+            yield pending_query, excel_rows_to_record(pending_rows), row_number, total_rows
+    finally:
+        workbook.close()
+
+def _parse_date(value: Any) -> Optional[float]:
+    """Преобразует дату из Excel (строку или datetime) во время Unix."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timestamp()
+        except ValueError:
+            return None
+    return None
+
+def excel_rows_to_record(rows: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Восстанавливает данные токена из строк 'initial' и 'current' Excel базы."""
+    initial = rows.get('initial', {})
+    current = rows.get('current', {})
+    base = current or initial
+    record: Dict[str, Any] = {}
+
+    token_info = {key: value for key, value in current.items()
+                  if key not in EXCEL_META_COLUMNS and not key.startswith('api_')}
+    if token_info:
+        record['token_info'] = token_info
+
+    if initial:
+        record['initial_data'] = {
+            'time': initial.get('time', 'Не указано'),
+            'market_cap': initial.get('market_cap', 'Неизвестно'),
+            'raw_market_cap': initial.get('raw_market_cap', 0),
+        }
+        if 'ath_market_cap' in initial:
+            record['ath_market_cap'] = initial['ath_market_cap']
+        ath_time = _parse_date(initial.get('ath_time'))
+        if ath_time:
+            record['ath_time'] = ath_time
+
+    added_time = _parse_date(base.get('creation_date'))
+    if added_time:
+        record['added_time'] = added_time
+    last_update_time = _parse_date(base.get('last_update'))
+    if last_update_time:
+        record['last_update_time'] = last_update_time
+
+    for field in ('chat_id', 'message_id', 'last_alert_multiplier'):
+        if field in base:
+            record[field] = int(base[field]) if isinstance(base[field], float) and base[field].is_integer() else base[field]
+    if 'hidden' in base:
+        record['hidden'] = bool(base['hidden'])
+    return record
+
+class Migration:
+    """
+    Перенос с сохранением прогресса.
+
+    Состояние хранится в JSON-файле: для каждого этапа - количество уже перенесенных
+    записей и признак завершения. Записи в целевые хранилища идемпотентны
+    (вставка с заменой), поэтому повтор недописанной пачки после сбоя безопасен.
+    """
+
+    def __init__(self, engine: SQLiteTokenEngine, store: shared_store.SharedStore,
+                 blob_store: BlobStore, state_path: str = STATE_PATH, batch_size: int = BATCH_SIZE):
+        self.engine = engine
+        self.store = store
+        self.blob_store = blob_store
+        self.state_path = state_path
+        self.batch_size = batch_size
+        self.state = self._load_state()
+
+    def _load_state(self) -> Dict[str, Dict[str, Any]]:
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.error(f"Ошибка при чтении состояния переноса {self.state_path}: {e}")
+        return {}
+
+    def _save_state(self) -> None:
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.state_path)
+
+    def _stage(self, name: str) -> Dict[str, Any]:
+        return self.state.setdefault(name, {'done': 0, 'finished': False})
+
+    def _commit(self, name: str, done: int, progress: str) -> None:
+        stage = self._stage(name)
+        stage['done'] = done
+        self._save_state()
+        logger.info(f"[{name}] перенесено {done} записей ({progress})")
+
+    def _finish(self, name: str, started: float) -> None:
+        stage = self._stage(name)
+        stage['finished'] = True
+        self._save_state()
+        logger.info(f"[{name}] завершено: {stage['done']} записей за {time.time() - started:.1f} с")
+
+    def _prepare_token(self, data: Dict[str, Any]) -> TokenRecord:
+        """Приводит запись к компактному виду и выносит исходный ответ API в холодное хранилище."""
+        record = TokenRecord.from_dict(data)
+        raw_api_data = record.pop('raw_api_data', None)
+        if raw_api_data:
+            record['raw_api_ref'] = self.blob_store.put(raw_api_data)
+        return record
+
+    def _run_stage(self, name: str, items: Iterator[Tuple[Any, str]], write_batch: Callable[[list], None]) -> None:
+        """
+        Общий цикл этапа: пропускает уже перенесенные записи, пишет остальные пачками
+        и после каждой пачки сохраняет прогресс.
+        items выдает пары (запись, строка прогресса).
+        """
+        stage = self._stage(name)
+        if stage['finished']:
+            logger.info(f"[{name}] уже перенесено ранее, пропускаем")
+            return
+        started = time.time()
+        skip = stage['done']
+        if skip:
+            logger.info(f"[{name}] продолжаем с записи {skip}")
+        done = 0
+        batch = []
+        progress = ''
+        for item, progress in items:
+            done += 1
+            if done <= skip:
+                continue
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                write_batch(batch)
+                batch = []
+                self._commit(name, done, progress)
+        if batch:
+            write_batch(batch)
+            self._commit(name, done, progress)
+        self._finish(name, started)
+
+    @staticmethod
+    def _bytes_progress(bytes_read: int, total: int) -> str:
+        if not total:
+            return "100.0%"
+        return f"{min(100.0, bytes_read * 100 / total):.1f}%"
+
+    def migrate_tokens(self, json_path: str = JSON_DB_PATH, binary_path: str = BINARY_DB_PATH) -> None:
+        """Переносит снапшот базы токенов бота (бинарный, если он есть, иначе JSON)."""
+        if os.path.exists(binary_path) and token_snapshot.is_snapshot(binary_path):
+            snapshot = token_snapshot.open_lazy(binary_path)
+            total = len(snapshot)
+            items = (((query, snapshot[query]), f"{index}/{total}")
+                     for index, query in enumerate(snapshot, start=1))
+        elif os.path.exists(json_path):
+            total = os.path.getsize(json_path)
+            # Трекер раньше писал свои токены в тот же файл - записи с его схемой пропускаем
+            items = (((query, data), self._bytes_progress(bytes_read, total))
+                     for query, data, bytes_read in iter_json_object(json_path)
+                     if isinstance(data, dict) and not shared_store.is_tracker_record(data))
+        else:
+            logger.info(f"Файл {json_path} не найден, перенос токенов пропущен")
+            return
+
+        def write_batch(batch):
+            self.engine.put_many({query: self._prepare_token(data) for query, data in batch})
+
+        self._run_stage('tokens', items, write_batch)
+
+    def migrate_journal(self, json_path: str = JSON_DB_PATH) -> None:
+        """Проигрывает журнал изменений (.wal.1, затем .wal) поверх перенесенного снапшота."""
+        for suffix in ('.wal.1', '.wal'):
+            path = f"{json_path}{suffix}"
+            if not os.path.exists(path):
+                continue
+            total = os.path.getsize(path)
+            items = ((entry, self._bytes_progress(bytes_read, total)) for entry, bytes_read in iter_journal(path))
+            self._run_stage(f"journal{suffix}", items, self._apply_journal_batch)
+
+    def _apply_journal_batch(self, batch) -> None:
+        for entry in batch:
+            op = entry.get('op')
+            query = entry.get('q')
+            if op == 'set':
+                self.engine.put(query, self._prepare_token(entry.get('d', {})))
+            elif op == 'field':
+                self.engine.update_fields(query, {entry['f']: entry.get('v')})
+            elif op == 'del':
+                self.engine.delete(query)
+            elif op == 'clear':
+                self.engine.clear()
+
+    def migrate_tracker(self, path: str = TRACKER_DB_PATH) -> None:
+        """Переносит базу отслеживаемых токенов трекера в общую базу."""
+        if not os.path.exists(path):
+            logger.info(f"Файл {path} не найден, перенос базы трекера пропущен")
+            return
+        stage = self._stage('tracker')
+        # Трекер уже работает с общей базой - не восстанавливаем удаленные им или ботом токены
+        if not stage['done'] and not stage['finished'] and self.store.count(shared_store.NS_TRACKER):
+            logger.info("База трекера уже перенесена в общую базу, пропускаем")
+            self._finish('tracker', time.time())
+            return
+        total = os.path.getsize(path)
+        items = (((contract, data), self._bytes_progress(bytes_read, total))
+                 for contract, data, bytes_read in iter_json_object(path) if isinstance(data, dict))
+
+        def write_batch(batch):
+            self.store.merge_many(shared_store.NS_TRACKER, dict(batch))
+
+        self._run_stage('tracker', items, write_batch)
+
+    def migrate_excel(self, path: str = EXCEL_DB_PATH) -> None:
+        """Добавляет токены из Excel базы, которых нет в перенесенной JSON базе."""
+        if not os.path.exists(path):
+            logger.info(f"Файл {path} не найден, перенос Excel базы пропущен")
+            return
+        if openpyxl is None:
+            logger.warning("Модуль openpyxl не установлен, перенос Excel базы пропущен")
+            return
+        items = (((query, record), f"строка {row_number}/{total_rows}")
+                 for query, record, row_number, total_rows in iter_excel_tokens(path))
+
+        def write_batch(batch):
+            missing = {query: TokenRecord.from_dict(record) for query, record in batch
+                       if record and not self.engine.contains(query)}
+            if missing:
+                self.engine.put_many(missing)
+
+        self._run_stage('excel', items, write_batch)
+
+    def run(self) -> None:
+        """Выполняет все этапы переноса по порядку."""
+        self.migrate_tokens()
+        self.migrate_journal()
+        self.migrate_tracker()
+        self.migrate_excel()
+        logger.info(f"Перенос завершен: {self.engine.count()} токенов в {self.engine.db_path}, "
+                    f"{self.store.count(shared_store.NS_TRACKER)} отслеживаемых токенов в общей базе")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Потоковый перенос старых баз токенов в SQLite")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="количество записей в одной транзакции")
+    parser.add_argument('--state', default=STATE_PATH, help="файл с прогрессом переноса")
+    parser.add_argument('--restart', action='store_true', help="начать перенос заново, игнорируя сохраненный прогресс")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.restart and os.path.exists(args.state):
+        os.remove(args.state)
+
+    engine = SQLiteTokenEngine(SQLITE_DB_PATH)
+    try:
+        migration = Migration(engine, shared_store.get_store(), BlobStore(RAW_API_BLOB_DIR),
+                              state_path=args.state, batch_size=args.batch_size)
+        migration.run()
+    except Exception as e:
+        logger.error(f"Ошибка при переносе данных: {e}")
+        sys.exit(1)
+    finally:
+        engine.close()
+
+    logger.info("Для работы с новой базой запустите бота с TOKEN_STORAGE_ENGINE=sqlite")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+import logging
+from collections.abc import MutableMapping
+from typing import Dict, Any, Iterator, Optional
+
+from utils import format_number
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+def _to_float(value: Any) -> Any:
+    """Приводит числовое значение к float; нечисловые значения возвращает как есть."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+class _SlottedRecord(MutableMapping):
+    """
+    Базовый класс компактной записи с __slots__.
+
+    Известные поля хранятся в слотах (незаполненный слот означает отсутствие ключа),
+    остальные - в словаре _extra, который создается только при необходимости.
+    Запись ведет себя как словарь, поэтому существующий код с data.get(...),
+    data['field'] и 'field' in data продолжает работать без изменений.
+    """
+
+    __slots__ = ('_extra',)
+
+    # Поля, хранящиеся в слотах (кортеж задает порядок, множество - быструю проверку)
+    FIELDS: tuple = ()
+    FIELD_SET: frozenset = frozenset()
+    # Числовые поля, которые хранятся как float
+    FLOAT_FIELDS: frozenset = frozenset()
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        self._extra = None
+        if data:
+            # Прямой цикл быстрее MutableMapping.update при массовой загрузке
+            for key, value in data.items():
+                self[key] = value
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self.FIELD_SET:
+            setattr(self, key, _to_float(value) if key in self.FLOAT_FIELDS else value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in self.FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self.FIELD_SET:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def get(self, key: str, default: Any = None) -> Any:
+        # Быстрый путь без исключений KeyError
+        if key in self.FIELD_SET:
+            return getattr(self, key, default)
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def copy(self) -> '_SlottedRecord':
+        """Возвращает поверхностную копию записи (вложенные значения общие)."""
+        clone = type(self).__new__(type(self))
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(self, name):
+                    setattr(clone, name, getattr(self, name))
+        clone._extra = dict(self._extra) if self._extra is not None else None
+        return clone
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Возвращает компактное представление записи для сериализации."""
+        result = {}
+        for key in self.FIELDS:
+            value = getattr(self, key, None)
+            if value is None:
+                continue
+            result[key] = value.to_dict() if isinstance(value, _SlottedRecord) else value
+        if self._extra:
+            result.update(self._extra)
+        return result
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+class MarketCapInfo(_SlottedRecord):
+    """
+    Данные о маркет капе (token_info и initial_data записи токена).
+
+    Маркет кап хранится числом в raw_market_cap, а отформатированная строка
+    market_cap вычисляется при обращении. Явно заданная строка сохраняется
+    только если числового значения нет.
+    """
+
+    __slots__ = (
+        'ticker', 'ticker_address', 'pair_address', 'chain_id',
+        'raw_market_cap', 'token_age', 'time', '_market_cap_text'
+    )
+
+    FIELDS = ('ticker', 'ticker_address', 'pair_address', 'chain_id', 'raw_market_cap', 'token_age', 'time')
+    FIELD_SET = frozenset(FIELDS)
+    FLOAT_FIELDS = frozenset(('raw_market_cap',))
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        self._market_cap_text = None
+        if data and 'raw_market_cap' in data:
+            # Сначала число, чтобы строка market_cap не сохранялась лишний раз
+            self['raw_market_cap'] = data['raw_market_cap']
+        super().__init__(data)
+
+    def _has_raw_market_cap(self) -> bool:
+        return isinstance(getattr(self, 'raw_market_cap', None), float)
+
+    def _has_market_cap(self) -> bool:
+        return self._market_cap_text is not None or hasattr(self, 'raw_market_cap')
+
+    def __getitem__(self, key: str) -> Any:
+        if key == 'market_cap':
+            if self._market_cap_text is not None:
+                return self._market_cap_text
+            if hasattr(self, 'raw_market_cap'):
+                return format_number(self.raw_market_cap)
+            raise KeyError(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key == 'market_cap':
+            self._market_cap_text = None if self._has_raw_market_cap() else value
+            return
+        super().__setitem__(key, value)
+        if key == 'raw_market_cap' and self._has_raw_market_cap():
+            self._market_cap_text = None
+
+    def __delitem__(self, key: str) -> None:
+        if key == 'market_cap':
+            self._market_cap_text = None
+            return
+        super().__delitem__(key)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._has_market_cap():
+            yield 'market_cap'
+        yield from super().__iter__()
+
+    def __contains__(self, key: object) -> bool:
+        if key == 'market_cap':
+            return self._has_market_cap()
+        return super().__contains__(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == 'market_cap':
+            return self[key] if key in self else default
+        return super().get(key, default)
+
+    @property
+    def market_cap(self) -> Any:
+        """Отформатированный маркет кап (вычисляется при обращении)."""
+        return self.get('market_cap', 'Неизвестно')
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = super().to_dict()
+        # Строку сохраняем только если ее нельзя вычислить из числа
+        if self._market_cap_text is not None:
+            result['market_cap'] = self._market_cap_text
+        return result
+
+class TokenRecord(_SlottedRecord):
+    """
+    Запись об отслеживаемом токене в хранилище.
+
+    Заменяет вложенный словарь: верхнеуровневые поля лежат в слотах, числовые
+    значения (время, ATH) хранятся как float, token_info и initial_data - это
+    MarketCapInfo с вычисляемыми строками маркет капа. Исходный ответ API в записи
+    не хранится: raw_api_ref - это хэш ответа в холодном хранилище token_blobs.
+    """
+
+    __slots__ = (
+        'added_time', 'last_update_time', 'chat_id', 'message_id', 'hidden',
+        'ath_market_cap', 'ath_time', 'last_alert_multiplier',
+        'initial_data', 'token_info', 'raw_api_ref'
+    )
+
+    FIELDS = __slots__
+    FIELD_SET = frozenset(FIELDS)
+    FLOAT_FIELDS = frozenset(('added_time', 'last_update_time', 'ath_market_cap', 'ath_time'))
+    # Вложенные данные, которые хранятся как MarketCapInfo
+    INFO_FIELDS = frozenset(('initial_data', 'token_info'))
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self.INFO_FIELDS and isinstance(value, dict):
+            value = MarketCapInfo(value)
+        super().__setitem__(key, value)
+
+    @classmethod
+    def from_dict(cls, data: Any) -> 'TokenRecord':
+        """Создает запись из словаря (старого или компактного формата); запись возвращает как есть."""
+        if isinstance(data, TokenRecord):
+            return data
+        return cls(data)
+
+def to_json(value: Any) -> Any:
+    """Функция default для json.dumps: сериализует записи в компактные словари."""
+    if isinstance(value, _SlottedRecord):
+        return value.to_dict()
+    return str(value)
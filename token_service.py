@@ -1,9 +1,7 @@
-import requests
 import logging
 import datetime
 import time
 import asyncio
-import random
 import json
 import os
 import pandas as pd
@@ -16,17 +14,28 @@ from telegram.error import TimedOut, NetworkError
 
 # Импортируем модули проекта
 import token_storage
-from config import DEXSCREENER_API_URL, logger
+import token_history
+import shared_store
+import dex_client
+import poll_scheduler
+import sweep_coordinator
+from config import logger
 from utils import process_token_data, format_message, format_number, format_growth_message
 
-# Параметры API
-API_REQUEST_LIMIT = 60  # Максимальное число запросов в минуту
-API_COOLDOWN_TIME = 70  # Время ожидания после достижения лимита (в секундах)
-api_request_count = 0
-last_api_request_time = 0
-
 # Настройки для мониторинга
 MONITOR_INTERVAL = 10  # Интервал проверки маркет капа в секундах
+MONITOR_SWEEP_DEADLINE = 8  # Срок одного обхода мониторинга (меньше интервала запуска)
+FULL_SWEEP_DEADLINE = 120  # Срок полной проверки всех токенов
+
+# Закрепленная основная пара токена опрашивается через /latest/dex/pairs;
+# выбор пары пересматривается раз в PAIR_REEVALUATE_INTERVAL секунд или при переезде ликвидности
+PAIR_REEVALUATE_INTERVAL = 1800
+# Доля ликвидности от момента закрепления, ниже которой пара считается покинутой (например, pump.fun -> Raydium)
+LIQUIDITY_MIGRATION_SHARE = 0.5
+
+# Файл Excel отчета и ключ (версия хранилища, версия базы трекера), для которого он собран
+EXCEL_REPORT_PATH = 'tokens_data_report.xlsx'
+excel_report_key = None
 
 async def get_token_info(
     query: str, 
@@ -38,7 +47,7 @@ async def get_token_info(
     try:
         logger.info(f"Запрос информации о токене: {query}")
         
-        response = requests.get(f"{DEXSCREENER_API_URL}?q={query}", timeout=20)
+        response = await dex_client.client.search(query, timeout=20)
         logger.info(f"Получен ответ от API. Статус: {response.status_code}")
         
         if response.status_code == 200:
@@ -53,12 +62,13 @@ async def get_token_info(
                     )
                 return None
             
-            # Берем первый результат как наиболее релевантный
-            token_data = pairs[0]
+            # Первый результат определяет токен, из его пар берем основную
+            token_data = dex_client.primary_pair(_search_token_pairs(pairs))
             raw_api_data = token_data
             
             # Обрабатываем данные
             token_info = process_token_data(token_data)
+            token_storage.record_market_cap(query, token_info['raw_market_cap'], (token_data.get('volume') or {}).get('m5'))
             
             # Получаем начальные данные, если токен уже отслеживается
             initial_data = None
@@ -79,7 +89,7 @@ async def get_token_info(
                     
                     # Вычисляем множитель
                     if initial_mcap > 0:
-                        multiplier = current_mcap / initial_mcap
+                        multiplier = token_history.get_stats(query, initial_mcap).get('multiplier', current_mcap / initial_mcap)
                         current_multiplier = int(multiplier)
                         
                         # Проверяем, был ли уже отправлен алерт для данного множителя
@@ -237,12 +247,85 @@ async def process_token_address(address: str, chat_id: int, context: ContextType
         except:
             pass
 
+async def _sweep_chunk(
+    tokens: Dict[str, Dict[str, Any]],
+    context: ContextTypes.DEFAULT_TYPE,
+    changes: List[Dict[str, Any]]
+) -> None:
+    """
+    Обрабатывает пачку токенов в обходе маркет капа: получает маркет кап пакетным запросом
+    и отправляет уведомления о росте. Изменения токенов добавляются в changes, а множитель
+    последнего уведомления записывается в хранилище сразу, до отправки: уведомление не
+    повторится, даже если обход отменят по сроку или тот же токен проверяет другой обход.
+    """
+    results = await check_market_caps_batch(tokens, changes)
+    
+    # Проверяем рост каждого токена
+    for query, result in results.items():
+        try:
+            if not result:
+                logger.warning(f"Обновление Market Cap токена {query} не удалось")
+                continue
+            
+            token_data = tokens[query]
+            chat_id = token_data.get('chat_id')
+            message_id = token_data.get('message_id')
+            logger.info(f"Мониторинг токена {query}: MC={result.get('market_cap')}, Multiplier={result.get('multiplier', 1)}, "
+                        f"просадка от ATH={result.get('drawdown', 0.0):.0%}")
+            
+            # Проверяем на мультипликатор и отправляем уведомление если нужно
+            send_notification = result.get('send_notification', False)
+            current_multiplier = result.get('current_multiplier', 1)
+            
+            if send_notification and current_multiplier >= 2:
+                # Данные пачки могли устареть: уведомление мог уже отправить другой обход
+                stored_data = token_storage.get_token_data(query) or token_data
+                last_alert_multiplier = stored_data.get('last_alert_multiplier') or 1
+                if current_multiplier <= last_alert_multiplier:
+                    continue
+                
+                # Записываем множитель до отправки (между проверкой и записью нет ожидания)
+                token_storage.bulk_update([{'query': query, 'fields': {'last_alert_multiplier': current_multiplier}}])
+                
+                # Отправляем уведомление о росте
+                token_info = token_data.get('token_info', {})
+                ticker = token_info.get('ticker', 'Неизвестно')
+                market_cap = result.get('market_cap', 'Неизвестно')
+                
+                # Используем функцию для формирования сообщения о росте
+                growth_message = format_growth_message(ticker, current_multiplier, market_cap)
+                
+                try:
+                    await context.bot.send_message(
+                        chat_id=chat_id,
+                        text=growth_message,
+                        parse_mode=ParseMode.MARKDOWN,
+                        disable_web_page_preview=True,
+                        reply_to_message_id=message_id
+                    )
+                except Exception:
+                    # Уведомление не отправлено - возвращаем прежний множитель, чтобы повторить его позже
+                    token_storage.bulk_update([{'query': query, 'fields': {'last_alert_multiplier': last_alert_multiplier}}])
+                    raise
+                logger.info(f"Отправлено уведомление о росте токена {ticker} до x{current_multiplier}")
+            
+        except Exception as e:
+            logger.error(f"Ошибка при мониторинге токена {query}: {e}")
+
 async def monitor_token_market_caps(context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Отслеживает маркет кап токенов и проверяет на мультипликаторы x2, x3 и т.д.
     Функция предназначена для использования в планировщике задач.
-    Интервал запуска: MONITOR_INTERVAL секунд (10 сек.)
+    Интервал запуска: MONITOR_INTERVAL секунд (10 сек.); при каждом запуске опрашиваются
+    только токены, время опроса которых наступило по poll_scheduler. Обход выполняется
+    через sweep_coordinator и должен уложиться в MONITOR_SWEEP_DEADLINE секунд.
     """
+    # Предыдущий обход еще идет - не забираем токены из планировщика
+    if sweep_coordinator.monitor_coordinator.busy('monitor'):
+        return
+    
+    # Изменения за весь обход записываются в хранилище одной пачкой
+    changes = []
     try:
         # Получаем все активные токены
         active_tokens = token_storage.get_active_tokens()
@@ -253,71 +336,46 @@ async def monitor_token_market_caps(context: ContextTypes.DEFAULT_TYPE) -> None:
             
         logger.info(f"Запущен мониторинг маркет капа, всего токенов: {len(active_tokens)}")
         
-        # Для каждого токена обновляем маркет кап и проверяем рост
-        for query, token_data in active_tokens.items():
-            try:
-                chat_id = token_data.get('chat_id')
-                message_id = token_data.get('message_id')
-                
-                if not chat_id:
-                    continue
-                    
-                # Проверяем, не слишком ли часто обновляем токен
-                last_update_time = token_data.get('last_update_time', 0)
-                current_time = time.time()
-                
-                # Пропускаем токены, которые были обновлены менее 5 секунд назад
-                if current_time - last_update_time < 5:
-                    continue
-                
-                # Получаем последние данные о маркет капе
-                result = await check_market_cap_growth(query, chat_id, message_id, context)
-                
-                if result:
-                    logger.info(f"Мониторинг токена {query}: MC={result.get('market_cap')}, Multiplier={result.get('multiplier', 1)}")
-                    
-                    # Проверяем на мультипликатор и отправляем уведомление если нужно
-                    send_notification = result.get('send_notification', False)
-                    current_multiplier = result.get('current_multiplier', 1)
-                    
-                    if send_notification and current_multiplier >= 2:
-                        # Отправляем уведомление о росте
-                        token_info = token_data.get('token_info', {})
-                        ticker = token_info.get('ticker', 'Неизвестно')
-                        market_cap = result.get('market_cap', 'Неизвестно')
-                        
-                        # Используем функцию для формирования сообщения о росте
-                        growth_message = format_growth_message(ticker, current_multiplier, market_cap)
-                        
-                        await context.bot.send_message(
-                            chat_id=chat_id,
-                            text=growth_message,
-                            parse_mode=ParseMode.MARKDOWN,
-                            disable_web_page_preview=True,
-                            reply_to_message_id=message_id
-                        )
-                        
-                        # Обновляем последний алерт
-                        token_storage.update_token_field(query, 'last_alert_multiplier', current_multiplier)
-                        logger.info(f"Отправлено уведомление о росте токена {ticker} до x{current_multiplier}")
-                
-                # Добавляем небольшую паузу между запросами к API
-                await asyncio.sleep(random.uniform(0.5, 1.0))
-                
-            except Exception as e:
-                logger.error(f"Ошибка при мониторинге токена {query}: {e}")
-                continue
+        # Берем из планировщика токены, время опроса которых наступило (без чата - пропускаем)
+        current_time = time.time()
+        poll_scheduler.scheduler.sync(active_tokens, current_time)
+        due = poll_scheduler.scheduler.pop_due(current_time)
+        due_queries = [query for query in due if active_tokens[query].get('chat_id')]
+        logger.info(f"К опросу готово {len(due_queries)} токенов из {len(active_tokens)}")
+        
+        processed = []
+        try:
+            processed = await sweep_coordinator.monitor_coordinator.run(
+                'monitor', due_queries, active_tokens,
+                lambda chunk: _sweep_chunk(chunk, context, changes),
+                MONITOR_SWEEP_DEADLINE
+            ) or []
+        finally:
+            # Назначаем следующий опрос по свежей истории маркет капа; токены из backlog
+            # планировщик вернет к опросу сразу, а координатор обработает их первыми
+            backlog = set(sweep_coordinator.monitor_coordinator.backlog)
+            for query in set(due) | set(processed):
+                if query not in backlog:
+                    poll_scheduler.scheduler.reschedule(query, active_tokens[query])
                 
     except Exception as e:
         logger.error(f"Ошибка в задаче мониторинга маркет капа: {e}")
         import traceback
         logger.error(traceback.format_exc())
+    finally:
+        if changes:
+            token_storage.bulk_update(changes)
 
 async def check_all_market_caps(context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Проверяет Market Cap всех отслеживаемых токенов.
     Не отправляет регулярных сообщений, только уведомления о росте.
+    Изменения всех токенов записываются в хранилище одной пачкой в конце проверки.
+    Проверка выполняется через sweep_coordinator и пропускается, если предыдущая полная проверка еще идет.
     """
+    if sweep_coordinator.full_coordinator.busy('full'):
+        return
+    
     logger.info("Начало автоматической проверки Market Cap всех токенов")
     
     # Обновляем время последней автоматической проверки
@@ -330,66 +388,177 @@ async def check_all_market_caps(context: ContextTypes.DEFAULT_TYPE) -> None:
     
     # Получаем все отслеживаемые токены
     all_tokens = token_storage.get_all_tokens()
+    changes = []
     
-    for query, token_data in all_tokens.items():
-        try:
-            chat_id = token_data.get('chat_id')
-            message_id = token_data.get('message_id')
-            
-            if not chat_id:
+    try:
+        queries = []
+        for query, token_data in all_tokens.items():
+            if not token_data.get('chat_id'):
                 logger.warning(f"Недостаточно данных для обновления токена {query}")
                 continue
+            queries.append(query)
+        
+        # Проверяем маркет кап всех токенов пачками
+        logger.info(f"Автоматическая проверка Market Cap {len(queries)} токенов")
+        await sweep_coordinator.full_coordinator.run(
+            'full', queries, all_tokens,
+            lambda chunk: _sweep_chunk(chunk, context, changes),
+            FULL_SWEEP_DEADLINE
+        )
+    finally:
+        if changes:
+            token_storage.bulk_update(changes)
+
+def _apply_market_cap(
+    query: str,
+    stored_data: Dict[str, Any],
+    token_data: Dict[str, Any],
+    changes: Optional[List[Dict[str, Any]]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Обновляет маркет кап токена по данным пары из API и определяет, достиг ли он нового мультипликатора.
+    Если передан список changes, изменение добавляется в него, иначе сохраняется сразу.
+    """
+    # Получаем и обновляем market cap
+    market_cap = token_data.get('fdv')
+    raw_market_cap = market_cap  # Сохраняем исходное значение
+    market_cap_formatted = format_number(market_cap)
+    
+    # Сохраняем замер в историю маркет капа токена
+    token_storage.record_market_cap(query, raw_market_cap, (token_data.get('volume') or {}).get('m5'))
+    
+    # Обновляем только маркет кап, время обновления и ATH (если текущее значение выше)
+    if 'token_info' in stored_data:
+        initial_data = stored_data.get('initial_data', {})
+        initial_mcap = initial_data.get('raw_market_cap', 0)
+        
+        # ATH, просадка и множитель берутся из истории замеров: пики между обходами
+        # (например, при ручном обновлении) тоже попадают в ATH
+        stats = token_history.get_stats(query, initial_mcap or None)
+        
+        change = {
+            'query': query,
+            'token_info': {'market_cap': market_cap_formatted, 'raw_market_cap': raw_market_cap},
+            'fields': {'last_update_time': time.time()},
+            'ath_market_cap': stats.get('ath_market_cap', raw_market_cap),
+            'ath_time': stats.get('ath_time'),
+        }
+        if changes is not None:
+            changes.append(change)
+        else:
+            token_storage.bulk_update([change])
+        
+        # Проверяем, достиг ли токен нового множителя роста
+        send_notification = False
+        current_multiplier = 1
+        
+        if initial_mcap and initial_mcap > 0 and raw_market_cap:
+            # Вычисляем множитель
+            multiplier = stats.get('multiplier', raw_market_cap / initial_mcap)
+            current_multiplier = int(multiplier)  # Округляем до целого числа
             
-            # Проверяем маркет кап и рост токена
-            logger.info(f"Автоматическая проверка Market Cap токена {query}")
-            result = await check_market_cap_growth(query, chat_id, message_id, context)
-            
-            if result:
-                # Проверяем, нужно ли отправить уведомление о росте
-                send_notification = result.get('send_notification', False)
-                current_multiplier = result.get('current_multiplier', 1)
-                
-                if send_notification and current_multiplier >= 2:
-                    # Отправляем уведомление о росте
-                    token_info = token_data.get('token_info', {})
-                    ticker = token_info.get('ticker', 'Неизвестно')
-                    market_cap = result.get('market_cap', 'Неизвестно')
-                    
-                    # Используем функцию для формирования сообщения о росте
-                    growth_message = format_growth_message(ticker, current_multiplier, market_cap)
-                    
-                    await context.bot.send_message(
-                        chat_id=chat_id,
-                        text=growth_message,
-                        parse_mode=ParseMode.MARKDOWN,
-                        disable_web_page_preview=True,
-                        reply_to_message_id=message_id
-                    )
-                    
-                    # Обновляем последний алерт
-                    token_storage.update_token_field(query, 'last_alert_multiplier', current_multiplier)
-                    logger.info(f"Отправлено уведомление о росте токена {ticker} до x{current_multiplier}")
-                
-                logger.info(f"Автоматическое обновление Market Cap токена {query} успешно выполнено: {result['market_cap']}")
-            else:
-                logger.warning(f"Автоматическое обновление Market Cap токена {query} не удалось")
-                
-            # Небольшая пауза между запросами для снижения нагрузки на API
-            await asyncio.sleep(random.uniform(0.5, 1.0))
+            # Проверяем, был ли уже отправлен алерт для данного множителя
+            last_alert_multiplier = stored_data.get('last_alert_multiplier', 1)
             
-        except Exception as e:
-            logger.error(f"Ошибка при автоматической проверке Market Cap токена {query}: {e}")
-            await asyncio.sleep(0.5)  # Короткая пауза в случае ошибки
+            # Если текущий множитель >= 2 и превышает предыдущий алерт
+            if current_multiplier >= 2 and current_multiplier > last_alert_multiplier:
+                send_notification = True
+                logger.info(f"Обнаружен новый множитель для токена {query}: x{current_multiplier} (предыдущий: x{last_alert_multiplier})")
+        
+        return {
+            'market_cap': market_cap_formatted, 
+            'raw_market_cap': raw_market_cap,
+            'multiplier': multiplier if 'multiplier' in locals() else 1,
+            'current_multiplier': current_multiplier,
+            'drawdown': stats.get('drawdown', 0.0),
+            'send_notification': send_notification
+        }
+    else:
+        logger.warning(f"В хранилище нет поля token_info для токена {query}")
+        return None
+
+def _pin_pair(pair: Dict[str, Any]) -> Dict[str, Any]:
+    """Данные для закрепления основной пары токена (поле primary_pair записи)."""
+    h1 = (pair.get('txns') or {}).get('h1') or {}
+    return {
+        'chain_id': pair.get('chainId'),
+        'pair_address': pair.get('pairAddress'),
+        'dex_id': pair.get('dexId'),
+        'liquidity_usd': (pair.get('liquidity') or {}).get('usd'),
+        'h1_txns': (h1.get('buys') or 0) + (h1.get('sells') or 0),
+        'pinned_at': time.time(),
+    }
+
+def _pinned_pair(token_data: Dict[str, Any], now: float) -> Optional[Dict[str, Any]]:
+    """Возвращает закрепленную пару токена, если ее выбор еще не пора пересматривать."""
+    pin = token_data.get('primary_pair')
+    if not isinstance(pin, dict) or not pin.get('chain_id') or not pin.get('pair_address'):
+        return None
+    if now - (pin.get('pinned_at') or 0) >= PAIR_REEVALUATE_INTERVAL:
+        return None
+    return pin
+
+def _liquidity_migrated(pin: Dict[str, Any], pair: Optional[Dict[str, Any]]) -> bool:
+    """
+    Проверяет, ушла ли ликвидность из закрепленной пары: пары больше нет, ее ликвидность
+    упала ниже LIQUIDITY_MIGRATION_SHARE от момента закрепления или торговля в ней прекратилась.
+    """
+    if pair is None:
+        return True
+    pinned_liquidity = pin.get('liquidity_usd')
+    liquidity = (pair.get('liquidity') or {}).get('usd')
+    if isinstance(pinned_liquidity, (int, float)) and pinned_liquidity > 0:
+        if not isinstance(liquidity, (int, float)) or liquidity < pinned_liquidity * LIQUIDITY_MIGRATION_SHARE:
+            return True
+    h1 = (pair.get('txns') or {}).get('h1') or {}
+    return bool(pin.get('h1_txns')) and not (h1.get('buys') or h1.get('sells'))
+
+def _search_token_pairs(pairs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Оставляет из результатов поиска пары токена: первый результат определяет токен."""
+    address = (pairs[0].get('baseToken') or {}).get('address')
+    if address:
+        return dex_client.base_pairs(pairs, address) or pairs[:1]
+    return pairs
+
+def _select_pair(
+    query: str,
+    stored_data: Dict[str, Any],
+    pairs: List[Dict[str, Any]],
+    changes: Optional[List[Dict[str, Any]]] = None,
+    force: bool = False
+) -> Dict[str, Any]:
+    """
+    Выбирает основную пару токена и закрепляет ее в записи, если она изменилась или пора
+    обновить закрепление. force=True закрепляет пару заново в любом случае (после переезда
+    ликвидности, чтобы обновить исходные ликвидность и число транзакций, даже если
+    основной осталась та же пара). Если передан список changes, изменение добавляется в него.
+    """
+    pair = dex_client.primary_pair(pairs)
+    pin = stored_data.get('primary_pair')
+    now = time.time()
+    if (force or not isinstance(pin, dict) or pin.get('pair_address') != pair.get('pairAddress')
+            or now - (pin.get('pinned_at') or 0) >= PAIR_REEVALUATE_INTERVAL):
+        if isinstance(pin, dict) and pin.get('pair_address') and pin.get('pair_address') != pair.get('pairAddress'):
+            logger.info(f"Основная пара токена {query} сменилась: {pin.get('dex_id')} -> {pair.get('dexId')}")
+        change = {'query': query, 'fields': {'primary_pair': _pin_pair(pair)}}
+        if changes is not None:
+            changes.append(change)
+        else:
+            token_storage.bulk_update([change])
+    return pair
 
 async def check_market_cap_growth(
     query: str,
     chat_id: int,
     message_id: Optional[int] = None,
-    context: Optional[ContextTypes.DEFAULT_TYPE] = None
+    context: Optional[ContextTypes.DEFAULT_TYPE] = None,
+    changes: Optional[List[Dict[str, Any]]] = None
 ) -> Optional[Dict[str, Any]]:
     """
     Проверяет маркет кап токена и определяет, достиг ли он нового мультипликатора.
     Возвращает информацию о текущем маркет капе и флаг для отправки уведомления.
+    Если передан список changes, изменение токена добавляется в него (для записи
+    пачкой через token_storage.bulk_update), иначе сохраняется сразу.
     """
     try:
         # Получаем данные о токене из хранилища
@@ -404,9 +573,13 @@ async def check_market_cap_growth(
         
         for attempt in range(max_retries):
             try:
-                response = requests.get(f"{DEXSCREENER_API_URL}?q={query}", timeout=7)  # Уменьшаем таймаут
+                response = await dex_client.client.search(query, timeout=7, lane=dex_client.LANE_BACKGROUND)  # Уменьшаем таймаут
                 break
-            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            except dex_client.CircuitOpenError:
+                # API недоступно - не повторяем запрос, пока предохранитель разомкнут
+                logger.warning(f"Запрос маркет капа токена {query} пропущен: API временно недоступно")
+                return None
+            except dex_client.RETRYABLE_ERRORS as e:
                 if attempt < max_retries - 1:
                     logger.warning(f"Таймаут при запросе к API ({attempt+1}/{max_retries}): {e}")
                     await asyncio.sleep(1)  # Короткая пауза перед повторной попыткой
@@ -414,7 +587,7 @@ async def check_market_cap_growth(
                     logger.error(f"Не удалось подключиться к API после {max_retries} попыток: {e}")
                     return None
         
-        if not response:
+        if response is None:
             return None
         
         if response.status_code == 200:
@@ -425,59 +598,9 @@ async def check_market_cap_growth(
                 logger.warning(f"API не вернуло данные о парах для токена {query}")
                 return None
             
-            # Берем первый результат
-            token_data = pairs[0]
-            
-            # Получаем и обновляем market cap
-            market_cap = token_data.get('fdv')
-            raw_market_cap = market_cap  # Сохраняем исходное значение
-            market_cap_formatted = format_number(market_cap)
-            
-            # Обновляем только поле market_cap в хранилище
-            if 'token_info' in stored_data:
-                stored_data['token_info']['market_cap'] = market_cap_formatted
-                stored_data['token_info']['raw_market_cap'] = raw_market_cap
-                
-                # Обновляем время последнего обновления
-                stored_data['last_update_time'] = time.time()
-                
-                # Обновляем данные в хранилище
-                token_storage.store_token_data(query, stored_data)
-                
-                # Обновляем ATH, если текущее значение выше
-                if raw_market_cap:
-                    token_storage.update_token_ath(query, raw_market_cap)
-                
-                # Проверяем, достиг ли токен нового множителя роста
-                send_notification = False
-                current_multiplier = 1
-                
-                initial_data = stored_data.get('initial_data', {})
-                initial_mcap = initial_data.get('raw_market_cap', 0)
-                
-                if initial_mcap and initial_mcap > 0 and raw_market_cap:
-                    # Вычисляем множитель
-                    multiplier = raw_market_cap / initial_mcap
-                    current_multiplier = int(multiplier)  # Округляем до целого числа
-                    
-                    # Проверяем, был ли уже отправлен алерт для данного множителя
-                    last_alert_multiplier = stored_data.get('last_alert_multiplier', 1)
-                    
-                    # Если текущий множитель >= 2 и превышает предыдущий алерт
-                    if current_multiplier >= 2 and current_multiplier > last_alert_multiplier:
-                        send_notification = True
-                        logger.info(f"Обнаружен новый множитель для токена {query}: x{current_multiplier} (предыдущий: x{last_alert_multiplier})")
-                
-                return {
-                    'market_cap': market_cap_formatted, 
-                    'raw_market_cap': raw_market_cap,
-                    'multiplier': multiplier if 'multiplier' in locals() else 1,
-                    'current_multiplier': current_multiplier,
-                    'send_notification': send_notification
-                }
-            else:
-                logger.warning(f"В хранилище нет поля token_info для токена {query}")
-                return None
+            # Выбираем и закрепляем основную пару токена
+            pair = _select_pair(query, stored_data, _search_token_pairs(pairs), changes)
+            return _apply_market_cap(query, stored_data, pair, changes)
         else:
             logger.warning(f"API вернуло ошибку {response.status_code} для токена {query}")
             return None
@@ -486,6 +609,80 @@ async def check_market_cap_growth(
         logger.error(f"Ошибка при проверке роста маркет капа для токена {query}: {e}")
         return None
 
+async def check_market_caps_batch(
+    tokens: Dict[str, Dict[str, Any]],
+    changes: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Проверяет маркет кап нескольких токенов пакетными запросами.
+    Токены с закрепленной основной парой опрашиваются через /latest/dex/pairs/{сеть}/{a,b,...};
+    остальные, а также токены, ликвидность которых ушла из закрепленной пары, - через
+    /latest/dex/tokens/{a,b,...} с выбором и закреплением основной пары.
+    Токены без известного адреса контракта проверяются по одному через поиск.
+    Возвращает словарь {запрос: результат check_market_cap_growth или None}.
+    """
+    now = time.time()
+    pinned: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    addresses = {}
+    single = []
+    for query, token_data in tokens.items():
+        address = (token_data.get('token_info') or {}).get('ticker_address')
+        if not (isinstance(address, str) and address and address != 'Неизвестно'):
+            single.append(query)
+            continue
+        pin = _pinned_pair(token_data, now)
+        if pin is not None:
+            pinned.setdefault(pin['chain_id'], {})[query] = pin
+        else:
+            addresses[query] = address
+
+    results = {}
+    # Токены, ликвидность которых ушла из закрепленной пары: их пара закрепляется заново
+    migrated = set()
+    chains = list(pinned)
+    batches = await asyncio.gather(*(
+        dex_client.client.pairs_batch(chain_id, [pin['pair_address'] for pin in pinned[chain_id].values()], timeout=10)
+        for chain_id in chains
+    ))
+    for chain_id, pairs_by_pair in zip(chains, batches):
+        for query, pin in pinned[chain_id].items():
+            try:
+                if pin['pair_address'] not in pairs_by_pair:
+                    # Пакет с этой парой не удалось получить - проверим при следующем обходе
+                    results[query] = None
+                    continue
+                pair = pairs_by_pair[pin['pair_address']]
+                if _liquidity_migrated(pin, pair):
+                    logger.info(f"Ликвидность токена {query} ушла из пары {pin.get('dex_id')}, выбираем пару заново")
+                    addresses[query] = tokens[query]['token_info']['ticker_address']
+                    migrated.add(query)
+                else:
+                    results[query] = _apply_market_cap(query, tokens[query], pair, changes)
+            except Exception as e:
+                logger.error(f"Ошибка при проверке роста маркет капа для токена {query}: {e}")
+                results[query] = None
+
+    pairs_by_address = await dex_client.client.tokens_pairs_batch(addresses.values(), timeout=10) if addresses else {}
+    for query, address in addresses.items():
+        try:
+            if address not in pairs_by_address:
+                # Пакет с этим токеном не удалось получить - проверим при следующем обходе
+                results[query] = None
+            elif not pairs_by_address[address]:
+                logger.warning(f"API не вернуло данные о парах для токена {query}")
+                results[query] = None
+            else:
+                pair = _select_pair(query, tokens[query], pairs_by_address[address], changes,
+                                    force=query in migrated)
+                results[query] = _apply_market_cap(query, tokens[query], pair, changes)
+        except Exception as e:
+            logger.error(f"Ошибка при проверке роста маркет капа для токена {query}: {e}")
+            results[query] = None
+
+    for query in single:
+        results[query] = await check_market_cap_growth(query, tokens[query].get('chat_id'), changes=changes)
+    return results
+
 async def send_token_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Отправляет статистику по токенам за последние 12 часов.
@@ -495,14 +692,6 @@ async def send_token_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
         # Улучшенное логирование для отладки
         logger.info("=== НАЧАЛО ФОРМИРОВАНИЯ СТАТИСТИКИ ПО ТОКЕНАМ ===")
         
-        # Получаем все токены
-        all_tokens = token_storage.get_all_tokens(include_hidden=True)
-        logger.info(f"Загружено токенов для анализа: {len(all_tokens)}")
-        
-        if not all_tokens:
-            logger.info("Нет токенов для формирования статистики")
-            return
-        
         # Текущее время
         current_time = time.time()
         logger.info(f"Текущее время: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -511,6 +700,14 @@ async def send_token_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
         time_12h_ago = current_time - (12 * 60 * 60)
         logger.info(f"Время 12 часов назад: {datetime.datetime.fromtimestamp(time_12h_ago).strftime('%Y-%m-%d %H:%M:%S')}")
         
+        # Берем только токены за последние 12 часов - выборка по индексу времени добавления
+        recent_tokens = token_storage.get_tokens_added_since(time_12h_ago, include_hidden=True)
+        logger.info(f"Загружено токенов для анализа: {len(recent_tokens)}")
+        
+        if not recent_tokens:
+            logger.info("Нет токенов для формирования статистики")
+            return
+        
         # Счетчики для статистики
         total_tokens = 0
         tokens_1_5x = 0
@@ -520,23 +717,10 @@ async def send_token_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
         # Список токенов для подробного логирования
         analyzed_tokens = []
         
-        # Проверяем каждый токен
-        for query, data in all_tokens.items():
-            # Проверяем, был ли токен добавлен в течение последних 12 часов
+        # Проверяем каждый токен за последние 12 часов
+        for query, data in recent_tokens.items():
             added_time = data.get('added_time', 0)
             
-            if not added_time:
-                logger.info(f"Токен {query} не имеет времени добавления, пропускаем")
-                continue
-                
-            # Логируем время добавления токена
-            token_added_time = datetime.datetime.fromtimestamp(added_time).strftime('%Y-%m-%d %H:%M:%S')
-            logger.info(f"Токен {query} добавлен: {token_added_time}")
-            
-            if added_time < time_12h_ago:
-                logger.info(f"Токен {query} добавлен более 12 часов назад, пропускаем")
-                continue
-                
             # Получаем начальный маркет кап
             initial_mcap = 0
             if 'initial_data' in data and 'raw_market_cap' in data['initial_data']:
@@ -545,17 +729,13 @@ async def send_token_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
             # Берем ATH маркет кап вместо текущего
             ath_market_cap = data.get('ath_market_cap', 0)
             
-            # Логируем маркеткапы
-            logger.info(f"Токен {query} - Initial mcap: {initial_mcap}, ATH mcap: {ath_market_cap}")
-            
             # Пропускаем токены без данных о маркет капе
             if not initial_mcap or not ath_market_cap:
-                logger.info(f"Токен {query} не имеет данных о маркеткапе, пропускаем")
+                logger.debug(f"Токен {query} не имеет данных о маркеткапе, пропускаем")
                 continue
             
             # Вычисляем множитель на основе ATH
             multiplier = ath_market_cap / initial_mcap if initial_mcap > 0 else 0
-            logger.info(f"Токен {query} - Множитель: {multiplier:.2f}x")
             
             # Обновляем счетчики - используем взаимоисключающие категории
             total_tokens += 1
@@ -575,7 +755,7 @@ async def send_token_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
             analyzed_tokens.append({
                 'query': query,
                 'ticker': ticker,
-                'added_time': token_added_time,
+                'added_time': added_time,
                 'initial_mcap': initial_mcap,
                 'ath_mcap': ath_market_cap,
                 'multiplier': multiplier
@@ -587,8 +767,11 @@ async def send_token_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
         logger.info(f"Токенов с ростом от 2x до <5x: {tokens_2x}")
         logger.info(f"Токенов с ростом ≥5x: {tokens_5x}")
         
-        for token in analyzed_tokens:
-            logger.info(f"Токен {token['ticker']} ({token['query']}): добавлен {token['added_time']}, множитель {token['multiplier']:.2f}x")
+        # Подробности по каждому токену пишем только в отладочный лог
+        if logger.isEnabledFor(logging.DEBUG):
+            for token in analyzed_tokens:
+                token_added_time = datetime.datetime.fromtimestamp(token['added_time']).strftime('%Y-%m-%d %H:%M:%S')
+                logger.debug(f"Токен {token['ticker']} ({token['query']}): добавлен {token_added_time}, множитель {token['multiplier']:.2f}x")
         
         # Формируем сообщение со статистикой
         if total_tokens > 0:
@@ -616,28 +799,10 @@ async def send_token_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
             
             # Получаем список chat_id для отправки сообщения
             # Берем уникальные chat_id из всех токенов в хранилище
-            chat_ids = set()
-            for query, data in all_tokens.items():
-                chat_id = data.get('chat_id')
-                if chat_id:
-                    chat_ids.add(chat_id)
+            chat_ids = set(token_storage.get_chat_ids())
             
             logger.info(f"Найдено {len(chat_ids)} уникальных chat_id для отправки статистики: {chat_ids}")
             
-            # Если нет chat_id, используем значение из активного бота или токена
-            if not chat_ids:
-                logger.warning("Не найдено ни одного chat_id для отправки статистики")
-                logger.info("Попробуем найти chat_id из активных токенов...")
-                
-                for query, data in all_tokens.items():
-                    if not data.get('hidden', False):
-                        message_id = data.get('message_id', 0)
-                        chat_id = data.get('chat_id', 0)
-                        
-                        if chat_id:
-                            chat_ids.add(chat_id)
-                            logger.info(f"Найден chat_id {chat_id} для активного токена {query}")
-            
             # Если по-прежнему нет chat_id, отправим сообщение об ошибке
             if not chat_ids:
                 logger.error("Не удалось найти ни одного chat_id для отправки сообщения")
@@ -702,9 +867,13 @@ async def check_market_cap_only(
         
         for attempt in range(max_retries):
             try:
-                response = requests.get(f"{DEXSCREENER_API_URL}?q={query}", timeout=10)
+                response = await dex_client.client.search(query, timeout=10)
                 break
-            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            except dex_client.CircuitOpenError:
+                # API недоступно - не повторяем запрос, пока предохранитель разомкнут
+                logger.warning(f"Запрос маркет капа токена {query} пропущен: API временно недоступно")
+                return None
+            except dex_client.RETRYABLE_ERRORS as e:
                 if attempt < max_retries - 1:
                     logger.warning(f"Таймаут при запросе к API ({attempt+1}/{max_retries}): {e}")
                     await asyncio.sleep(2)  # пауза перед повторной попыткой
@@ -712,7 +881,7 @@ async def check_market_cap_only(
                     logger.error(f"Не удалось подключиться к API после {max_retries} попыток: {e}")
                     return None
         
-        if not response:
+        if response is None:
             return None
         
         if response.status_code == 200:
@@ -723,25 +892,27 @@ async def check_market_cap_only(
                 logger.warning(f"API не вернуло данные о парах для токена {query}")
                 return None
             
-            # Берем первый результат
-            token_data = pairs[0]
+            # Выбираем основную пару токена; закрепление запишется вместе с маркет капом
+            changes = []
+            token_data = _select_pair(query, stored_data, _search_token_pairs(pairs), changes)
             
             # Получаем и обновляем market cap
             market_cap = token_data.get('fdv')
             raw_market_cap = market_cap  # Сохраняем исходное значение
             market_cap_formatted = format_number(market_cap)
             
-            # Обновляем только поле market_cap в хранилище
+            # Сохраняем замер в историю маркет капа токена
+            token_storage.record_market_cap(query, raw_market_cap, (token_data.get('volume') or {}).get('m5'))
+            
+            # Обновляем только маркет кап и ATH по истории замеров (если он выше сохраненного) одной записью
             if 'token_info' in stored_data:
-                stored_data['token_info']['market_cap'] = market_cap_formatted
-                stored_data['token_info']['raw_market_cap'] = raw_market_cap
-                
-                # Обновляем данные в хранилище
-                token_storage.store_token_data(query, stored_data)
-                
-                # Обновляем ATH, если текущее значение выше
-                if raw_market_cap:
-                    token_storage.update_token_ath(query, raw_market_cap)
+                stats = token_history.get_stats(query)
+                token_storage.bulk_update(changes + [{
+                    'query': query,
+                    'token_info': {'market_cap': market_cap_formatted, 'raw_market_cap': raw_market_cap},
+                    'ath_market_cap': stats.get('ath_market_cap', raw_market_cap),
+                    'ath_time': stats.get('ath_time'),
+                }])
                 
                 logger.info(f"Обновлен Market Cap для токена {query}: {market_cap_formatted}")
                 
@@ -757,252 +928,265 @@ async def check_market_cap_only(
         logger.error(f"Ошибка при проверке Market Cap для токена {query}: {e}")
         return None
 
-async def generate_excel(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
-    """Генерирует Excel файл со всеми данными о токенах."""
+def build_excel_report(active_tokens: Dict[str, Dict[str, Any]], filename: str) -> None:
+    """Собирает Excel отчет по токенам и сохраняет его в указанный файл."""
+    # Подготавливаем данные для Excel
+    tokens_data = []
+    
+    # Загружаем базу отслеживания токенов один раз на весь отчет
+    tracker_data = {}
     try:
-        # Получаем все активные токены
-        active_tokens = token_storage.get_active_tokens()
-        
-        if not active_tokens:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="Нет активных токенов для генерации Excel файла."
-            )
-            return
-        
-        # Подготавливаем данные для Excel
-        tokens_data = []
-        
-        for query, token_data in active_tokens.items():
-            try:
-                token_info = token_data.get('token_info', {})
-                initial_data = token_data.get('initial_data', {})
-                ath_market_cap = token_data.get('ath_market_cap', 0)
-                
-                # Получаем базовую информацию о токене
-                ticker = token_info.get('ticker', 'Неизвестно')
-                ticker_address = token_info.get('ticker_address', 'Неизвестно')
-                
-                # Получаем данные о маркет капах
-                current_market_cap = token_info.get('raw_market_cap', 0)
-                initial_market_cap = initial_data.get('raw_market_cap', 0)
-                
-                # Вычисляем множитель роста более точно - используем ATH / initial
-                multiplier = 1.0
-                if initial_market_cap and ath_market_cap and isinstance(initial_market_cap, (int, float)) and isinstance(ath_market_cap, (int, float)) and initial_market_cap > 0:
-                    multiplier = round(ath_market_cap / initial_market_cap, 2)
-                
-                # Данные о возрасте токена
-                token_age = token_info.get('token_age', 'Неизвестно')
+        tracker_data = shared_store.get_store().items(shared_store.NS_TRACKER)
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке данных из базы отслеживания: {e}")
+    
+    for query, token_data in active_tokens.items():
+        try:
+            token_info = token_data.get('token_info', {})
+            initial_data = token_data.get('initial_data', {})
+            ath_market_cap = token_data.get('ath_market_cap', 0)
+            
+            # Получаем базовую информацию о токене
+            ticker = token_info.get('ticker', 'Неизвестно')
+            ticker_address = token_info.get('ticker_address', 'Неизвестно')
+            
+            # Получаем данные о маркет капах
+            current_market_cap = token_info.get('raw_market_cap', 0)
+            initial_market_cap = initial_data.get('raw_market_cap', 0)
+            
+            # Вычисляем множитель роста более точно - используем ATH / initial
+            multiplier = 1.0
+            if initial_market_cap and ath_market_cap and isinstance(initial_market_cap, (int, float)) and isinstance(ath_market_cap, (int, float)) and initial_market_cap > 0:
+                multiplier = round(ath_market_cap / initial_market_cap, 2)
+            
+            # Данные о возрасте токена
+            token_age = token_info.get('token_age', 'Неизвестно')
+            
+            # Информация о времени добавления
+            added_time = datetime.datetime.fromtimestamp(token_data.get('added_time', 0)).strftime('%Y-%m-%d %H:%M:%S')
+            
+            # Получаем время достижения ATH
+            ath_time = "Неизвестно"
+            if 'ath_time' in token_data:
+                ath_timestamp = token_data.get('ath_time', 0)
+                if ath_timestamp:
+                    ath_time = datetime.datetime.fromtimestamp(ath_timestamp).strftime('%Y-%m-%d %H:%M:%S')
+            
+            # Получаем информацию о DEX
+            dex_info = "Неизвестно"
+            if 'dex_info' in token_info:
+                dex_info = token_info.get('dex_info', 'Неизвестно')
+            
+            # Получаем полные данные о тренде транзакций и формируем строку
+            txns_data_str = "Нет данных"
+            if 'txns_trend' in token_info:
+                txns_trend = token_info.get('txns_trend', {})
+                txns_str_parts = []
                 
-                # Информация о времени добавления
-                added_time = datetime.datetime.fromtimestamp(token_data.get('added_time', 0)).strftime('%Y-%m-%d %H:%M:%S')
+                # m5
+                m5_buys = txns_trend.get('m5_buys', 0)
+                m5_sells = txns_trend.get('m5_sells', 0)
+                if m5_buys > 0 or m5_sells > 0:
+                    txns_str_parts.append(f"m5: {m5_buys}/{m5_sells}")
                 
-                # Получаем время достижения ATH
-                ath_time = "Неизвестно"
-                if 'ath_time' in token_data:
-                    ath_timestamp = token_data.get('ath_time', 0)
-                    if ath_timestamp:
-                        ath_time = datetime.datetime.fromtimestamp(ath_timestamp).strftime('%Y-%m-%d %H:%M:%S')
+                # h1
+                h1_buys = txns_trend.get('h1_buys', 0)
+                h1_sells = txns_trend.get('h1_sells', 0)
+                if h1_buys > 0 or h1_sells > 0:
+                    txns_str_parts.append(f"h1: {h1_buys}/{h1_sells}")
                 
-                # Получаем информацию о DEX
-                dex_info = "Неизвестно"
-                if 'dex_info' in token_info:
-                    dex_info = token_info.get('dex_info', 'Неизвестно')
+                # h24
+                h24_buys = txns_trend.get('h24_buys', 0)
+                h24_sells = txns_trend.get('h24_sells', 0)
+                if h24_buys > 0 or h24_sells > 0:
+                    txns_str_parts.append(f"h24: {h24_buys}/{h24_sells}")
                 
-                # Получаем полные данные о тренде транзакций и формируем строку
-                txns_data_str = "Нет данных"
-                if 'txns_trend' in token_info:
-                    txns_trend = token_info.get('txns_trend', {})
+                if txns_str_parts:
+                    txns_data_str = ", ".join(txns_str_parts)
+            
+            # Получаем полную информацию о PumpFun
+            pumpfun_data_str = "Нет"
+            has_boosts = "Нет"
+            if 'pumpfun_data' in token_info:
+                pumpfun_data = token_info.get('pumpfun_data', {})
+                if pumpfun_data:
+                    # Извлекаем txns
+                    pumpfun_txns = pumpfun_data.get('txns', {})
                     txns_str_parts = []
                     
                     # m5
-                    m5_buys = txns_trend.get('m5_buys', 0)
-                    m5_sells = txns_trend.get('m5_sells', 0)
-                    if m5_buys > 0 or m5_sells > 0:
-                        txns_str_parts.append(f"m5: {m5_buys}/{m5_sells}")
+                    m5 = pumpfun_txns.get('m5', {})
+                    if m5:
+                        txns_str_parts.append(f"m5: {m5.get('buys', 0)}/{m5.get('sells', 0)}")
                     
                     # h1
-                    h1_buys = txns_trend.get('h1_buys', 0)
-                    h1_sells = txns_trend.get('h1_sells', 0)
-                    if h1_buys > 0 or h1_sells > 0:
-                        txns_str_parts.append(f"h1: {h1_buys}/{h1_sells}")
+                    h1 = pumpfun_txns.get('h1', {})
+                    if h1:
+                        txns_str_parts.append(f"h1: {h1.get('buys', 0)}/{h1.get('sells', 0)}")
                     
-                    # h24
-                    h24_buys = txns_trend.get('h24_buys', 0)
-                    h24_sells = txns_trend.get('h24_sells', 0)
-                    if h24_buys > 0 or h24_sells > 0:
-                        txns_str_parts.append(f"h24: {h24_buys}/{h24_sells}")
+                    # h6
+                    h6 = pumpfun_txns.get('h6', {})
+                    if h6:
+                        txns_str_parts.append(f"h6: {h6.get('buys', 0)}/{h6.get('sells', 0)}")
                     
-                    if txns_str_parts:
-                        txns_data_str = ", ".join(txns_str_parts)
-                
-                # Получаем полную информацию о PumpFun
-                pumpfun_data_str = "Нет"
-                has_boosts = "Нет"
-                if 'pumpfun_data' in token_info:
-                    pumpfun_data = token_info.get('pumpfun_data', {})
-                    if pumpfun_data:
-                        # Извлекаем txns
-                        pumpfun_txns = pumpfun_data.get('txns', {})
-                        txns_str_parts = []
-                        
-                        # m5
-                        m5 = pumpfun_txns.get('m5', {})
-                        if m5:
-                            txns_str_parts.append(f"m5: {m5.get('buys', 0)}/{m5.get('sells', 0)}")
-                        
-                        # h1
-                        h1 = pumpfun_txns.get('h1', {})
-                        if h1:
-                            txns_str_parts.append(f"h1: {h1.get('buys', 0)}/{h1.get('sells', 0)}")
-                        
-                        # h6
-                        h6 = pumpfun_txns.get('h6', {})
-                        if h6:
-                            txns_str_parts.append(f"h6: {h6.get('buys', 0)}/{h6.get('sells', 0)}")
-                        
-                        # h24
-                        h24 = pumpfun_txns.get('h24', {})
-                        if h24:
-                            txns_str_parts.append(f"h24: {h24.get('buys', 0)}/{h24.get('sells', 0)}")
-                        
-                        pumpfun_data_str = ", ".join(txns_str_parts)
-                        
-                        # Проверяем наличие бустов
-                        boosts = pumpfun_data.get('boosts')
-                        if boosts:
-                            has_boosts = "Да"
-                
-                # Форматируем маркет капы для отображения
-                current_market_cap_formatted = format_number(current_market_cap) if isinstance(current_market_cap, (int, float)) else "Неизвестно"
-                initial_market_cap_formatted = format_number(initial_market_cap) if isinstance(initial_market_cap, (int, float)) else "Неизвестно"
-                ath_market_cap_formatted = format_number(ath_market_cap) if isinstance(ath_market_cap, (int, float)) else "Неизвестно"
-                            
-                # Получаем информацию о количестве сигналов из каналов
-                channel_count = 0
-                channels = []
-                first_seen = "Неизвестно"
-                signal_reached_time = "Неизвестно"
-                
-                # Загружаем данные из файла отслеживания токенов, если он существует
-                try:
-                    TRACKER_DB_FILE = 'tokens_tracker_database.json'
-                    if os.path.exists(TRACKER_DB_FILE):
-                        with open(TRACKER_DB_FILE, 'r', encoding='utf-8') as f:
-                            tracker_data = json.load(f)
-                            
-                        # Проверяем есть ли данные о токене в базе отслеживания
-                        if query in tracker_data:
-                            token_tracker_data = tracker_data[query]
-                            channel_count = token_tracker_data.get('channel_count', 0)
-                            channels = token_tracker_data.get('channels', [])
-                            first_seen = token_tracker_data.get('first_seen', 'Неизвестно')
-                            signal_reached_time = token_tracker_data.get('signal_reached_time', 'Неизвестно')
-                        else:
-                            # Если не нашли по точному совпадению, пробуем поискать адрес в ключах
-                            for tracker_query, tracker_data_item in tracker_data.items():
-                                if query in tracker_query or tracker_query in query:
-                                    channel_count = tracker_data_item.get('channel_count', 0)
-                                    channels = tracker_data_item.get('channels', [])
-                                    first_seen = tracker_data_item.get('first_seen', 'Неизвестно')
-                                    signal_reached_time = tracker_data_item.get('signal_reached_time', 'Неизвестно')
-                                    break
-                except Exception as e:
-                    logger.error(f"Ошибка при загрузке данных из файла отслеживания: {e}")
-                
-                # Формируем данные для Excel (только начальные данные)
-                # Расставляем столбцы логически, группируя связанные данные
-                row = {
-                    # Базовая информация о токене
-                    'Тикер': ticker,
-                    'Адрес токена': ticker_address,
-                    'Возраст токена': token_age,
-                    'Дата добавления': added_time,
-                    
-                    # Данные о сигналах из каналов (из tokens_tracker_database)
-                    'Количество сигналов': channel_count,
-                    'Первое обнаружение': first_seen,
-                    'Время достижения сигнала': signal_reached_time,
+                    # h24
+                    h24 = pumpfun_txns.get('h24', {})
+                    if h24:
+                        txns_str_parts.append(f"h24: {h24.get('buys', 0)}/{h24.get('sells', 0)}")
                     
-                    # Данные о Market Cap
-                    'Market Cap (начальный)': initial_market_cap_formatted,
-                    'Market Cap (ATH)': ath_market_cap_formatted,
-                    'Время достижения ATH': ath_time,
-                    'Множитель роста': f"{multiplier}x",
+                    pumpfun_data_str = ", ".join(txns_str_parts)
                     
-                    # Данные о DEX и транзакциях
-                    'DEX': dex_info,
-                    'Транзакции': txns_data_str,
-                    'PumpFun транзакции': pumpfun_data_str,
-                    'PumpFun бусты': has_boosts,
-                }
-                
-                # Добавляем список каналов, если они есть
-                if channels:
-                    row['Каналы'] = ', '.join(channels)
-                
-                # Добавляем данные о объемах торгов
-                if 'volume_5m' in token_info:
-                    row['Объем за 5 минут'] = token_info.get('volume_5m', 'Неизвестно')
-                
-                if 'volume_1h' in token_info:
-                    row['Объем за 1 час'] = token_info.get('volume_1h', 'Неизвестно')
-                
-                # Добавляем информацию о социальных сетях и сайтах если есть
-                websites = token_info.get('websites', [])
-                socials = token_info.get('socials', [])
-                
-                if websites:
-                    website_links = [f"{website.get('label', 'Website')}: {website.get('url', '')}" 
-                                    for website in websites if website.get('url')]
-                    row['Сайты'] = '; '.join(website_links)
+                    # Проверяем наличие бустов
+                    boosts = pumpfun_data.get('boosts')
+                    if boosts:
+                        has_boosts = "Да"
+            
+            # Форматируем маркет капы для отображения
+            current_market_cap_formatted = format_number(current_market_cap) if isinstance(current_market_cap, (int, float)) else "Неизвестно"
+            initial_market_cap_formatted = format_number(initial_market_cap) if isinstance(initial_market_cap, (int, float)) else "Неизвестно"
+            ath_market_cap_formatted = format_number(ath_market_cap) if isinstance(ath_market_cap, (int, float)) else "Неизвестно"
+                        
+            # Получаем информацию о количестве сигналов из каналов
+            channel_count = 0
+            channels = []
+            first_seen = "Неизвестно"
+            signal_reached_time = "Неизвестно"
+            
+            # Берем данные из базы отслеживания токенов, если она есть
+            try:
+                if tracker_data:
+                    # Проверяем есть ли данные о токене в базе отслеживания
+                    if query in tracker_data:
+                        token_tracker_data = tracker_data[query]
+                        channel_count = token_tracker_data.get('channel_count', 0)
+                        channels = token_tracker_data.get('channels', [])
+                        first_seen = token_tracker_data.get('first_seen', 'Неизвестно')
+                        signal_reached_time = token_tracker_data.get('signal_reached_time', 'Неизвестно')
+                    else:
+                        # Если не нашли по точному совпадению, пробуем поискать адрес в ключах
+                        for tracker_query, tracker_data_item in tracker_data.items():
+                            if query in tracker_query or tracker_query in query:
+                                channel_count = tracker_data_item.get('channel_count', 0)
+                                channels = tracker_data_item.get('channels', [])
+                                first_seen = tracker_data_item.get('first_seen', 'Неизвестно')
+                                signal_reached_time = tracker_data_item.get('signal_reached_time', 'Неизвестно')
+                                break
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке данных из файла отслеживания: {e}")
+            
+            # Формируем данные для Excel (только начальные данные)
+            # Расставляем столбцы логически, группируя связанные данные
+            row = {
+                # Базовая информация о токене
+                'Тикер': ticker,
+                'Адрес токена': ticker_address,
+                'Возраст токена': token_age,
+                'Дата добавления': added_time,
                 
-                if socials:
-                    social_links = [f"{social.get('type', '').capitalize()}: {social.get('url', '')}" 
-                                    for social in socials if social.get('url') and social.get('type')]
-                    row['Соцсети'] = '; '.join(social_links)
+                # Данные о сигналах из каналов (из tokens_tracker_database)
+                'Количество сигналов': channel_count,
+                'Первое обнаружение': first_seen,
+                'Время достижения сигнала': signal_reached_time,
                 
-                # Добавляем только одну строку (начальную) в данные
-                tokens_data.append(row)
+                # Данные о Market Cap
+                'Market Cap (начальный)': initial_market_cap_formatted,
+                'Market Cap (ATH)': ath_market_cap_formatted,
+                'Время достижения ATH': ath_time,
+                'Множитель роста': f"{multiplier}x",
                 
-            except Exception as e:
-                logger.error(f"Ошибка при обработке токена {query} для Excel: {e}")
-                import traceback
-                logger.error(traceback.format_exc())
-        
-        # Создаем DataFrame и сохраняем Excel файл
-        df = pd.DataFrame(tokens_data)
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f'tokens_data_{timestamp}.xlsx'
-        
-        # Настраиваем параметры Excel файла
-        with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Tokens Data')
-            
-            # Получаем объект листа для форматирования
-            worksheet = writer.sheets['Tokens Data']
-            
-            # Настраиваем ширину столбцов
-            for idx, col in enumerate(df.columns):
-                max_len = max(
-                    df[col].astype(str).map(len).max(),  # длина самого длинного значения
-                    len(str(col))  # длина заголовка
-                )
-                # Устанавливаем ширину столбца (с небольшим запасом)
-                worksheet.column_dimensions[chr(65 + idx)].width = max_len + 2
+                # Данные о DEX и транзакциях
+                'DEX': dex_info,
+                'Транзакции': txns_data_str,
+                'PumpFun транзакции': pumpfun_data_str,
+                'PumpFun бусты': has_boosts,
+            }
+            
+            # Добавляем список каналов, если они есть
+            if channels:
+                row['Каналы'] = ', '.join(channels)
+            
+            # Добавляем данные о объемах торгов
+            if 'volume_5m' in token_info:
+                row['Объем за 5 минут'] = token_info.get('volume_5m', 'Неизвестно')
+            
+            if 'volume_1h' in token_info:
+                row['Объем за 1 час'] = token_info.get('volume_1h', 'Неизвестно')
+            
+            # Добавляем информацию о социальных сетях и сайтах если есть
+            websites = token_info.get('websites', [])
+            socials = token_info.get('socials', [])
+            
+            if websites:
+                website_links = [f"{website.get('label', 'Website')}: {website.get('url', '')}" 
+                                for website in websites if website.get('url')]
+                row['Сайты'] = '; '.join(website_links)
+            
+            if socials:
+                social_links = [f"{social.get('type', '').capitalize()}: {social.get('url', '')}" 
+                                for social in socials if social.get('url') and social.get('type')]
+                row['Соцсети'] = '; '.join(social_links)
+            
+            # Добавляем только одну строку (начальную) в данные
+            tokens_data.append(row)
+            
+        except Exception as e:
+            logger.error(f"Ошибка при обработке токена {query} для Excel: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+    
+    # Создаем DataFrame и сохраняем Excel файл
+    df = pd.DataFrame(tokens_data)
+    
+    # Настраиваем параметры Excel файла
+    with pd.ExcelWriter(filename, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Tokens Data')
+        
+        # Получаем объект листа для форматирования
+        worksheet = writer.sheets['Tokens Data']
+        
+        # Настраиваем ширину столбцов
+        for idx, col in enumerate(df.columns):
+            max_len = max(
+                df[col].astype(str).map(len).max(),  # длина самого длинного значения
+                len(str(col))  # длина заголовка
+            )
+            # Устанавливаем ширину столбца (с небольшим запасом)
+            worksheet.column_dimensions[chr(65 + idx)].width = max_len + 2
+
+async def generate_excel(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
+    """Генерирует Excel файл со всеми данными о токенах."""
+    try:
+        # Получаем все активные токены
+        active_tokens = token_storage.get_active_tokens()
+        
+        if not active_tokens:
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text="Нет активных токенов для генерации Excel файла."
+            )
+            return
+        
+        # Собираем отчет заново только если хранилище или база трекера изменились
+        global excel_report_key
+        tracker_version = shared_store.get_store().version(shared_store.NS_TRACKER)
+        report_key = (token_storage.get_store_version(), tracker_version)
+        
+        if report_key != excel_report_key or not os.path.exists(EXCEL_REPORT_PATH):
+            build_excel_report(active_tokens, EXCEL_REPORT_PATH)
+            excel_report_key = report_key
+        else:
+            logger.info("Excel отчет не изменился, отправляем кэшированный файл")
         
         # Отправляем файл пользователю
         try:
-            with open(filename, 'rb') as excel_file:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            with open(EXCEL_REPORT_PATH, 'rb') as excel_file:
                 await context.bot.send_document(
                     chat_id=chat_id, 
                     document=excel_file, 
+                    filename=f'tokens_data_{timestamp}.xlsx',
                     caption="📊 Excel файл с данными о токенах."
                 )
-            
-            # Удаляем временный файл
-            os.remove(filename)
         except Exception as e:
             logger.error(f"Ошибка при отправке Excel файла: {e}")
             await context.bot.send_message(
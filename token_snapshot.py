@@ -0,0 +1,178 @@
+import os
+import json
+import struct
+import zlib
+import logging
+from collections.abc import Mapping
+from typing import Dict, Any, Optional, Tuple, Callable, Iterator
+
+# orjson и zstandard необязательны: без них используются json и zlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Заголовок файла: сигнатура, версия формата, способ сжатия, количество записей
+MAGIC = b'TKSNAP'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<6sBBQ')
+
+# Способы сжатия тела снапшота
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+# Длина ключа и значения перед каждой записью
+FRAME = struct.Struct('<II')
+
+def _dumps(value: Any, default: Optional[Callable] = None) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=default).encode('utf-8')
+
+def _loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data).decode('utf-8'))
+
+def default_codec() -> int:
+    """Возвращает лучший доступный способ сжатия."""
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+def _compress(body: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if codec == CODEC_ZLIB:
+        return zlib.compress(body, 1)
+    return body
+
+def _decompress(body: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Снапшот сжат zstd, но модуль zstandard не установлен")
+        return zstandard.ZstdDecompressor().decompress(body)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(body)
+    return body
+
+def pack(data: Mapping, default: Optional[Callable] = None) -> Tuple[int, bytes]:
+    """
+    Сериализует словарь записей в тело снапшота (без сжатия).
+    Каждая запись кодируется отдельно, что позволяет потом читать их по одной.
+    """
+    parts = []
+    for key, value in data.items():
+        key_bytes = str(key).encode('utf-8')
+        value_bytes = _dumps(value, default)
+        parts.append(FRAME.pack(len(key_bytes), len(value_bytes)))
+        parts.append(key_bytes)
+        parts.append(value_bytes)
+    return len(data), b''.join(parts)
+
+def write(path: str, count: int, body: bytes, codec: Optional[int] = None) -> None:
+    """Сжимает тело и атомарно записывает снапшот (временный файл + rename)."""
+    codec = default_codec() if codec is None else codec
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, codec, count))
+        snapshot_file.write(_compress(body, codec))
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(tmp_path, path)
+
+def dump(path: str, data: Mapping, default: Optional[Callable] = None, codec: Optional[int] = None) -> None:
+    """Сериализует и атомарно записывает снапшот."""
+    count, body = pack(data, default)
+    write(path, count, body, codec)
+
+def read_header(path: str) -> Tuple[int, int, int]:
+    """Читает заголовок снапшота. Возвращает (версия, способ сжатия, количество записей)."""
+    with open(path, 'rb') as snapshot_file:
+        return _parse_header(snapshot_file.read(HEADER.size), path)
+
+def _parse_header(raw: bytes, path: str) -> Tuple[int, int, int]:
+    if len(raw) < HEADER.size:
+        raise ValueError(f"Файл {path} слишком короткий для снапшота")
+    magic, version, codec, count = HEADER.unpack(raw[:HEADER.size])
+    if magic != MAGIC:
+        raise ValueError(f"Файл {path} не является снапшотом токенов")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Неподдерживаемая версия снапшота {version} в файле {path}")
+    return version, codec, count
+
+def is_snapshot(path: str) -> bool:
+    """Проверяет, что файл начинается с сигнатуры снапшота."""
+    try:
+        with open(path, 'rb') as snapshot_file:
+            return snapshot_file.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def _read_body(path: str) -> Tuple[int, bytes]:
+    with open(path, 'rb') as snapshot_file:
+        raw = snapshot_file.read()
+    _, codec, count = _parse_header(raw, path)
+    return count, _decompress(raw[HEADER.size:], codec)
+
+def _frames(body: bytes) -> Iterator[Tuple[str, int, int]]:
+    """Перебирает записи тела: (ключ, начало значения, конец значения)."""
+    offset = 0
+    size = len(body)
+    while offset < size:
+        key_length, value_length = FRAME.unpack_from(body, offset)
+        offset += FRAME.size
+        key = body[offset:offset + key_length].decode('utf-8')
+        offset += key_length
+        yield key, offset, offset + value_length
+        offset += value_length
+
+def read(path: str) -> Dict[str, Any]:
+    """Загружает снапшот целиком."""
+    count, body = _read_body(path)
+    view = memoryview(body)
+    data = {key: _loads(view[start:end]) for key, start, end in _frames(body)}
+    if len(data) != count:
+        logger.warning(f"В снапшоте {path} заявлено {count} записей, прочитано {len(data)}")
+    return data
+
+class LazySnapshot(Mapping):
+    """
+    Снапшот, записи которого разбираются при первом обращении.
+
+    При открытии читается заголовок и строится индекс смещений записей,
+    сами значения декодируются только по запросу.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count, self._body = _read_body(path)
+        self._offsets = {key: (start, end) for key, start, end in _frames(self._body)}
+        self._cache: Dict[str, Any] = {}
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._cache:
+            return self._cache[key]
+        start, end = self._offsets[key]
+        value = self._cache[key] = _loads(memoryview(self._body)[start:end])
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._offsets
+
+def open_lazy(path: str) -> LazySnapshot:
+    """Открывает снапшот для ленивого чтения записей."""
+    return LazySnapshot(path)
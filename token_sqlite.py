@@ -0,0 +1,266 @@
+import json
+import logging
+import sqlite3
+import threading
+from typing import Dict, Any, Optional, List, Iterable, Tuple, Callable
+
+from token_record import TokenRecord, to_json
+
+# Настройка логгирования
+logger = logging.getLogger(__name__)
+
+# Схема таблицы токенов: данные токена хранятся целиком в колонке data (JSON),
+# а поля, по которым идут выборки, вынесены в отдельные индексируемые колонки
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    query TEXT PRIMARY KEY,
+    added_time REAL NOT NULL DEFAULT 0,
+    hidden INTEGER NOT NULL DEFAULT 0,
+    chat_id INTEGER,
+    ticker TEXT,
+    address TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tokens_added_time ON tokens(added_time);
+CREATE INDEX IF NOT EXISTS idx_tokens_hidden_added_time ON tokens(hidden, added_time);
+CREATE INDEX IF NOT EXISTS idx_tokens_chat_id ON tokens(chat_id);
+CREATE INDEX IF NOT EXISTS idx_tokens_ticker ON tokens(ticker);
+"""
+
+# Индексы по колонкам, добавленным после первой версии схемы
+SCHEMA_ADDRESS_INDEX = "CREATE INDEX IF NOT EXISTS idx_tokens_address ON tokens(address);"
+
+def _index_columns(data: Dict[str, Any]) -> Tuple[float, int, Optional[int], Optional[str], Optional[str]]:
+    """Извлекает из данных токена значения индексируемых колонок."""
+    added_time = data.get('added_time') or 0
+    hidden = 1 if data.get('hidden', False) else 0
+    chat_id = data.get('chat_id')
+    token_info = data.get('token_info') or {}
+    ticker = token_info.get('ticker')
+    address = token_info.get('ticker_address')
+    return (
+        float(added_time), hidden, chat_id,
+        ticker.lower() if isinstance(ticker, str) else None,
+        address if isinstance(address, str) else None
+    )
+
+class SQLiteTokenEngine:
+    """
+    Хранилище токенов на SQLite в режиме WAL.
+
+    WAL позволяет процессу бота и трекеру читать базу параллельно с записью,
+    а индексы по added_time, hidden, chat_id и тикеру заменяют полный перебор
+    словаря токенов выборками по индексу.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        logger.info(f"Открыта SQLite база токенов {db_path}")
+
+    def _migrate(self) -> None:
+        """Добавляет в существующую базу колонки из новых версий схемы."""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(tokens)").fetchall()}
+        if 'address' not in columns:
+            self._conn.execute("ALTER TABLE tokens ADD COLUMN address TEXT")
+            rows = self._conn.execute("SELECT query, data FROM tokens").fetchall()
+            for query, data in rows:
+                try:
+                    address = _index_columns(json.loads(data))[4]
+                except ValueError:
+                    continue
+                self._conn.execute("UPDATE tokens SET address = ? WHERE query = ?", (address, query))
+            logger.info("В SQLite базу токенов добавлена колонка address")
+        self._conn.execute(SCHEMA_ADDRESS_INDEX)
+
+    def _rows_to_dict(self, rows: Iterable[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        """Преобразует строки (query, data) в словарь токенов."""
+        result = {}
+        for query, data in rows:
+            try:
+                result[query] = TokenRecord(json.loads(data))
+            except ValueError as e:
+                logger.error(f"Поврежденные данные токена '{query}' в SQLite базе: {e}")
+        return result
+
+    def _select(self, where: str = "", params: tuple = ()) -> Dict[str, Dict[str, Any]]:
+        sql = "SELECT query, data FROM tokens"
+        if where:
+            sql += f" WHERE {where}"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return self._rows_to_dict(rows)
+
+    def get(self, query: str) -> Optional[Dict[str, Any]]:
+        """Возвращает данные токена по ключу."""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM tokens WHERE query = ?", (query,)).fetchone()
+        if not row:
+            return None
+        return TokenRecord(json.loads(row[0]))
+
+    def get_many(self, queries: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Возвращает данные нескольких токенов (отсутствующие пропускаются)."""
+        result = {}
+        # Ограничение SQLite на количество параметров - читаем пачками
+        for start in range(0, len(queries), 500):
+            chunk = queries[start:start + 500]
+            result.update(self._select(f"query IN ({','.join('?' * len(chunk))})", tuple(chunk)))
+        return result
+
+    def contains(self, query: str) -> bool:
+        """Проверяет наличие токена в базе."""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM tokens WHERE query = ?", (query,)).fetchone()
+        return row is not None
+
+    def count(self, include_hidden: bool = True) -> int:
+        """Возвращает количество токенов."""
+        sql = "SELECT COUNT(*) FROM tokens" if include_hidden else "SELECT COUNT(*) FROM tokens WHERE hidden = 0"
+        with self._lock:
+            return self._conn.execute(sql).fetchone()[0]
+
+    def data_version(self) -> int:
+        """Возвращает счетчик изменений базы, сделанных другими соединениями."""
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def put(self, query: str, data: Dict[str, Any]) -> None:
+        """Сохраняет токен целиком (вставка или замена)."""
+        added_time, hidden, chat_id, ticker, address = _index_columns(data)
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=to_json)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tokens (query, added_time, hidden, chat_id, ticker, address, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (query, added_time, hidden, chat_id, ticker, address, payload)
+            )
+
+    def put_many(self, items: Dict[str, Dict[str, Any]]) -> None:
+        """Сохраняет несколько токенов в одной транзакции."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for query, data in items.items():
+                    self.put(query, data)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update_fields(self, query: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Обновляет поля токена в одной транзакции.
+        Возвращает обновленные данные или None, если токен не найден.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM tokens WHERE query = ?", (query,)).fetchone()
+                if not row:
+                    self._conn.execute("ROLLBACK")
+                    return None
+                data = TokenRecord(json.loads(row[0]))
+                data.update(fields)
+                self.put(query, data)
+                self._conn.execute("COMMIT")
+                return data
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def modify_many(self, queries: List[str], modifier: Callable[[str, TokenRecord], bool]) -> List[str]:
+        """
+        Изменяет несколько токенов в одной транзакции.
+        modifier(query, data) меняет запись на месте и возвращает True, если ее нужно сохранить.
+        Возвращает список сохраненных токенов.
+        """
+        modified = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for query, data in self.get_many(queries).items():
+                    if modifier(query, data):
+                        self.put(query, data)
+                        modified.append(query)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return modified
+
+    def delete(self, query: str) -> bool:
+        """Удаляет токен. Возвращает True, если токен был в базе."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM tokens WHERE query = ?", (query,))
+        return cursor.rowcount > 0
+
+    def delete_many(self, queries: List[str]) -> None:
+        """Удаляет несколько токенов в одной транзакции."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("DELETE FROM tokens WHERE query = ?", [(q,) for q in queries])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def clear(self) -> int:
+        """Удаляет все токены. Возвращает количество удаленных записей."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM tokens")
+        return cursor.rowcount
+
+    def all(self, include_hidden: bool = True) -> Dict[str, Dict[str, Any]]:
+        """Возвращает все токены (по индексу hidden, если скрытые не нужны)."""
+        if include_hidden:
+            return self._select()
+        return self._select("hidden = 0")
+
+    def hidden(self) -> Dict[str, Dict[str, Any]]:
+        """Возвращает скрытые токены."""
+        return self._select("hidden = 1")
+
+    def added_since(self, since: float, include_hidden: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Возвращает токены, добавленные не раньше указанного времени."""
+        if include_hidden:
+            return self._select("added_time >= ?", (since,))
+        return self._select("hidden = 0 AND added_time >= ?", (since,))
+
+    def added_before(self, before: float) -> List[str]:
+        """Возвращает ключи токенов, добавленных раньше указанного времени."""
+        with self._lock:
+            rows = self._conn.execute("SELECT query FROM tokens WHERE added_time < ?", (before,)).fetchall()
+        return [row[0] for row in rows]
+
+    def by_ticker(self, ticker: str) -> List[str]:
+        """Возвращает ключи токенов с указанным тикером (без учета регистра)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT query FROM tokens WHERE ticker = ?", (ticker.lower(),)).fetchall()
+        return [row[0] for row in rows]
+
+    def by_address(self, address: str) -> List[str]:
+        """Возвращает ключи токенов с указанным адресом контракта."""
+        with self._lock:
+            rows = self._conn.execute("SELECT query FROM tokens WHERE address = ?", (address,)).fetchall()
+        return [row[0] for row in rows]
+
+    def chat_ids(self) -> List[int]:
+        """Возвращает уникальные chat_id по индексу (пустые значения, как и в режиме JSON, пропускаются)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT chat_id FROM tokens WHERE chat_id IS NOT NULL AND chat_id != 0"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        """Закрывает соединение с базой."""
+        with self._lock:
+            self._conn.close()
@@ -2,17 +2,28 @@ import logging
 import time
 import os
 import json
-from typing import Dict, Any, Optional, List
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Mapping
+from typing import Dict, Any, Optional, List, Iterable
 import pandas as pd
 from datetime import datetime
 
+import shared_store
+import token_history
+from token_archive import TokenArchive
+from token_blobs import BlobStore
+from token_journal import TokenJournal
+from token_record import TokenRecord
+from token_sqlite import SQLiteTokenEngine
+
 # Настройка логгирования
 logger = logging.getLogger(__name__)
 
 # Словарь для хранения данных о токенах
 # Ключ: запрос пользователя (адрес или название токена)
-# Значение: словарь с данными о токене
-token_data_store: Dict[str, Dict[str, Any]] = {}
+# Значение: компактная запись TokenRecord (ведет себя как словарь с данными о токене)
+token_data_store: Dict[str, TokenRecord] = {}
 
 # Интервал для автоматической проверки токенов (в секундах)
 AUTO_CHECK_INTERVAL = 60  # 1 минута
@@ -26,120 +37,530 @@ TOKEN_RETENTION_PERIOD = 31536000  # 1 год
 # Словарь для хранения ID сообщений со списками токенов для каждого чата
 list_message_ids = {}
 
-# Путь к файлу Excel с базой токенов
+# Путь к файлу Excel с базой токенов (строится по запросу из данных хранилища)
 EXCEL_DB_PATH = "tokens_database.xlsx"
 
+# Версия хранилища: увеличивается при каждом изменении данных о токенах
+store_version = 0
+
+# Версия хранилища, для которой последний раз собирался Excel файл
+excel_version = None
+
 # Путь к JSON-файлу для постоянного хранения данных
 JSON_DB_PATH = "tokens_database.json"
 
+# Формат снапшота: "json" или "binary" (token_snapshot, файл tokens_database.snap)
+SNAPSHOT_FORMAT = os.environ.get("TOKEN_SNAPSHOT_FORMAT", "json")
+
+# Журнал изменений: снапшот хранится в JSON_DB_PATH, мутации дописываются в JSON_DB_PATH.wal
+journal = TokenJournal(JSON_DB_PATH, snapshot_format=SNAPSHOT_FORMAT)
+
+# Движок хранения: "json" (словарь в памяти + журнал) или "sqlite" (SQLite в режиме WAL)
+STORAGE_ENGINE = os.environ.get("TOKEN_STORAGE_ENGINE", "json")
+
+# Путь к SQLite базе токенов (используется при STORAGE_ENGINE = "sqlite")
+SQLITE_DB_PATH = "tokens_database.sqlite"
+
+# SQLite движок; None, если данные хранятся в памяти
+sqlite_engine: Optional[SQLiteTokenEngine] = None
+if STORAGE_ENGINE == "sqlite":
+    sqlite_engine = SQLiteTokenEngine(SQLITE_DB_PATH)
+
+# Отложенная запись: измененные токены копятся в наборе и сбрасываются в журнал
+# одной пачкой раз в FLUSH_INTERVAL_MS или после FLUSH_MAX_MUTATIONS изменений
+FLUSH_INTERVAL_MS = 500
+FLUSH_MAX_MUTATIONS = 200
+
+# Токены, измененные с момента последнего сброса
+_dirty_tokens = set()
+_mutations_since_flush = 0
+# Защищает _dirty_tokens и изменения token_data_store (сжатие журнала перебирает его под этой блокировкой)
+_dirty_lock = threading.RLock()
+_flush_event = threading.Event()
+_flusher_stop = threading.Event()
+_flusher_thread: Optional[threading.Thread] = None
+
+# Вторичные индексы для режима JSON (в SQLite их роль выполняют индексы по колонкам):
+# отсортированный список (added_time, query) для выборок по времени добавления
+_time_index: List[tuple] = []
+# тикер в нижнем регистре -> ключи токенов
+_ticker_index: Dict[str, set] = {}
+# адрес контракта -> ключи токенов
+_address_index: Dict[str, set] = {}
+# Значения (added_time, тикер, адрес), под которыми токен сейчас лежит в индексах
+_indexed_keys: Dict[str, tuple] = {}
+
+def _index_keys(data: Dict[str, Any]) -> tuple:
+    """Извлекает из данных токена значения для вторичных индексов."""
+    token_info = data.get('token_info') or {}
+    ticker = token_info.get('ticker')
+    address = token_info.get('ticker_address')
+    return (
+        float(data.get('added_time') or 0),
+        ticker.lower() if isinstance(ticker, str) else None,
+        address if isinstance(address, str) else None
+    )
+
+def _index_token(query: str) -> None:
+    """Добавляет токен во вторичные индексы или обновляет их, если значения изменились."""
+    data = token_data_store.get(query)
+    if data is None:
+        _unindex_token(query)
+        return
+    keys = _index_keys(data)
+    if _indexed_keys.get(query) == keys:
+        return
+    _unindex_token(query)
+    
+    added_time, ticker, address = keys
+    insort(_time_index, (added_time, query))
+    if ticker:
+        _ticker_index.setdefault(ticker, set()).add(query)
+    if address:
+        _address_index.setdefault(address, set()).add(query)
+    _indexed_keys[query] = keys
+
+def _unindex_token(query: str) -> None:
+    """Удаляет токен из вторичных индексов."""
+    keys = _indexed_keys.pop(query, None)
+    if keys is None:
+        return
+    added_time, ticker, address = keys
+    position = bisect_left(_time_index, (added_time, query))
+    if position < len(_time_index) and _time_index[position] == (added_time, query):
+        del _time_index[position]
+    for index, key in ((_ticker_index, ticker), (_address_index, address)):
+        queries = index.get(key)
+        if queries is not None:
+            queries.discard(query)
+            if not queries:
+                del index[key]
+
+def _rebuild_indexes() -> None:
+    """Полностью перестраивает вторичные индексы из словаря токенов."""
+    global _time_index, _ticker_index, _address_index, _indexed_keys
+    _time_index = []
+    _ticker_index = {}
+    _address_index = {}
+    _indexed_keys = {query: _index_keys(data) for query, data in token_data_store.items()}
+    for query, (added_time, ticker, address) in _indexed_keys.items():
+        _time_index.append((added_time, query))
+        if ticker:
+            _ticker_index.setdefault(ticker, set()).add(query)
+        if address:
+            _address_index.setdefault(address, set()).add(query)
+    _time_index.sort()
+
+class StoreView(Mapping):
+    """
+    Неизменяемое представление токенов на момент определенной версии хранилища.
+
+    Фоновые задачи могут перебирать его, ожидая сетевые запросы, без защитных
+    копий: изменения хранилища создают новые записи (копирование при записи),
+    а сам словарь представления никогда не меняется. Представление одной версии
+    строится один раз и переиспользуется всеми читателями; cache_key подходит
+    как ключ для кэшей, зависящих от содержимого (страницы списка, Excel, статистика).
+    """
+
+    __slots__ = ('version', 'include_hidden', '_data')
+
+    def __init__(self, version: Any, data: Dict[str, Dict[str, Any]], include_hidden: bool = True):
+        self.version = version
+        self.include_hidden = include_hidden
+        self._data = data
+
+    @property
+    def cache_key(self) -> tuple:
+        return (self.version, self.include_hidden)
+
+    def __getitem__(self, query: str) -> Dict[str, Any]:
+        return self._data[query]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, query: object) -> bool:
+        return query in self._data
+
+# Последние построенные представления (со скрытыми токенами и без)
+_views: Dict[bool, StoreView] = {}
+# Токены, записи которых входят в представления или выданы читателям:
+# перед изменением такая запись копируется (режим JSON)
+_shared_records: set = set()
+
+def _writable(query: str) -> TokenRecord:
+    """Возвращает запись токена, которую можно менять на месте (копирование при записи)."""
+    data = token_data_store[query]
+    if query in _shared_records:
+        data = token_data_store[query] = data.copy()
+        _shared_records.discard(query)
+    return data
+
+def get_snapshot(include_hidden: bool = True) -> StoreView:
+    """
+    Возвращает неизменяемое представление токенов для текущей версии хранилища.
+    Пока хранилище не изменилось, возвращается одно и то же представление.
+    """
+    if sqlite_engine is not None:
+        # Версия читается до данных: представление не может оказаться старше своей версии
+        version = get_store_version()
+        view = _views.get(include_hidden)
+        if view is not None and view.version == version:
+            return view
+        data = sqlite_engine.all(include_hidden)
+    else:
+        # Версия и данные читаются под одной блокировкой: мутации меняют версию под ней же
+        with _dirty_lock:
+            version = store_version
+            view = _views.get(include_hidden)
+            if view is not None and view.version == version:
+                return view
+            if include_hidden:
+                data = dict(token_data_store)
+            else:
+                data = {query: record for query, record in token_data_store.items()
+                        if not record.get('hidden', False)}
+            _shared_records.update(data)
+    view = _views[include_hidden] = StoreView(version, data, include_hidden)
+    return view
+
+# Холодное хранилище исходных ответов API (raw_api_data), в записях токенов хранится только хэш
+RAW_API_BLOB_DIR = "raw_api_blobs"
+blob_store = BlobStore(RAW_API_BLOB_DIR)
+
+def _move_raw_api_data(data: TokenRecord) -> bool:
+    """
+    Переносит исходный ответ API из записи токена в холодное хранилище.
+    Возвращает True, если запись изменилась.
+    """
+    raw_api_data = data.pop('raw_api_data', None)
+    if raw_api_data is None:
+        return False
+    if raw_api_data:
+        data['raw_api_ref'] = blob_store.put(raw_api_data)
+    return True
+
+def get_raw_api_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Возвращает исходный ответ API для токена (загружается с диска по запросу)."""
+    if 'raw_api_data' in data:
+        return data['raw_api_data'] or {}
+    digest = data.get('raw_api_ref')
+    if not digest:
+        return {}
+    return blob_store.get(digest) or {}
+
+# Архив истекших и удаленных токенов (файлы по дням)
+ARCHIVE_DIR = "tokens_archive"
+archive = TokenArchive(ARCHIVE_DIR)
+
+def _archive_tokens(tokens: Dict[str, Dict[str, Any]], reason: str) -> None:
+    """Переносит токены в архив вместе с исходными ответами API (они будут удалены из хранилища)."""
+    def entries():
+        for query, data in tokens.items():
+            entry = data.to_dict() if isinstance(data, TokenRecord) else dict(data)
+            raw_api_data = get_raw_api_data(data)
+            if raw_api_data:
+                entry['raw_api_data'] = raw_api_data
+            yield query, entry
+    try:
+        archive.append(entries(), reason)
+    except Exception as e:
+        logger.error(f"Ошибка при архивировании токенов ({reason}): {e}")
+
 # Загружаем данные при инициализации модуля
 def load_data_from_disk():
-    """Загружает данные о токенах из JSON-файла при запуске."""
+    """Загружает данные о токенах из снапшота и журнала изменений при запуске."""
     global token_data_store
+    if sqlite_engine is not None:
+        logger.info(f"Используется SQLite хранилище: {sqlite_engine.count()} токенов")
+        return
     try:
-        if os.path.exists(JSON_DB_PATH):
-            with open(JSON_DB_PATH, 'r', encoding='utf-8') as json_file:
-                data = json.load(json_file)
-                token_data_store = data
-                logger.info(f"Загружено {len(data)} токенов из JSON файла")
+        data = journal.load()
+
+        # Трекер раньше писал свои токены в тот же файл - их место в общей базе (NS_TRACKER_TOKENS),
+        # а из журнала бота они удаляются при первом сбросе
+        tracker_records = {query: token_data for query, token_data in data.items()
+                           if shared_store.is_tracker_record(token_data)}
+        if tracker_records:
+            try:
+                shared_store.get_store().import_items(shared_store.NS_TRACKER_TOKENS, tracker_records, source=JSON_DB_PATH)
+            except Exception as e:
+                logger.error(f"Ошибка при переносе токенов трекера в общую базу: {e}")
+            else:
+                _dirty_tokens.update(tracker_records)
+                logger.info(f"Записи трекера ({len(tracker_records)} шт.) исключены из базы токенов бота")
+
+        token_data_store = {query: TokenRecord.from_dict(token_data) for query, token_data in data.items()
+                            if query not in tracker_records}
+
+        # Записи старого формата хранят ответ API целиком - переносим его в холодное хранилище
+        # (в журнал они попадут при первом сбросе)
+        migrated = [query for query, record in token_data_store.items() if _move_raw_api_data(record)]
+        _dirty_tokens.update(migrated)
+        if migrated:
+            logger.info(f"Исходные данные API {len(migrated)} токенов перенесены в {RAW_API_BLOB_DIR}")
+        _rebuild_indexes()
+        logger.info(f"Загружено {len(token_data_store)} токенов из JSON файла")
     except Exception as e:
         logger.error(f"Ошибка при загрузке данных из JSON файла: {e}")
 
 # Загружаем данные при импорте модуля
 load_data_from_disk()
 
-def save_data_to_disk():
-    """Сохраняет данные о токенах в JSON-файл для постоянного хранения."""
-    try:
-        with open(JSON_DB_PATH, 'w', encoding='utf-8') as json_file:
-            json.dump(token_data_store, json_file, ensure_ascii=False, default=str)
-        logger.info(f"Сохранено {len(token_data_store)} токенов в JSON файл")
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении данных в JSON файл: {e}")
+def save_data_to_disk(background: bool = True):
+    """Сворачивает журнал изменений в полный снапшот JSON-файла."""
+    global _mutations_since_flush
+    if sqlite_engine is None:
+        try:
+            with _dirty_lock:
+                # Снапшот содержит все изменения, поэтому отложенные записи больше не нужны
+                if journal.compact(token_data_store, background=background):
+                    _dirty_tokens.clear()
+                    _mutations_since_flush = 0
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении данных в JSON файл: {e}")
+
+def _maybe_compact_journal() -> None:
+    """Запускает фоновое сжатие журнала, если он превысил допустимый размер."""
+    if journal.needs_compaction() and not journal.is_compacting():
+        save_data_to_disk()
+
+def _mark_dirty(query: str) -> None:
+    """Помечает токен измененным; запись на диск выполнит фоновый сброс."""
+    global _mutations_since_flush
+    if sqlite_engine is not None:
+        return
+    with _dirty_lock:
+        _dirty_tokens.add(query)
+        _mutations_since_flush += 1
+        if _mutations_since_flush >= FLUSH_MAX_MUTATIONS:
+            _flush_event.set()
+    _start_flusher()
+
+def flush() -> int:
+    """
+    Записывает все измененные токены в журнал одной пачкой.
+    Возвращает количество записанных токенов.
+    """
+    global _mutations_since_flush
+    if sqlite_engine is not None:
+        return 0
+    
+    with _dirty_lock:
+        if not _dirty_tokens:
+            return 0
+        dirty = list(_dirty_tokens)
+        _dirty_tokens.clear()
+        _mutations_since_flush = 0
+        
+        # Токена уже нет в хранилище - значит, он был удален
+        upserts = {}
+        deletes = []
+        for query in dirty:
+            data = token_data_store.get(query)
+            if data is None:
+                deletes.append(query)
+            else:
+                upserts[query] = data
+        
+        try:
+            journal.append_batch(upserts, deletes)
+        except Exception as e:
+            logger.error(f"Ошибка при записи изменений в журнал: {e}")
+            _dirty_tokens.update(dirty)
+            return 0
+    
+    logger.debug(f"В журнал записано {len(dirty)} измененных токенов")
+    _maybe_compact_journal()
+    return len(dirty)
+
+def _flusher_loop() -> None:
+    """Фоновый поток: периодически сбрасывает измененные токены на диск."""
+    while not _flusher_stop.is_set():
+        _flush_event.wait(FLUSH_INTERVAL_MS / 1000)
+        _flush_event.clear()
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"Ошибка в фоновом сбросе данных: {e}")
+
+def _start_flusher() -> None:
+    """Запускает фоновый поток сброса, если он еще не запущен."""
+    global _flusher_thread
+    if _flusher_thread is not None and _flusher_thread.is_alive():
+        return
+    with _dirty_lock:
+        if _flusher_thread is None or not _flusher_thread.is_alive():
+            _flusher_stop.clear()
+            _flusher_thread = threading.Thread(target=_flusher_loop, name="token-storage-flusher", daemon=True)
+            _flusher_thread.start()
+
+def close_storage() -> None:
+    """Сбрасывает отложенные изменения, сохраняет полный снапшот и закрывает журнал. Вызывается при остановке."""
+    global _flusher_thread
+    if sqlite_engine is not None:
+        sqlite_engine.close()
+        return
+    
+    _flusher_stop.set()
+    _flush_event.set()
+    if _flusher_thread is not None:
+        _flusher_thread.join()
+        _flusher_thread = None
+    
+    flush()
+    save_data_to_disk(background=False)
+    journal.close()
+
+def _bump_version() -> None:
+    """
+    Увеличивает версию хранилища после изменения данных.
+    В режиме JSON вызывается под _dirty_lock в том же блоке, что и само изменение.
+    """
+    global store_version
+    store_version += 1
+
+def get_store_version():
+    """
+    Возвращает текущую версию хранилища.
+    Для SQLite учитываются и изменения, сделанные другими процессами.
+    """
+    if sqlite_engine is not None:
+        return (store_version, sqlite_engine.data_version())
+    return store_version
 
 def store_token_data(query: str, data: Dict[str, Any]) -> None:
     """Сохраняет данные о токене в хранилище."""
+    data = TokenRecord.from_dict(data)
+    _move_raw_api_data(data)
+    
     # Добавляем время добавления токена, если его нет
     if 'added_time' not in data:
         data['added_time'] = time.time()
     
     # По запросу: разрешаем дубликаты токенов для тестирования ATH
-    token_data_store[query] = data
+    if sqlite_engine is not None:
+        sqlite_engine.put(query, data)
+        _bump_version()
+    else:
+        # Под блокировкой: сжатие журнала перебирает token_data_store из фонового потока
+        with _dirty_lock:
+            token_data_store[query] = data
+            _index_token(query)
+            _bump_version()
     logger.info(f"Данные о токене '{query}' сохранены в хранилище")
     
-    # Сохраняем данные в Excel
-    save_token_to_excel(query, data)
+    # В режиме JSON запись на диск выполнит фоновый сброс
+    _mark_dirty(query)
+
+def bulk_store(tokens: Dict[str, Dict[str, Any]]) -> int:
+    """
+    Сохраняет несколько токенов целиком и записывает их на диск одной пачкой.
+    Возвращает количество сохраненных токенов.
+    """
+    records = {}
+    for query, data in tokens.items():
+        data = TokenRecord.from_dict(data)
+        _move_raw_api_data(data)
+        if 'added_time' not in data:
+            data['added_time'] = time.time()
+        records[query] = data
+    if not records:
+        return 0
     
-    # Также сохраняем данные в JSON для постоянного хранения
-    save_data_to_disk()
+    if sqlite_engine is not None:
+        sqlite_engine.put_many(records)
+        _bump_version()
+    else:
+        with _dirty_lock:
+            for query, data in records.items():
+                token_data_store[query] = data
+                _index_token(query)
+            _dirty_tokens.update(records)
+            _bump_version()
+        flush()
+    logger.info(f"Сохранено {len(records)} токенов одной пачкой")
+    return len(records)
 
-def save_token_to_excel(query: str, data: Dict[str, Any]) -> None:
-    """Сохраняет данные о токене в Excel с двумя строками: начальные и текущие значения."""
-    try:
-        # Подготавливаем данные для Excel
-        initial_data, current_data = prepare_excel_data(query, data)
-        
-        # Проверяем, существует ли файл Excel
-        if os.path.exists(EXCEL_DB_PATH):
-            # Загружаем существующий файл
-            try:
-                df = pd.read_excel(EXCEL_DB_PATH)
-            except Exception as e:
-                logger.error(f"Ошибка при чтении файла Excel: {e}")
-                df = pd.DataFrame()
-        else:
-            # Создаем новый DataFrame
-            df = pd.DataFrame()
-        
-        # Проверяем, есть ли уже этот токен в базе
-        if 'query' in df.columns and query in df['query'].values:
-            # Находим индексы строк с данным токеном
-            token_indices = df.index[df['query'] == query].tolist()
-            
-            if len(token_indices) >= 2:
-                # Обновляем существующие записи
-                # Первая строка (начальные значения)
-                for key, value in initial_data.items():
-                    df.at[token_indices[0], key] = value
-                
-                # Вторая строка (текущие значения)
-                for key, value in current_data.items():
-                    df.at[token_indices[1], key] = value
-                
-                # Добавляем запись об обновлении
-                df.at[token_indices[1], 'last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            else:
-                # Если существует только одна строка, удаляем ее и добавляем две новые
-                df = df[df['query'] != query]
-                
-                # Добавляем новые строки
-                initial_data['creation_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                initial_data['last_update'] = initial_data['creation_date']
-                initial_data['data_type'] = 'initial'
-                
-                current_data['creation_date'] = initial_data['creation_date']
-                current_data['last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                current_data['data_type'] = 'current'
-                
-                df = pd.concat([df, pd.DataFrame([initial_data, current_data])], ignore_index=True)
-        else:
-            # Добавляем новые строки (начальные и текущие значения)
-            initial_data['creation_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            initial_data['last_update'] = initial_data['creation_date']
-            initial_data['data_type'] = 'initial'
-            
-            current_data['creation_date'] = initial_data['creation_date']
-            current_data['last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            current_data['data_type'] = 'current'
-            
-            df = pd.concat([df, pd.DataFrame([initial_data, current_data])], ignore_index=True)
-        
-        # Сохраняем DataFrame в Excel
-        df.to_excel(EXCEL_DB_PATH, index=False)
-        logger.info(f"Данные о токене '{query}' сохранены в Excel (начальные и текущие значения)")
+def _apply_change(data: TokenRecord, change: Dict[str, Any]) -> bool:
+    """Применяет одно изменение из bulk_update к записи токена. Возвращает True, если запись изменилась."""
+    changed = False
+    for field, value in (change.get('fields') or {}).items():
+        data[field] = value
+        changed = True
     
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении данных в Excel: {e}")
+    # Вложенные данные не меняются на месте: их может разделять запись из представления
+    token_info_fields = change.get('token_info')
+    if token_info_fields and data.get('token_info') is not None:
+        token_info = data['token_info'].copy()
+        token_info.update(token_info_fields)
+        data['token_info'] = token_info
+        changed = True
+    
+    # ATH обновляется только если новое значение выше сохраненного
+    # (время ATH берется из истории замеров, если оно передано)
+    ath_candidate = change.get('ath_market_cap')
+    if isinstance(ath_candidate, (int, float)) and ath_candidate > (data.get('ath_market_cap') or 0):
+        data['ath_market_cap'] = ath_candidate
+        data['ath_time'] = change.get('ath_time') or time.time()
+        changed = True
+    return changed
+
+def bulk_update(changes: Iterable[Dict[str, Any]]) -> int:
+    """
+    Применяет пачку изменений токенов атомарно и записывает их на диск один раз.
+    
+    Каждое изменение - словарь:
+        'query'          - ключ токена (обязательно)
+        'fields'         - поля записи, которые нужно заменить (например, last_alert_multiplier)
+        'token_info'     - поля token_info, которые нужно заменить (например, market_cap)
+        'ath_market_cap' - текущий маркет кап; ATH обновится, если он выше сохраненного
+        'ath_time'       - время достижения ath_market_cap (по умолчанию - текущее)
+    Несколько изменений одного токена применяются по порядку.
+    Возвращает количество измененных токенов.
+    """
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for change in changes:
+        grouped.setdefault(change['query'], []).append(change)
+    if not grouped:
+        return 0
+    
+    def modify(query: str, data: TokenRecord) -> bool:
+        changed = False
+        for change in grouped[query]:
+            changed = _apply_change(data, change) or changed
+        return changed
+    
+    if sqlite_engine is not None:
+        updated = sqlite_engine.modify_many(list(grouped), modify)
+        if updated:
+            _bump_version()
+    else:
+        with _dirty_lock:
+            # Изменения применяются к копиям и попадают в хранилище, только если вся пачка
+            # прошла без ошибок - как откат транзакции в modify_many для SQLite
+            staged = {}
+            for query in grouped:
+                if query in token_data_store:
+                    data = token_data_store[query].copy()
+                    if modify(query, data):
+                        staged[query] = data
+            for query, data in staged.items():
+                token_data_store[query] = data
+                _shared_records.discard(query)
+                _index_token(query)
+            updated = list(staged)
+            _dirty_tokens.update(updated)
+            if updated:
+                _bump_version()
+        flush()
+    
+    if updated:
+        logger.info(f"Пакетно обновлено {len(updated)} токенов")
+    return len(updated)
 
 def prepare_excel_data(query: str, data: Dict[str, Any]) -> tuple:
     """
@@ -151,8 +572,8 @@ def prepare_excel_data(query: str, data: Dict[str, Any]) -> tuple:
     initial_data = {'query': query}
     current_data = {'query': query}
     
-    # Получаем все данные из API, если они есть
-    raw_api_data = data.get('raw_api_data', {})
+    # Получаем все данные из API, если они есть (загружаются из холодного хранилища)
+    raw_api_data = get_raw_api_data(data)
     if raw_api_data:
         # Сохраняем все данные из API в current_data
         for key, value in raw_api_data.items():
@@ -212,8 +633,16 @@ def prepare_excel_data(query: str, data: Dict[str, Any]) -> tuple:
     return initial_data, current_data
 
 def get_token_data(query: str) -> Optional[Dict[str, Any]]:
-    """Получает данные о токене из хранилища."""
-    data = token_data_store.get(query)
+    """
+    Получает данные о токене из хранилища.
+    Запись нельзя менять на месте - изменения сохраняются через функции хранилища.
+    """
+    if sqlite_engine is not None:
+        data = sqlite_engine.get(query)
+    else:
+        data = token_data_store.get(query)
+        if data is not None:
+            _shared_records.add(query)
     if data:
         logger.info(f"Данные о токене '{query}' получены из хранилища")
     else:
@@ -222,15 +651,26 @@ def get_token_data(query: str) -> Optional[Dict[str, Any]]:
 
 def update_token_field(query: str, field: str, value: Any) -> bool:
     """Обновляет значение поля в данных о токене."""
-    if query in token_data_store:
-        token_data_store[query][field] = value
+    if sqlite_engine is not None:
+        data = sqlite_engine.update_fields(query, {field: value})
+        if data is None:
+            logger.warning(f"Не удалось обновить поле '{field}' для токена '{query}': токен не найден")
+            return False
+        _bump_version()
+        logger.info(f"Поле '{field}' для токена '{query}' обновлено на значение '{value}'")
+        return True
+    
+    with _dirty_lock:
+        found = query in token_data_store
+        if found:
+            _writable(query)[field] = value
+            _index_token(query)
+            _bump_version()
+    
+    if found:
         logger.info(f"Поле '{field}' для токена '{query}' обновлено на значение '{value}'")
         
-        # Сохраняем обновленные данные в Excel
-        save_token_to_excel(query, token_data_store[query])
-        
-        # Также сохраняем обновленные данные в JSON
-        save_data_to_disk()
+        _mark_dirty(query)
         
         return True
     else:
@@ -239,42 +679,40 @@ def update_token_field(query: str, field: str, value: Any) -> bool:
 
 def remove_token_data(query: str) -> bool:
     """Удаляет данные о токене из хранилища."""
-    if query in token_data_store:
-        del token_data_store[query]
+    data = sqlite_engine.get(query) if sqlite_engine is not None else token_data_store.get(query)
+    if data is not None:
+        _archive_tokens({query: data}, 'deleted')
+    
+    if sqlite_engine is not None:
+        found = sqlite_engine.delete(query)
+        if found:
+            _bump_version()
+    else:
+        with _dirty_lock:
+            found = token_data_store.pop(query, None) is not None
+            _unindex_token(query)
+            if found:
+                _bump_version()
+    
+    if found:
+        token_history.drop(query)
         logger.info(f"Данные о токене '{query}' удалены из хранилища")
         
-        # Обновляем Excel
-        try:
-            if os.path.exists(EXCEL_DB_PATH):
-                df = pd.read_excel(EXCEL_DB_PATH)
-                if 'query' in df.columns and query in df['query'].values:
-                    df = df[df['query'] != query]
-                    df.to_excel(EXCEL_DB_PATH, index=False)
-                    logger.info(f"Данные о токене '{query}' удалены из Excel")
-        except Exception as e:
-            logger.error(f"Ошибка при удалении данных из Excel: {e}")
-        
-        # Сохраняем обновленные данные в JSON
-        save_data_to_disk()
+        _mark_dirty(query)
         
         return True
     else:
         logger.warning(f"Не удалось удалить данные о токене '{query}': токен не найден")
         return False
 
-def get_all_tokens(include_hidden: bool = True) -> Dict[str, Dict[str, Any]]:
+def get_all_tokens(include_hidden: bool = True) -> StoreView:
     """
-    Возвращает словарь со всеми отслеживаемыми токенами.
+    Возвращает неизменяемое представление со всеми отслеживаемыми токенами.
     
     Args:
         include_hidden: Если True, включает скрытые токены, иначе исключает их
     """
-    if include_hidden:
-        return token_data_store
-    else:
-        # Фильтруем скрытые токены
-        return {query: data for query, data in token_data_store.items() 
-                if not data.get('hidden', False)}
+    return get_snapshot(include_hidden)
 
 def get_active_tokens(include_hidden: bool = False) -> Dict[str, Dict[str, Any]]:
     """
@@ -284,36 +722,131 @@ def get_active_tokens(include_hidden: bool = False) -> Dict[str, Dict[str, Any]]
         include_hidden: Если True, включает скрытые токены, иначе исключает их
     """
     current_time = time.time()
-    active_tokens = {}
     
-    for query, data in token_data_store.items():
+    if sqlite_engine is not None:
+        # Выборка по индексу (hidden, added_time) вместо полного перебора
+        return sqlite_engine.added_since(current_time - TOKEN_RETENTION_PERIOD, include_hidden)
+    
+    return get_tokens_added_since(current_time - TOKEN_RETENTION_PERIOD, include_hidden)
+
+def get_tokens_added_since(since: float, include_hidden: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Возвращает токены, добавленные не раньше указанного времени.
+    Выборка идет по отсортированному индексу: O(log N + k) вместо перебора всех токенов.
+    """
+    if sqlite_engine is not None:
+        return sqlite_engine.added_since(since, include_hidden)
+    
+    result = {}
+    start = bisect_left(_time_index, (since,))
+    for _, query in _time_index[start:]:
+        data = token_data_store.get(query)
+        if data is None:
+            continue
         # Пропускаем скрытые токены, если указано их не включать
         if not include_hidden and data.get('hidden', False):
             continue
-            
-        added_time = data.get('added_time', 0)
-        if current_time - added_time <= TOKEN_RETENTION_PERIOD:
-            active_tokens[query] = data
+        result[query] = data
+    # Записи выданы читателю - изменения хранилища не должны менять их на месте
+    _shared_records.update(result)
+    return result
+
+def get_tokens_added_before(before: float) -> List[str]:
+    """Возвращает ключи токенов, добавленных раньше указанного времени (по индексу)."""
+    if sqlite_engine is not None:
+        return sqlite_engine.added_before(before)
     
-    return active_tokens
+    end = bisect_left(_time_index, (before,))
+    return [query for _, query in _time_index[:end]]
+
+def find_tokens_by_ticker(ticker: str) -> List[str]:
+    """Возвращает ключи токенов с указанным тикером (без учета регистра)."""
+    if sqlite_engine is not None:
+        return sqlite_engine.by_ticker(ticker)
+    return list(_ticker_index.get(ticker.lower(), ()))
+
+def find_tokens_by_address(address: str) -> List[str]:
+    """Возвращает ключи токенов с указанным адресом контракта."""
+    if sqlite_engine is not None:
+        return sqlite_engine.by_address(address)
+    return list(_address_index.get(address, ()))
+
+def resolve_token_query(value: str) -> Optional[str]:
+    """
+    Находит ключ токена в хранилище по ключу, адресу контракта или тикеру.
+    Возвращает None, если токен не найден.
+    """
+    if sqlite_engine is not None:
+        if sqlite_engine.contains(value):
+            return value
+    elif value in token_data_store:
+        return value
+    
+    for queries in (find_tokens_by_address(value), find_tokens_by_ticker(value)):
+        if queries:
+            # При дубликатах берем токен, добавленный последним
+            return max(queries, key=_query_added_time)
+    return None
+
+def _query_added_time(query: str) -> float:
+    """Возвращает время добавления токена для выбора среди дубликатов."""
+    if sqlite_engine is not None:
+        data = sqlite_engine.get(query) or {}
+        return float(data.get('added_time') or 0)
+    keys = _indexed_keys.get(query)
+    return keys[0] if keys else 0
+
+def record_market_cap(query: str, fdv: Any, volume: Any = None) -> None:
+    """
+    Добавляет замер маркет капа в историю, если токен отслеживается.
+    Разовые запросы без сохранения в хранилище историю не заводят: она удаляется
+    только вместе с токеном, и иначе копилась бы все время работы бота.
+    """
+    if sqlite_engine is not None:
+        tracked = sqlite_engine.contains(query)
+    else:
+        tracked = query in token_data_store
+    if tracked:
+        token_history.record_sample(query, fdv, volume)
+
+def get_chat_ids() -> List[int]:
+    """Возвращает уникальные chat_id всех токенов в хранилище."""
+    if sqlite_engine is not None:
+        return sqlite_engine.chat_ids()
+    
+    chat_ids = set()
+    for data in token_data_store.values():
+        chat_id = data.get('chat_id')
+        if chat_id:
+            chat_ids.add(chat_id)
+    return list(chat_ids)
 
 def update_token_ath(query: str, current_mcap: float) -> bool:
     """Обновляет ATH (All-Time High) маркет капа токена, если текущее значение выше."""
-    if query not in token_data_store:
-        return False
+    if sqlite_engine is not None:
+        data = sqlite_engine.get(query)
+        if not data or current_mcap <= data.get('ath_market_cap', 0):
+            return False
+        data = sqlite_engine.update_fields(query, {'ath_market_cap': current_mcap, 'ath_time': time.time()})
+        if data is None:
+            return False
+        _bump_version()
+        logger.info(f"Обновлен ATH для токена '{query}': {current_mcap}")
+        return True
     
-    current_ath = token_data_store[query].get('ath_market_cap', 0)
+    with _dirty_lock:
+        record = token_data_store.get(query)
+        updated = record is not None and current_mcap > record.get('ath_market_cap', 0)
+        if updated:
+            data = _writable(query)
+            data['ath_market_cap'] = current_mcap
+            data['ath_time'] = time.time()
+            _bump_version()
     
-    if current_mcap > current_ath:
-        token_data_store[query]['ath_market_cap'] = current_mcap
-        token_data_store[query]['ath_time'] = time.time()
+    if updated:
         logger.info(f"Обновлен ATH для токена '{query}': {current_mcap}")
         
-        # Сохраняем обновленные данные в Excel
-        save_token_to_excel(query, token_data_store[query])
-        
-        # Сохраняем обновленные данные в JSON
-        save_data_to_disk()
+        _mark_dirty(query)
         
         return True
     
@@ -337,130 +870,99 @@ def update_last_auto_check_time() -> None:
 
 def hide_token(query: str) -> bool:
     """Помечает токен как скрытый, чтобы он не отображался в списке, но сохранялся в базе данных."""
-    if query in token_data_store:
-        token_data_store[query]['hidden'] = True
-        
-        # Также обновляем статус в Excel, если файл существует
-        try:
-            if os.path.exists(EXCEL_DB_PATH):
-                df = pd.read_excel(EXCEL_DB_PATH)
-                if 'query' in df.columns and query in df['query'].values:
-                    # Обновляем статус для обеих строк
-                    token_indices = df.index[df['query'] == query].tolist()
-                    for idx in token_indices:
-                        df.at[idx, 'hidden'] = True
-                        df.at[idx, 'last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    df.to_excel(EXCEL_DB_PATH, index=False)
-                    logger.info(f"Токен '{query}' помечен как скрытый в Excel")
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении статуса скрытия в Excel: {e}")
-        
+    if sqlite_engine is not None:
+        found = sqlite_engine.update_fields(query, {'hidden': True}) is not None
+        if found:
+            _bump_version()
+    else:
+        with _dirty_lock:
+            found = query in token_data_store
+            if found:
+                _writable(query)['hidden'] = True
+                _bump_version()
+    
+    if found:
         # Обновляем статус в базе tracker
         try:
-            TRACKER_DB_FILE = 'tokens_tracker_database.json'
-            if os.path.exists(TRACKER_DB_FILE):
-                with open(TRACKER_DB_FILE, 'r', encoding='utf-8') as f:
-                    tracker_db = json.load(f)
-                
-                # Если токен существует в tracker_db, обновляем его статус
-                if query in tracker_db:
-                    tracker_db[query]['hidden'] = True
-                    with open(TRACKER_DB_FILE, 'w', encoding='utf-8') as f:
-                        json.dump(tracker_db, f, ensure_ascii=False, indent=4)
-                    logger.info(f"Токен '{query}' помечен как скрытый в tracker базе")
+            # Если токен существует в базе трекера, обновляем только его запись
+            if shared_store.get_store().update_fields(shared_store.NS_TRACKER, query, {'hidden': True}):
+                logger.info(f"Токен '{query}' помечен как скрытый в tracker базе")
         except Exception as e:
             logger.error(f"Ошибка при обновлении статуса в tracker базе: {e}")
         
-        # Сохраняем изменения в JSON
-        save_data_to_disk()
+        _mark_dirty(query)
         
         return True
     return False
 
 def unhide_token(query: str) -> bool:
     """Восстанавливает скрытый токен, чтобы он снова отображался в списке."""
-    if query in token_data_store:
-        token_data_store[query]['hidden'] = False
-        
-        # Также обновляем статус в Excel, если файл существует
-        try:
-            if os.path.exists(EXCEL_DB_PATH):
-                df = pd.read_excel(EXCEL_DB_PATH)
-                if 'query' in df.columns and query in df['query'].values:
-                    # Обновляем статус для обеих строк
-                    token_indices = df.index[df['query'] == query].tolist()
-                    for idx in token_indices:
-                        df.at[idx, 'hidden'] = False
-                        df.at[idx, 'last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    df.to_excel(EXCEL_DB_PATH, index=False)
-                    logger.info(f"Токен '{query}' восстановлен из скрытых в Excel")
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении статуса скрытия в Excel: {e}")
-        
+    if sqlite_engine is not None:
+        found = sqlite_engine.update_fields(query, {'hidden': False}) is not None
+        if found:
+            _bump_version()
+    else:
+        with _dirty_lock:
+            found = query in token_data_store
+            if found:
+                _writable(query)['hidden'] = False
+                _bump_version()
+    
+    if found:
         # Обновляем статус в базе tracker
         try:
-            TRACKER_DB_FILE = 'tokens_tracker_database.json'
-            if os.path.exists(TRACKER_DB_FILE):
-                with open(TRACKER_DB_FILE, 'r', encoding='utf-8') as f:
-                    tracker_db = json.load(f)
-                
-                # Если токен существует в tracker_db, обновляем его статус
-                if query in tracker_db:
-                    if 'hidden' in tracker_db[query]:
-                        tracker_db[query]['hidden'] = False
-                    with open(TRACKER_DB_FILE, 'w', encoding='utf-8') as f:
-                        json.dump(tracker_db, f, ensure_ascii=False, indent=4)
-                    logger.info(f"Токен '{query}' восстановлен из скрытых в tracker базе")
+            # Если токен существует в базе трекера, обновляем только его запись
+            if shared_store.get_store().update_fields(shared_store.NS_TRACKER, query, {'hidden': False}):
+                logger.info(f"Токен '{query}' восстановлен из скрытых в tracker базе")
         except Exception as e:
             logger.error(f"Ошибка при обновлении статуса в tracker базе: {e}")
         
-        # Сохраняем изменения в JSON
-        save_data_to_disk()
+        _mark_dirty(query)
         
         return True
     return False
 
 def get_hidden_tokens() -> Dict[str, Dict[str, Any]]:
     """Возвращает словарь со всеми скрытыми токенами."""
-    return {query: data for query, data in token_data_store.items() 
-            if data.get('hidden', False)}
+    if sqlite_engine is not None:
+        return sqlite_engine.hidden()
+    
+    with _dirty_lock:
+        result = {query: data for query, data in token_data_store.items() 
+                  if data.get('hidden', False)}
+        # Записи выдаются без копирования: перед изменением они будут скопированы
+        _shared_records.update(result)
+    return result
 
 def delete_token(query: str) -> bool:
     """Полностью удаляет токен из хранилища (вместо скрытия)."""
-    if query in token_data_store:
+    data = sqlite_engine.get(query) if sqlite_engine is not None else token_data_store.get(query)
+    if data is not None:
+        _archive_tokens({query: data}, 'deleted')
+    
+    if sqlite_engine is not None:
+        found = sqlite_engine.delete(query)
+        if found:
+            _bump_version()
+    else:
         # Удаляем токен из словаря
-        token_data = token_data_store.pop(query)
-        
-        # Также удаляем из Excel, если файл существует
-        try:
-            if os.path.exists(EXCEL_DB_PATH):
-                df = pd.read_excel(EXCEL_DB_PATH)
-                if 'query' in df.columns and query in df['query'].values:
-                    # Удаляем строки с данным токеном
-                    df = df[df['query'] != query]
-                    df.to_excel(EXCEL_DB_PATH, index=False)
-                    logger.info(f"Токен '{query}' полностью удален из Excel")
-        except Exception as e:
-            logger.error(f"Ошибка при удалении токена из Excel: {e}")
+        with _dirty_lock:
+            found = token_data_store.pop(query, None) is not None
+            _unindex_token(query)
+            if found:
+                _bump_version()
+    
+    if found:
+        token_history.drop(query)
         
         # Удаляем из tracker базы
         try:
-            TRACKER_DB_FILE = 'tokens_tracker_database.json'
-            if os.path.exists(TRACKER_DB_FILE):
-                with open(TRACKER_DB_FILE, 'r', encoding='utf-8') as f:
-                    tracker_db = json.load(f)
-                
-                # Если токен существует в tracker_db, удаляем его
-                if query in tracker_db:
-                    del tracker_db[query]
-                    with open(TRACKER_DB_FILE, 'w', encoding='utf-8') as f:
-                        json.dump(tracker_db, f, ensure_ascii=False, indent=4)
-                    logger.info(f"Токен '{query}' полностью удален из tracker базы")
+            if shared_store.get_store().delete(shared_store.NS_TRACKER, query):
+                logger.info(f"Токен '{query}' полностью удален из tracker базы")
         except Exception as e:
             logger.error(f"Ошибка при удалении токена из tracker базы: {e}")
         
-        # Сохраняем изменения в JSON
-        save_data_to_disk()
+        _mark_dirty(query)
         
         logger.info(f"Токен '{query}' полностью удален из хранилища")
         return True
@@ -471,38 +973,37 @@ def delete_all_tokens() -> int:
     Возвращает количество удаленных токенов."""
     
     global token_data_store
-    token_count = len(token_data_store)
+    if sqlite_engine is not None:
+        token_count = sqlite_engine.count()
+    else:
+        token_count = len(token_data_store)
     
     if token_count == 0:
         return 0
         
-    # Создаем резервную копию данных перед удалением
-    try:
-        # Резервная копия Excel
-        if os.path.exists(EXCEL_DB_PATH):
-            backup_path = f"{EXCEL_DB_PATH}.backup_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            import shutil
-            shutil.copy2(EXCEL_DB_PATH, backup_path)
-            logger.info(f"Создана резервная копия базы токенов: {backup_path}")
-            
-            # Создаем пустой Excel файл
-            df = pd.DataFrame()
-            df.to_excel(EXCEL_DB_PATH, index=False)
-        
-        # Резервная копия JSON
-        if os.path.exists(JSON_DB_PATH):
-            backup_path = f"{JSON_DB_PATH}.backup_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            import shutil
-            shutil.copy2(JSON_DB_PATH, backup_path)
-            logger.info(f"Создана резервная копия JSON базы токенов: {backup_path}")
-    except Exception as e:
-        logger.error(f"Ошибка при создании резервной копии данных: {e}")
+    # Перед удалением переносим все токены в архив
+    _archive_tokens(get_all_tokens(include_hidden=True), 'deleted_all')
     
-    # Очищаем словарь токенов
-    token_data_store = {}
+    # Очищаем хранилище токенов
+    if sqlite_engine is not None:
+        sqlite_engine.clear()
+        _bump_version()
+    else:
+        with _dirty_lock:
+            # Отложенные изменения после очистки не нужны
+            _dirty_tokens.clear()
+            token_data_store = {}
+            _bump_version()
+            _shared_records.clear()
+            _rebuild_indexes()
+            
+            # Записываем очистку в журнал и сразу сворачиваем его в пустой снапшот
+            journal.append_clear()
+        save_data_to_disk()
     
-    # Сохраняем пустой словарь в JSON
-    save_data_to_disk()
+    # Исходные ответы API и история маркет капа удаленных токенов больше не нужны
+    blob_store.prune(())
+    token_history.clear()
     
     logger.info(f"Все токены ({token_count} шт.) полностью удалены из хранилища")
     return token_count
@@ -518,20 +1019,41 @@ def get_list_message_id(chat_id: int) -> Optional[int]:
     return message_id
 
 def get_excel_all_tokens() -> str:
-    """Возвращает путь к Excel файлу со всеми токенами."""
-    # Обновляем Excel файл перед возвратом
+    """
+    Возвращает путь к Excel файлу со всеми токенами.
+    Файл собирается из хранилища только если данные изменились с прошлой сборки.
+    """
+    global excel_version
+    version = get_store_version()
+    
+    if version == excel_version and os.path.exists(EXCEL_DB_PATH):
+        logger.info("Excel файл актуален, повторная сборка не требуется")
+        return EXCEL_DB_PATH
+    
     try:
-        if not os.path.exists(EXCEL_DB_PATH):
-            # Создаем новый файл, если он не существует
-            df = pd.DataFrame()
-            df.to_excel(EXCEL_DB_PATH, index=False)
-        else:
-            # Проверяем, что файл не пустой
-            df = pd.read_excel(EXCEL_DB_PATH)
-            if df.empty and token_data_store:
-                # Если Excel пустой, но есть данные о токенах, заполняем его
-                for query, data in token_data_store.items():
-                    save_token_to_excel(query, data)
+        rows = []
+        for query, data in get_all_tokens().items():
+            initial_data, current_data = prepare_excel_data(query, data)
+            
+            # Даты создания и обновления берем из самих данных о токене
+            added_time = data.get('added_time')
+            last_update_time = data.get('last_update_time', added_time)
+            creation_date = datetime.fromtimestamp(added_time).strftime("%Y-%m-%d %H:%M:%S") if added_time else ''
+            last_update = datetime.fromtimestamp(last_update_time).strftime("%Y-%m-%d %H:%M:%S") if last_update_time else ''
+            
+            for row, data_type in ((initial_data, 'initial'), (current_data, 'current')):
+                row['creation_date'] = creation_date
+                row['last_update'] = last_update
+                row['data_type'] = data_type
+                row['hidden'] = data.get('hidden', False)
+                rows.append(row)
+        
+        # Пишем во временный файл и атомарно подменяем, чтобы не отдать недописанный файл
+        tmp_path = f"{EXCEL_DB_PATH}.tmp.xlsx"
+        pd.DataFrame(rows).to_excel(tmp_path, index=False)
+        os.replace(tmp_path, EXCEL_DB_PATH)
+        excel_version = version
+        logger.info(f"Excel файл собран: {len(rows) // 2} токенов")
     except Exception as e:
         logger.error(f"Ошибка при обновлении Excel файла: {e}")
     
@@ -543,29 +1065,32 @@ def clean_expired_tokens() -> List[str]:
     current_time = time.time()
     expired_tokens = []
     
-    for query, data in list(token_data_store.items()):
-        added_time = data.get('added_time', 0)
-        if current_time - added_time > TOKEN_RETENTION_PERIOD:
-            del token_data_store[query]
-            expired_tokens.append(query)
-            logger.info(f"Токен '{query}' удален из-за истечения срока хранения (24 часа)")
-            
-            # Обновляем статус в Excel
-            try:
-                if os.path.exists(EXCEL_DB_PATH):
-                    df = pd.read_excel(EXCEL_DB_PATH)
-                    if 'query' in df.columns and query in df['query'].values:
-                        # Обновляем статус для обеих строк
-                        token_indices = df.index[df['query'] == query].tolist()
-                        for idx in token_indices:
-                            df.at[idx, 'status'] = 'expired'
-                            df.at[idx, 'last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        df.to_excel(EXCEL_DB_PATH, index=False)
-            except Exception as e:
-                logger.error(f"Ошибка при обновлении статуса в Excel: {e}")
+    # Истекшие токены выбираются по индексу added_time
+    candidates = get_tokens_added_before(current_time - TOKEN_RETENTION_PERIOD)
+    if candidates:
+        if sqlite_engine is not None:
+            expired_data = sqlite_engine.get_many(candidates)
+        else:
+            expired_data = {query: token_data_store[query] for query in candidates if query in token_data_store}
+        _archive_tokens(expired_data, 'expired')
+    if sqlite_engine is not None:
+        sqlite_engine.delete_many(candidates)
+        if candidates:
+            _bump_version()
+    else:
+        with _dirty_lock:
+            for query in candidates:
+                token_data_store.pop(query, None)
+                _unindex_token(query)
+            if candidates:
+                _bump_version()
+    for query in candidates:
+        token_history.drop(query)
+        expired_tokens.append(query)
+        logger.info(f"Токен '{query}' удален из-за истечения срока хранения (24 часа)")
     
-    # Если были удалены токены, обновляем JSON
-    if expired_tokens:
-        save_data_to_disk()
+    # Удаления попадут в журнал при следующем сбросе
+    for query in expired_tokens:
+        _mark_dirty(query)
     
     return expired_tokens
\ No newline at end of file
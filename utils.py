@@ -233,38 +233,26 @@ def remove_specific_token(token_storage, token_query: str):
     Returns:
         dict: Информация об удаленном токене или None, если токен не найден
     """
-    # Сначала получаем все токены
-    all_tokens = token_storage.get_all_tokens()
-    
-    # Ищем точное совпадение по запросу/адресу
-    if token_query in all_tokens:
-        token_data = all_tokens[token_query]
-        token_storage.remove_token_data(token_query)
-        return {"query": token_query, "data": token_data}
-    
-    # Если точного совпадения нет, ищем по тикеру (нечувствительно к регистру)
-    for query, data in all_tokens.items():
-        ticker = ""
-        if 'token_info' in data and 'ticker' in data['token_info']:
-            ticker = data['token_info']['ticker']
-        
-        # Проверяем совпадение тикера (нечувствительно к регистру)
-        if ticker.lower() == token_query.lower():
-            token_data = all_tokens[query]
-            token_storage.remove_token_data(query)
-            return {"query": query, "data": token_data}
+    # Ищем по ключу, затем по адресу контракта и по тикеру (нечувствительно к регистру)
+    # через индексы хранилища, без перебора всех токенов
+    query = token_storage.resolve_token_query(token_query)
+    if query is not None:
+        token_data = token_storage.get_token_data(query)
+        token_storage.remove_token_data(query)
+        return {"query": query, "data": token_data}
     
     # Если токен не найден
     return None
 
-def format_tokens_list(tokens_data: Dict[str, Dict[str, Any]], page: int = 0, tokens_per_page: int = 10) -> tuple:
+# Подготовленный список токенов и ключ (версия хранилища, скрытые), для которого он построен
+tokens_list_cache_key = None
+tokens_list_cache = None
+
+def _prepare_tokens_list(tokens_data: Dict[str, Dict[str, Any]]) -> Optional[tuple]:
     """
-    Форматирует список токенов для отображения с процентами от ATH.
-    Возвращает кортеж (message, total_pages, current_page)
+    Готовит отсортированные данные токенов для списка.
+    Возвращает кортеж (hidden_info, token_info_list) или None при ошибке.
     """
-    if not tokens_data:
-        return ("Нет активных токенов в списке отслеживаемых.", 1, 0)
-    
     # Получаем количество скрытых токенов для информации
     hidden_info = ""
     try:
@@ -346,7 +334,32 @@ def format_tokens_list(tokens_data: Dict[str, Dict[str, Any]], page: int = 0, to
         logger.error(f"Ошибка при подготовке данных токенов: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
-        return ("Произошла ошибка при формировании списка токенов. Пожалуйста, попробуйте позже.", 1, 0)
+        return None
+    
+    return hidden_info, token_info_list
+
+def format_tokens_list(tokens_data: Dict[str, Dict[str, Any]], page: int = 0, tokens_per_page: int = 10) -> tuple:
+    """
+    Форматирует список токенов для отображения с процентами от ATH.
+    Возвращает кортеж (message, total_pages, current_page)
+    """
+    if not tokens_data:
+        return ("Нет активных токенов в списке отслеживаемых.", 1, 0)
+    
+    # Подготовленный список зависит только от содержимого хранилища, поэтому для
+    # представления хранилища (token_storage.StoreView) он кэшируется по его версии
+    global tokens_list_cache_key, tokens_list_cache
+    cache_key = getattr(tokens_data, 'cache_key', None)
+    if cache_key is not None and cache_key == tokens_list_cache_key:
+        hidden_info, token_info_list = tokens_list_cache
+    else:
+        prepared = _prepare_tokens_list(tokens_data)
+        if prepared is None:
+            return ("Произошла ошибка при формировании списка токенов. Пожалуйста, попробуйте позже.", 1, 0)
+        hidden_info, token_info_list = prepared
+        if cache_key is not None:
+            tokens_list_cache_key = cache_key
+            tokens_list_cache = prepared
     
     # Расчет количества страниц
     total_tokens = len(token_info_list)
@@ -369,21 +382,16 @@ def format_tokens_list(tokens_data: Dict[str, Dict[str, Any]], page: int = 0, to
     message = f"📋 *Список отслеживаемых токенов ({total_tokens} шт.){hidden_info}*\n"
     message += f"Страница {page + 1} из {total_pages}\n\n"
     
-    # Загрузим tracker_db для получения эмодзи токенов
+    # Эмодзи токенов берем из базы трекера только для токенов текущей страницы
     tracker_emojis = {}
     try:
-        import json
-        import os
+        import shared_store
         
-        # Загружаем JSON файл tracker_db для получения эмодзи
-        if os.path.exists('tokens_tracker_database.json'):
-            with open('tokens_tracker_database.json', 'r', encoding='utf-8') as f:
-                tracker_db = json.load(f)
-                
-            # Сохраняем эмодзи из tracker_db
-            for token_query, token_data in tracker_db.items():
-                if 'emojis' in token_data:
-                    tracker_emojis[token_query] = token_data['emojis']
+        page_queries = [token.get('query', '') for token in page_tokens]
+        tracker_records = shared_store.get_store().get_many(shared_store.NS_TRACKER, page_queries)
+        for token_query, token_data in tracker_records.items():
+            if 'emojis' in token_data:
+                tracker_emojis[token_query] = token_data['emojis']
     except Exception as e:
         logger.error(f"Ошибка при загрузке эмодзи из tracker_db: {str(e)}")
         import traceback